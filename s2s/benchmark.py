@@ -0,0 +1,444 @@
+import argparse
+import base64
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from connection import PeerConnection
+from log import LEVEL_ENV, configure_logging, get_logger
+from message import Message, MessageType
+from registry_client import RegistryClient
+from registry_cluster import ClusterRegistryClient, HashRing, launch_local_cluster, parse_member
+from registry_server import UDPRegistry
+from send_message import fan_out_message, send_to_node
+
+# Local benchmark: a UDPRegistry in this process, N nodes as separate
+# `main.py` processes on localhost, and a workload driven through
+# send_message. Results are printed as one JSON document. The 'registry'
+# workload instead loads a local registry cluster (registry_server.py
+# processes) with raw UDP clients at each --registry-instances size and
+# --registry-workers count.
+
+WORKLOADS = ('messages', 'burst', 'image', 'broadcast', 'registry')
+# Request mix of the registry workload: (command, share)
+REGISTRY_MIX = (('heartbeat', 0.6), ('get_changes', 0.3), ('register', 0.1))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+logger = get_logger('benchmark')
+
+def free_port(kind=socket.SOCK_STREAM):
+    sock = socket.socket(socket.AF_INET, kind)
+    try:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, int(round(fraction * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+def random_text(size):
+    # Incompressible printable content, so compression does not flatter MB/s
+    return base64.b64encode(os.urandom(size))[:size].decode('ascii')
+
+class Cluster:
+    """A registry plus ``num_nodes`` node processes on localhost"""
+
+    def __init__(self, num_nodes, node_log_level='WARNING', startup_timeout=30.0):
+        self.num_nodes = num_nodes
+        self.node_log_level = node_log_level
+        self.startup_timeout = startup_timeout
+        self.registry = None
+        self.registry_port = None
+        self.processes = []
+        self.workdir = None
+        self.nodes = {}
+
+    def start(self):
+        self.registry_port = free_port(socket.SOCK_DGRAM)
+        self.registry = UDPRegistry('127.0.0.1', self.registry_port)
+        threading.Thread(target=self.registry.start, daemon=True).start()
+        # Received images land in the node's working directory
+        self.workdir = tempfile.TemporaryDirectory(prefix='s2s-bench-')
+        env = dict(os.environ, REGISTRY_HOST='127.0.0.1', REGISTRY_PORT=str(self.registry_port))
+        env[LEVEL_ENV] = self.node_log_level
+        for index in range(self.num_nodes):
+            self.processes.append(subprocess.Popen(
+                [sys.executable, os.path.join(HERE, 'main.py'), f'bench{index}', '127.0.0.1', str(free_port())],
+                cwd=self.workdir.name, env=env, stdout=subprocess.DEVNULL
+            ))
+        return self.wait_ready()
+
+    def wait_ready(self):
+        client = RegistryClient('127.0.0.1', self.registry_port, timeout=1)
+        deadline = time.time() + self.startup_timeout
+        nodes = {}
+        try:
+            while time.time() < deadline:
+                try:
+                    nodes = client.get_nodes()
+                except OSError as e:
+                    logger.debug("Registry not answering yet: %s", e)  # Still starting up
+                    time.sleep(0.2)
+                    continue
+                if len(nodes) >= self.num_nodes:
+                    logger.info("%s nodes registered", len(nodes))
+                    self.nodes = nodes
+                    return nodes
+                time.sleep(0.2)
+        finally:
+            client.close()
+        raise TimeoutError(f"Only {len(nodes)}/{self.num_nodes} nodes registered "
+                           f"within {self.startup_timeout}s")
+
+    def stop(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self.registry:
+            self.registry.stop()
+        if self.workdir:
+            self.workdir.cleanup()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+class Recorder:
+    """Thread-safe per-operation latency and byte counts"""
+
+    def __init__(self):
+        self.latencies = []
+        self.messages = 0
+        self.bytes = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, ok, elapsed, num_bytes, messages=1):
+        with self._lock:
+            if ok:
+                self.latencies.append(elapsed)
+                self.messages += messages
+                self.bytes += num_bytes
+            else:
+                self.errors += 1
+
+    def record_totals(self, messages, num_bytes, errors=0):
+        with self._lock:
+            self.messages += messages
+            self.bytes += num_bytes
+            self.errors += errors
+
+    def summary(self, elapsed):
+        samples = sorted(latency * 1000 for latency in self.latencies)
+        return {
+            'messages': self.messages,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'elapsed_s': elapsed,
+            'messages_per_s': self.messages / elapsed if elapsed > 0 else 0.0,
+            'mb_per_s': self.bytes / elapsed / 1e6 if elapsed > 0 else 0.0,
+            'latency_ms': {
+                'samples': len(samples),
+                'mean': sum(samples) / len(samples) if samples else 0.0,
+                'p50': percentile(samples, 0.50),
+                'p99': percentile(samples, 0.99),
+                'max': samples[-1] if samples else 0.0
+            }
+        }
+
+def _targets(nodes):
+    return sorted(nodes.items())
+
+def run_messages(nodes, args, recorder):
+    """One connection per message: connect, handshake, send, wait for the ack"""
+    targets = _targets(nodes)
+
+    def send_one(index):
+        node_id, (ip, port) = targets[index % len(targets)]
+        message = Message(args.sender_id, MessageType.DIRECT, random_text(args.size), target_node=node_id)
+        size = len(message.to_json(seq=1))
+        start = time.time()
+        ok = send_to_node(args.sender_id, ip, port, message, retries=1, compression=args.compression)
+        recorder.record(ok, time.time() - start, size)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(send_one, range(args.count)))
+
+def run_burst(nodes, args, recorder):
+    """Pipelined messages over one PeerConnection per target; latency is the ack RTT"""
+    targets = _targets(nodes)[:args.concurrency]
+    per_target = [args.count // len(targets) + (i < args.count % len(targets)) for i in range(len(targets))]
+
+    def burst(target, count):
+        node_id, (ip, port) = target
+        # Only acknowledged messages count towards throughput
+        conn = PeerConnection(args.sender_id, ip, port, args.compression, args.batch_bytes,
+                              args.batch_delay, args.window,
+                              on_ack=lambda seq, rtt: recorder.record(True, rtt, 0, messages=0))
+        sizes = []
+        try:
+            with conn:
+                for _ in range(count):
+                    message = Message(args.sender_id, MessageType.DIRECT, random_text(args.size),
+                                      target_node=node_id)
+                    conn.send(message)
+                    sizes.append(len(message.to_json(seq=1)))
+        except OSError as e:
+            logger.error("Burst to %s failed: %s", node_id, e)
+        delivered = conn.delivered
+        recorder.record_totals(delivered, sum(sizes[:delivered]), count - delivered)
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        list(executor.map(burst, targets, per_target))
+
+def run_image(nodes, args, recorder):
+    """Send the image to targets round-robin, one connection per image"""
+    targets = _targets(nodes)
+    message = Message.create_image_message(args.sender_id, args.image)
+    size = len(message.to_json(seq=1))
+
+    def send_one(index):
+        _, (ip, port) = targets[index % len(targets)]
+        start = time.time()
+        ok = send_to_node(args.sender_id, ip, port, message, retries=1, compression=args.compression)
+        recorder.record(ok, time.time() - start, size)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(send_one, range(args.count)))
+
+def run_broadcast(nodes, args, recorder):
+    """Fan each message out to every node; latency is per delivery"""
+    targets = dict(nodes)
+    for _ in range(args.count):
+        message = Message(args.sender_id, MessageType.BROADCAST, random_text(args.size))
+        size = len(message.to_json(seq=1))
+        report = fan_out_message(args.sender_id, targets, message, args.concurrency,
+                                 compression=args.compression)
+        for result in report.values():
+            recorder.record(result['success'], result['elapsed'], size)
+
+RUNNERS = {
+    'messages': run_messages,
+    'burst': run_burst,
+    'image': run_image,
+    'broadcast': run_broadcast
+}
+
+def _registry_request(command, node_ids, rng, since, epoch):
+    node_id = rng.choice(node_ids)
+    if command == 'heartbeat':
+        return node_id, {'command': 'heartbeat', 'node_id': node_id}
+    if command == 'register':
+        return node_id, {'command': 'register', 'node_id': node_id, 'node_port': 20000 + node_ids.index(node_id)}
+    request = {'command': 'get_changes', 'since': since}
+    if epoch is not None:
+        request['epoch'] = epoch
+    return None, request
+
+def _registry_load_client(members, node_ids, start_at, duration, seed, results):
+    """One closed-loop client process: send, wait for the reply, repeat.
+
+    Node requests go to the shard's primary, as ClusterRegistryClient
+    sends them; membership reads go to one instance per client and ask for
+    the changes since the version its last read returned, as a
+    RegistryClient does.
+    """
+    rng = random.Random(seed)
+    ring = HashRing(members)
+    home = parse_member(members[seed % len(members)])
+    commands, weights = zip(*REGISTRY_MIX)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(1.0)
+    latencies, timeouts = [], 0
+    since, epoch = 0, None
+    time.sleep(max(0.0, start_at - time.time()))
+    end = start_at + duration
+    while time.time() < end:
+        node_id, request = _registry_request(rng.choices(commands, weights)[0], node_ids, rng, since, epoch)
+        address = parse_member(ring.primary(node_id)) if node_id else home
+        sent = time.time()
+        sock.sendto(json.dumps(request).encode(), address)
+        try:
+            data, _ = sock.recvfrom(65535)
+            latencies.append(time.time() - sent)
+        except socket.timeout:
+            timeouts += 1
+            continue
+        if node_id is None:
+            # A resync reply carries the current version too, standing in
+            # for the snapshot a real client would fetch
+            reply = json.loads(data)
+            since, epoch = reply.get('version', since), reply.get('epoch')
+    sock.close()
+    results.put((latencies, timeouts))
+
+def free_port_range(count):
+    """First of count consecutive ports free for both UDP and TCP"""
+    while True:
+        base = random.randint(20000, 60000 - count)
+        try:
+            for port in range(base, base + count):
+                for kind in (socket.SOCK_DGRAM, socket.SOCK_STREAM):
+                    with socket.socket(socket.AF_INET, kind) as sock:
+                        sock.bind(('127.0.0.1', port))
+            return base
+        except OSError:
+            continue
+
+def run_registry_load(args):
+    """Requests/s and latency of a local registry cluster at each instance and worker count"""
+    node_ids = [f'load{i:05d}' for i in range(args.registry_nodes)]
+    runs = []
+    for instances, workers in itertools.product(args.registry_instances, args.registry_workers):
+        env = dict(os.environ)
+        env[LEVEL_ENV] = args.node_log_level
+        members, registries = launch_local_cluster(instances, free_port_range(instances), env=env,
+                                                   workers=workers)
+        try:
+            # Retries ride out the instances' startup
+            client = ClusterRegistryClient(members, timeout=1, retries=10)
+            for index, node_id in enumerate(node_ids):
+                client.register_node(node_id, 20000 + index)
+            client.close()
+
+            results = multiprocessing.Queue()
+            start_at = time.time() + 0.5
+            clients = [
+                multiprocessing.Process(target=_registry_load_client,
+                                        args=(members, node_ids, start_at, args.duration, seed, results))
+                for seed in range(args.clients)
+            ]
+            for process in clients:
+                process.start()
+            latencies, timeouts = [], 0
+            for _ in clients:
+                client_latencies, client_timeouts = results.get()
+                latencies.extend(client_latencies)
+                timeouts += client_timeouts
+            for process in clients:
+                process.join()
+        finally:
+            for registry in registries:
+                registry.send_signal(signal.SIGINT)
+            for registry in registries:
+                try:
+                    registry.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    registry.kill()
+
+        samples = sorted(latency * 1000 for latency in latencies)
+        runs.append({
+            'instances': instances,
+            'workers': workers,
+            'requests': len(samples),
+            'timeouts': timeouts,
+            'requests_per_s': len(samples) / args.duration,
+            'latency_ms': {
+                'mean': sum(samples) / len(samples) if samples else 0.0,
+                'p50': percentile(samples, 0.50),
+                'p99': percentile(samples, 0.99),
+                'max': samples[-1] if samples else 0.0
+            }
+        })
+        logger.info("%s instance(s) x %s worker(s): %.0f requests/s",
+                    instances, workers, runs[-1]['requests_per_s'])
+
+    return {
+        'workload': 'registry',
+        'config': {
+            'clients': args.clients,
+            'duration': args.duration,
+            'registry_nodes': args.registry_nodes,
+            'mix': dict(REGISTRY_MIX)
+        },
+        'runs': runs
+    }
+
+def run_benchmark(args):
+    if args.workload == 'registry':
+        return run_registry_load(args)
+    with Cluster(args.nodes, args.node_log_level) as cluster:
+        nodes = cluster.nodes
+        runner = RUNNERS[args.workload]
+        if args.warmup:
+            warmup = argparse.Namespace(**dict(vars(args), count=args.warmup))
+            runner(nodes, warmup, Recorder())
+        recorder = Recorder()
+        start = time.time()
+        runner(nodes, args, recorder)
+        elapsed = time.time() - start
+
+    result = recorder.summary(elapsed)
+    result['config'] = {
+        key: getattr(args, key) for key in
+        ('workload', 'nodes', 'count', 'size', 'concurrency', 'compression',
+         'window', 'batch_bytes', 'batch_delay', 'warmup')
+    }
+    if args.workload == 'image':
+        result['config']['image'] = args.image
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the s2s transport on localhost')
+    parser.add_argument('--workload', choices=WORKLOADS, default='messages', help='Traffic pattern to drive')
+    parser.add_argument('--nodes', type=int, default=4, help='Number of node processes to start')
+    parser.add_argument('--count', type=int, default=1000, help='Messages (or images, or broadcasts) to send')
+    parser.add_argument('--size', type=int, default=256, help='Text message size in bytes')
+    parser.add_argument('--image', default=os.path.join(HERE, 'test.jpg'), help='Image for the image workload')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Concurrent senders (connections for burst, workers for broadcast)')
+    parser.add_argument('--compression', '-c', default='none', help="Frame codec: auto, none or a codec name")
+    parser.add_argument('--window', type=int, default=64, help='Unacked messages in flight (burst)')
+    parser.add_argument('--batch-bytes', type=int, default=16 * 1024, help='Coalescing threshold (burst)')
+    parser.add_argument('--batch-delay', type=float, default=0.005, help='Coalescing delay in seconds (burst)')
+    parser.add_argument('--warmup', type=int, default=50, help='Untimed operations before measuring')
+    parser.add_argument('--sender-id', default='bench', help='Sender ID used for the workload')
+    parser.add_argument('--output', '-o', help='Also write the JSON result to this file')
+    parser.add_argument('--log-level', default='WARNING', help='Log level for the harness')
+    parser.add_argument('--node-log-level', default='WARNING', help='Log level for the node (or registry) processes')
+    parser.add_argument('--registry-instances', default='1',
+                        help='Comma-separated registry cluster sizes to compare (registry)')
+    parser.add_argument('--registry-workers', default='1,2,4,8',
+                        help='Comma-separated processes per registry instance to compare (registry)')
+    parser.add_argument('--clients', type=int, default=8, help='Load-generating client processes (registry)')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds of load per cluster size (registry)')
+    parser.add_argument('--registry-nodes', type=int, default=1000, help='Nodes registered before the load (registry)')
+    args = parser.parse_args()
+    args.registry_instances = [int(n) for n in args.registry_instances.split(',')]
+    args.registry_workers = [int(n) for n in args.registry_workers.split(',')]
+    configure_logging(args.log_level)
+
+    if args.nodes < 1 or args.count < 1:
+        parser.error('--nodes and --count must be positive')
+
+    result = run_benchmark(args)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import io
+import os
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+# Optional codecs: used when installed, never required
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Wire IDs, stored in the first byte of each frame header (see framing.py)
+CODEC_IDS = {'none': 0, 'zlib': 1, 'zstd': 2, 'lz4': 3}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+MIN_COMPRESS_SIZE = 256  # Smaller payloads are not worth the CPU
+MAX_TRANSCODE_INPUT = 50 * 1024 * 1024  # Largest source image we decode for transcoding
+
+def available_codecs() -> List[str]:
+    """Codecs this process can decode, best first"""
+    codecs = []
+    if zstandard is not None:
+        codecs.append('zstd')
+    if lz4_frame is not None:
+        codecs.append('lz4')
+    codecs.append('zlib')
+    return codecs
+
+def negotiate_codec(preference: str, offered: Iterable[str]) -> str:
+    """Pick the codec to use given our preference and the peer's offer.
+
+    ``preference`` is 'auto', 'none' or a codec name; anything the peer
+    did not offer degrades to the best codec both sides support.
+    """
+    if preference == 'none':
+        return 'none'
+    shared = [codec for codec in available_codecs() if codec in set(offered)]
+    if preference in shared:
+        return preference
+    return shared[0] if shared else 'none'
+
+def compress(data: bytes, codec: str) -> Tuple[bytes, str]:
+    """Compress data, returning it unchanged when that does not pay off"""
+    if codec == 'none' or len(data) < MIN_COMPRESS_SIZE:
+        return data, 'none'
+    if codec == 'zstd':
+        packed = zstandard.ZstdCompressor(level=3).compress(data)
+    elif codec == 'lz4':
+        packed = lz4_frame.compress(data)
+    elif codec == 'zlib':
+        packed = zlib.compress(data, 6)
+    else:
+        raise ValueError(f"Unknown codec: {codec}")
+    if len(packed) >= len(data):
+        return data, 'none'
+    return packed, codec
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == 'none':
+        return data
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd frame received but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'lz4':
+        if lz4_frame is None:
+            raise RuntimeError("lz4 frame received but lz4 is not installed")
+        return lz4_frame.decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown codec: {codec}")
+
+IMAGE_CODECS = {'jpeg': ('JPEG', 'jpg'), 'webp': ('WEBP', 'webp')}
+
+def transcode_image(data: bytes, codec: str = 'jpeg', quality: int = 85,
+                    max_bytes: Optional[int] = None,
+                    max_dimension: Optional[int] = None) -> Tuple[bytes, str]:
+    """Re-encode an image, optionally downscaled, to fit a byte budget.
+
+    Lowers quality first (binary search down to 10), then shrinks the image
+    until the result fits ``max_bytes``. Returns (data, file extension).
+    """
+    if Image is None:
+        raise RuntimeError("Image transcoding requires Pillow (pip install pillow)")
+    if codec not in IMAGE_CODECS:
+        raise ValueError(f"Unsupported image codec: {codec}")
+    if not 1 <= quality <= 100:
+        raise ValueError(f"Image quality must be between 1 and 100, not {quality}")
+    if len(data) > MAX_TRANSCODE_INPUT:
+        raise ValueError(f"Image too large to transcode: {len(data)} bytes")
+    pil_format, extension = IMAGE_CODECS[codec]
+
+    image = Image.open(io.BytesIO(data))
+    image = image.convert('RGB')
+    if max_dimension:
+        image.thumbnail((max_dimension, max_dimension))
+
+    def encode(img, q):
+        out = io.BytesIO()
+        img.save(out, format=pil_format, quality=q)
+        return out.getvalue()
+
+    encoded = encode(image, quality)
+    if max_bytes is None or len(encoded) <= max_bytes:
+        return encoded, extension
+
+    while True:
+        low, high, best = 10, quality, None
+        while low <= high:
+            q = (low + high) // 2
+            candidate = encode(image, q)
+            if len(candidate) <= max_bytes:
+                best, low = candidate, q + 1
+            else:
+                high = q - 1
+        if best is not None:
+            return best, extension
+        if min(image.size) <= 16:
+            raise ValueError(f"Cannot fit image into {max_bytes} bytes")
+        image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)))
+
+def image_extension(filename: str, codec: Optional[str]) -> str:
+    """Filename with the extension matching a transcoded image codec"""
+    if codec not in IMAGE_CODECS:
+        return filename
+    return f"{os.path.splitext(filename)[0]}.{IMAGE_CODECS[codec][1]}"
@@ -0,0 +1,255 @@
+import socket
+import threading
+import time
+from compression import negotiate_codec
+from framing import (FLAG_ACK, FLAG_BATCH, decode_ack, encode_ack, encode_frame, hello_line,
+                     pack_batch, recv_codec_offer, recv_frame)
+from log import get_logger
+from metrics import METRICS
+
+logger = get_logger('connection')
+
+class AckTracker:
+    """Receiver-side record of which sequence numbers arrived on a connection"""
+
+    MAX_SELECTIVE = 64  # Out-of-order seqs reported per ack
+
+    def __init__(self):
+        self.cumulative = 0
+        self.selective = set()
+        self._dirty = False
+
+    def record(self, seq):
+        if seq is None or seq <= self.cumulative:
+            return
+        self.selective.add(seq)
+        while self.cumulative + 1 in self.selective:
+            self.cumulative += 1
+            self.selective.discard(self.cumulative)
+        self._dirty = True
+
+    def ack_frame(self):
+        """Return an ack frame if anything arrived since the last one"""
+        if not self._dirty:
+            return None
+        self._dirty = False
+        return encode_ack(self.cumulative, sorted(self.selective)[:self.MAX_SELECTIVE])
+
+class PeerConnection:
+    """Persistent connection to one node, with optional coalescing and acks.
+
+    With ``batch_bytes`` > 0, ``send`` only queues the message; queued
+    messages are written as a single batch frame once ``batch_bytes`` are
+    pending or the oldest one has waited ``batch_delay`` seconds.
+
+    With ``window`` > 0 every message carries a sequence number and the
+    receiver acks it; at most ``window`` messages are unacknowledged at a
+    time and ``delivered`` counts the acknowledged ones. Ack round trips go
+    to the ``ack_rtt`` histogram, and to ``on_ack(seq, rtt)`` when given.
+    """
+
+    def __init__(self, sender_id, target_ip, target_port, compression='auto',
+                 batch_bytes=0, batch_delay=0.005, window=0, timeout=10, on_ack=None):
+        self.sender_id = sender_id
+        self.target_ip = target_ip
+        self.target_port = target_port
+        self.compression = compression
+        self.batch_bytes = batch_bytes
+        self.batch_delay = batch_delay
+        self.window = window
+        self.timeout = timeout
+        self.codec = 'none'
+        self.sock = None
+        self.frames_sent = 0
+        self.messages_sent = 0
+        self.delivered = 0
+        self.on_ack = on_ack
+        self._pending = []
+        self._pending_bytes = 0
+        self._oldest_pending = None
+        self._send_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._flusher = None
+        self._closed = False
+        self._error = None
+        self._next_seq = 1
+        self._inflight = {}  # seq -> send time
+        self._ack_cond = threading.Condition()
+        self._ack_reader = None
+
+    def connect(self):
+        self.sock = socket.create_connection((self.target_ip, self.target_port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.sendall(hello_line(self.sender_id, acks=self.window > 0))
+        self._recv_buffer = bytearray()
+        offered = recv_codec_offer(self.sock, self._recv_buffer)
+        if offered is None:
+            # A receiver older than negotiation: plain frames, no batches, no acks
+            logger.info("%s:%s sent no codec offer; batching and acks off", self.target_ip, self.target_port)
+            self.batch_bytes = self.window = 0
+        self.codec = negotiate_codec(self.compression, offered or [])
+        logger.debug("Connected to %s:%s (codec %s, batching %s, window %s)",
+                     self.target_ip, self.target_port, self.codec,
+                     'on' if self.batch_bytes else 'off', self.window or 'off')
+        if self.batch_bytes:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+        if self.window:
+            self._ack_reader = threading.Thread(target=self._ack_loop, daemon=True)
+            self._ack_reader.start()
+        return self
+
+    def send(self, message):
+        """Send, or with batching enabled queue, one Message.
+
+        With a window, blocks while ``window`` messages are unacknowledged.
+        """
+        if self._error:
+            raise ConnectionError(f"Connection to {self.target_ip}:{self.target_port} failed: {self._error}")
+        seq = self._reserve_seq() if self.window else None
+        payload = message.to_json(seq).encode()
+        if not self.batch_bytes:
+            self._write(encode_frame(payload, self.codec), 1)
+            return seq
+        with self._cond:
+            if self._closed:
+                raise ConnectionError("Connection is closed")
+            self._pending.append(payload)
+            self._pending_bytes += len(payload)
+            if self._oldest_pending is None:
+                self._oldest_pending = time.time()
+            self._cond.notify()
+        return seq
+
+    def flush(self):
+        with self._cond:
+            payloads = self._take_pending()
+        if payloads:
+            self._write_batch(payloads)
+
+    def wait_for_acks(self, timeout=None):
+        """Block until every sent message is acked; False on timeout/error"""
+        deadline = time.time() + (self.timeout if timeout is None else timeout)
+        with self._ack_cond:
+            while self._inflight and not self._error:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._ack_cond.wait(remaining)
+            return not self._inflight
+
+    def unacked(self):
+        with self._ack_cond:
+            return sorted(self._inflight)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._flusher:
+            self._flusher.join(timeout=self.timeout)
+        if not self._error:
+            self.flush()
+            if self.window:
+                self.wait_for_acks()
+        if self.sock:
+            self.sock.close()
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _reserve_seq(self):
+        deadline = time.time() + self.timeout
+        with self._ack_cond:
+            while len(self._inflight) >= self.window:
+                if self._error:
+                    raise ConnectionError(f"Connection failed: {self._error}")
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"No ack from {self.target_ip}:{self.target_port} "
+                                       f"within {self.timeout}s")
+                self._ack_cond.wait(remaining)
+            seq = self._next_seq
+            self._next_seq += 1
+            self._inflight[seq] = time.time()
+            return seq
+
+    def _ack_loop(self):
+        while True:
+            try:
+                frame = recv_frame(self.sock, self._recv_buffer)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                frame = None
+                if not self._closed:
+                    self._error = e
+            if frame is None:
+                with self._ack_cond:
+                    if self._inflight and not self._error:
+                        self._error = ConnectionError("Connection closed with unacked messages")
+                    self._ack_cond.notify_all()
+                return
+            flags, body = frame
+            if not flags & FLAG_ACK:
+                continue
+            cumulative, selective = decode_ack(body)
+            now = time.time()
+            with self._ack_cond:
+                acked = [(seq, now - self._inflight.pop(seq))
+                         for seq in list(self._inflight) if seq <= cumulative or seq in selective]
+                self.delivered += len(acked)
+                self._ack_cond.notify_all()
+            for seq, rtt in acked:
+                METRICS.observe('ack_rtt', rtt * 1000)
+                if self.on_ack:
+                    self.on_ack(seq, rtt)
+
+    def _take_pending(self):
+        payloads = self._pending
+        self._pending = []
+        self._pending_bytes = 0
+        self._oldest_pending = None
+        return payloads
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._pending_bytes >= self.batch_bytes:
+                        break
+                    if self._oldest_pending is not None:
+                        wait = self._oldest_pending + self.batch_delay - time.time()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+                payloads = self._take_pending()
+            try:
+                self._write_batch(payloads)
+            except OSError as e:
+                self._error = e
+                logger.error("Batched send to %s:%s failed: %s", self.target_ip, self.target_port, e)
+                return
+
+    def _write_batch(self, payloads):
+        if len(payloads) == 1:
+            frame = encode_frame(payloads[0], self.codec)
+        else:
+            frame = encode_frame(pack_batch(payloads), self.codec, FLAG_BATCH)
+        self._write(frame, len(payloads))
+
+    def _write(self, frame, message_count):
+        with self._send_lock:
+            self.sock.sendall(frame)
+            self.frames_sent += 1
+            self.messages_sent += message_count
+        METRICS.incr('frames_sent')
+        METRICS.incr('messages_sent', message_count)
+        METRICS.incr('bytes_sent', len(frame))
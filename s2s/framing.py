@@ -0,0 +1,148 @@
+import json
+import socket
+from typing import Dict, List, Optional, Tuple
+from compression import CODEC_IDS, CODEC_NAMES, compress, decompress
+
+# Each frame is an 8-byte big-endian header followed by the body. The first
+# header byte holds flags (high nibble) and the codec ID (low nibble); the
+# remaining seven hold the body length, so plain frames are byte-identical
+# to the original length prefix.
+HEADER_SIZE = 8
+MAX_FRAME_LENGTH = (1 << 56) - 1
+CODEC_MASK = 0x0F
+FLAG_BATCH = 0x10  # Body is several length-prefixed messages, see pack_batch
+FLAG_ACK = 0x20    # Receiver -> sender acknowledgement, see encode_ack
+BATCH_ENTRY_HEADER = 4
+OFFER_TIMEOUT = 2.0  # Receivers that predate codec negotiation never send an offer
+
+def encode_frame(payload: bytes, codec: str = 'none', flags: int = 0) -> bytes:
+    """Return header + (possibly compressed) body, ready for one sendall"""
+    body, used_codec = compress(payload, codec)
+    if len(body) > MAX_FRAME_LENGTH:
+        raise ValueError("Frame too large")
+    header = bytes([flags | CODEC_IDS[used_codec]]) + len(body).to_bytes(HEADER_SIZE - 1, byteorder='big')
+    return header + body
+
+def decode_header(header: bytes) -> Tuple[str, int, int]:
+    """Return (codec, body length, flags) for a frame header"""
+    codec_id = header[0] & CODEC_MASK
+    if codec_id not in CODEC_NAMES:
+        raise ValueError(f"Unknown codec ID in frame header: {codec_id}")
+    return CODEC_NAMES[codec_id], int.from_bytes(header[1:], byteorder='big'), header[0] & ~CODEC_MASK
+
+def decode_body(codec: str, body: bytes) -> bytes:
+    return decompress(body, codec)
+
+def recv_frame(sock, buffer: bytearray):
+    """Read one frame, returning (flags, decoded body) or None on close"""
+    header = recv_exact(sock, buffer, HEADER_SIZE)
+    if header is None:
+        return None
+    codec, length, flags = decode_header(header)
+    body = recv_exact(sock, buffer, length)
+    if body is None:
+        return None
+    return flags, decode_body(codec, body)
+
+def encode_ack(cumulative: int, selective: List[int]) -> bytes:
+    """Ack frame: every seq <= cumulative plus the listed ones arrived"""
+    body = json.dumps({'ack': cumulative, 'sack': selective}).encode()
+    return encode_frame(body, 'none', FLAG_ACK)
+
+def decode_ack(body: bytes) -> Tuple[int, List[int]]:
+    data = json.loads(body.decode())
+    return data['ack'], data.get('sack', [])
+
+def pack_batch(payloads: List[bytes]) -> bytes:
+    """Coalesce several messages into one batch frame body"""
+    parts = []
+    for payload in payloads:
+        parts.append(len(payload).to_bytes(BATCH_ENTRY_HEADER, byteorder='big'))
+        parts.append(payload)
+    return b''.join(parts)
+
+def unpack_batch(body: bytes) -> List[bytes]:
+    payloads = []
+    view = memoryview(body)
+    offset = 0
+    while offset < len(view):
+        if offset + BATCH_ENTRY_HEADER > len(view):
+            raise ValueError("Truncated batch entry header")
+        length = int.from_bytes(view[offset:offset + BATCH_ENTRY_HEADER], byteorder='big')
+        offset += BATCH_ENTRY_HEADER
+        if offset + length > len(view):
+            raise ValueError("Truncated batch entry")
+        payloads.append(bytes(view[offset:offset + length]))
+        offset += length
+    return payloads
+
+def hello_line(sender_id: str, acks: bool = False) -> bytes:
+    """First line a sender writes: its ID plus optional key=value options"""
+    return f"{sender_id}{' acks=1' if acks else ''}\n".encode()
+
+def parse_hello(line: bytes) -> Tuple[str, Dict[str, str]]:
+    parts = line.decode().split()
+    if not parts:
+        return '', {}
+    options = dict(part.split('=', 1) for part in parts[1:] if '=' in part)
+    return parts[0], options
+
+def codec_offer(codecs) -> bytes:
+    """Handshake line a receiver sends back after the sender ID"""
+    return f"codecs={','.join(codecs)}\n".encode()
+
+def parse_codec_offer(line: bytes):
+    text = line.decode().strip()
+    if not text.startswith('codecs='):
+        return []
+    return [codec for codec in text[len('codecs='):].split(',') if codec]
+
+def recv_codec_offer(sock, buffer: bytearray, timeout: Optional[float] = None):
+    """Codecs the receiver offers, or None if it sent no offer within timeout.
+
+    No offer means a receiver that predates negotiation: it takes only
+    uncompressed frames and never acks.
+    """
+    timeout = OFFER_TIMEOUT if timeout is None else timeout
+    previous = sock.gettimeout()
+    sock.settimeout(timeout if previous is None else min(timeout, previous))
+    try:
+        line = recv_line(sock, buffer)
+    except socket.timeout:
+        return None
+    finally:
+        sock.settimeout(previous)
+    if line is None:
+        raise ConnectionError("Connection closed during handshake")
+    return parse_codec_offer(line)
+
+def recv_line(sock, buffer: bytearray, limit: int = 1024):
+    """Read one newline-terminated line, keeping any extra bytes in buffer.
+
+    Returns the line without the newline, or None if the peer closed first.
+    """
+    while b'\n' not in buffer:
+        if len(buffer) > limit:
+            raise ValueError("Handshake line too long")
+        chunk = sock.recv(1024)
+        if not chunk:
+            return None
+        buffer += chunk
+    line_end = buffer.index(b'\n')
+    line = bytes(buffer[:line_end])
+    del buffer[:line_end + 1]
+    return line
+
+def recv_exact(sock, buffer: bytearray, size: int):
+    """Return exactly size bytes, or None if the peer closed first.
+
+    Partial reads stay in buffer, so a socket timeout never loses data.
+    """
+    while len(buffer) < size:
+        chunk = sock.recv(max(8192, size - len(buffer)))
+        if not chunk:
+            return None
+        buffer += chunk
+    data = bytes(buffer[:size])
+    del buffer[:size]
+    return data
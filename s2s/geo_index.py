@@ -0,0 +1,174 @@
+import heapq
+import math
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+# Spatial index of node positions for the registry's nearest/within queries.
+# Positions are kept as ECEF coordinates (km, Earth-centred) in a uniform 3D
+# grid, so satellites at any altitude and ground stations share one index
+# and distances are straight-line, as for a line-of-sight link.
+
+EARTH_RADIUS = 6378.0  # km, as in s2s_routing
+CELL_KM = 500.0        # Grid cell edge
+
+Point = Tuple[float, float, float]
+
+def position_to_ecef(position: dict) -> Point:
+    """ECEF point for ``{'lat', 'lon'[, 'alt']}`` (degrees, km) or ``{'ecef': [x, y, z]}``"""
+    if 'ecef' in position:
+        x, y, z = (float(value) for value in position['ecef'])
+        return x, y, z
+    lat = math.radians(float(position['lat']))
+    lon = math.radians(float(position['lon']))
+    radius = EARTH_RADIUS + float(position.get('alt', 0.0))
+    return (radius * math.cos(lat) * math.cos(lon),
+            radius * math.cos(lat) * math.sin(lon),
+            radius * math.sin(lat))
+
+class GeoIndex:
+    """Grid index answering k-nearest and radius queries over node positions"""
+
+    def __init__(self, cell_km: float = CELL_KM):
+        self.cell_km = cell_km
+        self._positions: Dict[str, Point] = {}
+        self._cells: Dict[Tuple[int, int, int], Set[str]] = {}
+        # Per axis: occupied cells at each coordinate, and the (min, max) of
+        # those coordinates, kept current so nearest() need not scan the grid
+        self._occupied: List[Dict[int, int]] = [{}, {}, {}]
+        self._extent: List[Optional[Tuple[int, int]]] = [None, None, None]
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._positions
+
+    def _cell(self, point: Point) -> Tuple[int, int, int]:
+        return (int(math.floor(point[0] / self.cell_km)),
+                int(math.floor(point[1] / self.cell_km)),
+                int(math.floor(point[2] / self.cell_km)))
+
+    def update(self, node_id: str, point: Point):
+        old = self._positions.get(node_id)
+        self._positions[node_id] = point
+        cell = self._cell(point)
+        if old is not None:
+            old_cell = self._cell(old)
+            if old_cell == cell:
+                return
+            self._discard(node_id, old_cell)
+        members = self._cells.get(cell)
+        if members is None:
+            members = self._cells[cell] = set()
+            self._occupy(cell)
+        members.add(node_id)
+
+    def remove(self, node_id: str):
+        point = self._positions.pop(node_id, None)
+        if point is not None:
+            self._discard(node_id, self._cell(point))
+
+    def _discard(self, node_id: str, cell: Tuple[int, int, int]):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(node_id)
+            if not members:
+                del self._cells[cell]
+                self._vacate(cell)
+
+    def _occupy(self, cell: Tuple[int, int, int]):
+        for axis, coordinate in enumerate(cell):
+            counts = self._occupied[axis]
+            counts[coordinate] = counts.get(coordinate, 0) + 1
+            extent = self._extent[axis]
+            if extent is None:
+                self._extent[axis] = (coordinate, coordinate)
+            elif not extent[0] <= coordinate <= extent[1]:
+                self._extent[axis] = (min(extent[0], coordinate), max(extent[1], coordinate))
+
+    def _vacate(self, cell: Tuple[int, int, int]):
+        for axis, coordinate in enumerate(cell):
+            counts = self._occupied[axis]
+            counts[coordinate] -= 1
+            if counts[coordinate]:
+                continue
+            del counts[coordinate]
+            if not counts:
+                self._extent[axis] = None
+            elif coordinate in self._extent[axis]:
+                # Emptied a boundary plane: only the distinct coordinates are rescanned
+                self._extent[axis] = (min(counts), max(counts))
+
+    def position(self, node_id: str) -> Optional[Point]:
+        return self._positions.get(node_id)
+
+    def nearest(self, point: Point, k: int = 1,
+                max_km: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Up to ``k`` (node_id, distance) pairs closest to ``point``, nearest first.
+
+        Searches shells of cells outwards from the point's cell and stops
+        once no unvisited cell can hold anything closer than the k-th hit.
+        """
+        if k <= 0 or not self._positions:
+            return []
+        if max_km is not None:
+            return self.within(point, max_km)[:k]
+        centre = self._cell(point)
+        last_ring = max(abs(c - bound) for axis, c in enumerate(centre)
+                        for bound in self._bounds(axis))
+        found: List[Tuple[str, float]] = []
+        for ring in range(last_ring + 1):
+            if (2 * ring + 1) ** 3 > len(self._cells):
+                # Sparse grid: ranking every node beats walking empty cells
+                return heapq.nsmallest(k, ((node_id, _distance(point, other))
+                                           for node_id, other in self._positions.items()),
+                                       key=lambda hit: hit[1])
+            for cell in _shell(centre, ring):
+                for node_id in self._cells.get(cell, ()):
+                    found.append((node_id, _distance(point, self._positions[node_id])))
+            # Anything in ring + 1 or beyond is at least ring cells away
+            if len(found) >= k:
+                found.sort(key=lambda hit: hit[1])
+                if found[k - 1][1] <= ring * self.cell_km:
+                    break
+        found.sort(key=lambda hit: hit[1])
+        return found[:k]
+
+    def within(self, point: Point, radius_km: float) -> List[Tuple[str, float]]:
+        """(node_id, distance) pairs within ``radius_km`` of ``point``, nearest first"""
+        reach = int(math.ceil(radius_km / self.cell_km))
+        centre = self._cell(point)
+        if (2 * reach + 1) ** 3 > len(self._cells):
+            # Wider than the occupied grid: walking the occupied cells is cheaper
+            cells = [cell for cell in self._cells
+                     if all(abs(c - o) <= reach for c, o in zip(cell, centre))]
+        else:
+            cells = [cell for ring in range(reach + 1) for cell in _shell(centre, ring)]
+        hits = []
+        for cell in cells:
+            for node_id in self._cells.get(cell, ()):
+                distance = _distance(point, self._positions[node_id])
+                if distance <= radius_km:
+                    hits.append((node_id, distance))
+        hits.sort(key=lambda hit: hit[1])
+        return hits
+
+    def _bounds(self, axis: int) -> Tuple[int, int]:
+        return self._extent[axis]
+
+def _distance(a: Point, b: Point) -> float:
+    return math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2)
+
+def _shell(centre: Tuple[int, int, int], ring: int) -> Iterator[Tuple[int, int, int]]:
+    """Cells at Chebyshev distance exactly ``ring`` from ``centre``"""
+    cx, cy, cz = centre
+    if ring == 0:
+        yield centre
+        return
+    for dx in range(-ring, ring + 1):
+        for dy in range(-ring, ring + 1):
+            if abs(dx) == ring or abs(dy) == ring:
+                for dz in range(-ring, ring + 1):
+                    yield cx + dx, cy + dy, cz + dz
+            else:
+                yield cx + dx, cy + dy, cz - ring
+                yield cx + dx, cy + dy, cz + ring
@@ -0,0 +1,43 @@
+import itertools
+import logging
+import os
+import threading
+
+# Level comes from S2S_LOG_LEVEL (like REGISTRY_HOST/REGISTRY_PORT) and
+# defaults to INFO. Call sites pass %-style arguments, so a disabled level
+# costs one cached isEnabledFor check and no string formatting; anything
+# expensive to build is additionally guarded with isEnabledFor.
+LEVEL_ENV = 'S2S_LOG_LEVEL'
+LOG_FORMAT = '[%(levelname)s] %(message)s'
+
+def configure_logging(level=None):
+    """Set up console logging once per process"""
+    level = (level or os.getenv(LEVEL_ENV, 'INFO')).upper()
+    logging.basicConfig(format=LOG_FORMAT, level=getattr(logging, level, logging.INFO))
+
+def get_logger(name):
+    return logging.getLogger(f"s2s.{name}")
+
+class Sampler:
+    """Let one in every ``every`` events through, for per-chunk logging"""
+
+    def __init__(self, every=100):
+        self.every = max(1, every)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def hit(self):
+        with self._lock:
+            return next(self._counter) % self.every == 0
+
+def log_sampled(logger, sampler, level, msg, *args):
+    """Log ``msg`` at ``level`` only if enabled and the sampler lets it through"""
+    if logger.isEnabledFor(level) and sampler.hit():
+        logger.log(level, msg, *args)
+
+def preview(text, limit=200):
+    """Shorten large payloads (e.g. base64 images) for debug output"""
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text)} chars)"
@@ -2,17 +2,25 @@ import json
 import time
 import base64
 import os
+import uuid
 from enum import Enum
+from compression import MAX_TRANSCODE_INPUT, transcode_image
 
 class MessageType(Enum):
     DIRECT = "direct"
     BROADCAST = "broadcast"
     IMAGE = "image"
+    SWARM_ANNOUNCE = "swarm_announce"
+    SWARM_REQUEST = "swarm_request"
+    SWARM_CHUNK = "swarm_chunk"
+    STREAM_FRAME = "stream_frame"
+    OVERLAY_REPORT = "overlay_report"
 
 class Message:
     MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB limit for images
     
-    def __init__(self, sender_id, message_type, content, target_node=None, file_info=None):
+    def __init__(self, sender_id, message_type, content, target_node=None, file_info=None,
+                 message_id=None, overlay=None):
         self.sender_id = sender_id
         if isinstance(message_type, str):
             message_type = MessageType(message_type)
@@ -21,27 +29,58 @@ class Message:
         self.target_node = target_node
         self.timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
         self.file_info = file_info
+        # Stable across relays so receivers can drop duplicate copies
+        self.message_id = message_id or uuid.uuid4().hex
+        # Overlay broadcast routing info, see overlay.py
+        self.overlay = overlay
+        # Per-connection sequence number, set on received messages when the
+        # sender asked for acks (see connection.PeerConnection)
+        self.seq = None
 
     @classmethod
-    def create_image_message(cls, sender_id, image_path, target_node=None):
+    def create_image_message(cls, sender_id, image_path, target_node=None, image_codec=None,
+                             quality=85, max_bytes=None, max_dimension=None):
+        """Build an image message, optionally transcoded to save bandwidth.
+
+        When ``image_codec`` ('jpeg' or 'webp') is given the image is
+        re-encoded at ``quality``, downscaled to ``max_dimension`` and
+        squeezed under ``max_bytes``; ``file_info`` then records the codec
+        and the original size so the receiver can name the file correctly.
+        """
         # Check if file exists
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Image file not found: {image_path}")
             
-        # Check file size
+        # Check file size (transcoded images are checked again after re-encoding)
         file_size = os.path.getsize(image_path)
-        if file_size > cls.MAX_IMAGE_SIZE:
+        if file_size > cls.MAX_IMAGE_SIZE and image_codec is None:
             raise ValueError(f"Image size exceeds maximum limit of {cls.MAX_IMAGE_SIZE/1024/1024}MB")
+        if file_size > MAX_TRANSCODE_INPUT and image_codec is not None:
+            raise ValueError(f"Image size exceeds transcoding limit of {MAX_TRANSCODE_INPUT/1024/1024}MB")
             
-        # Read and encode image
         with open(image_path, 'rb') as f:
-            image_data = base64.b64encode(f.read()).decode('utf-8')
-            
+            raw_data = f.read()
+
         file_info = {
             'filename': os.path.basename(image_path),
             'size': file_size,
             'format': os.path.splitext(image_path)[1][1:].lower()
         }
+
+        if image_codec is not None:
+            raw_data, extension = transcode_image(raw_data, image_codec, quality, max_bytes, max_dimension)
+            if len(raw_data) > cls.MAX_IMAGE_SIZE:
+                raise ValueError(f"Image size exceeds maximum limit of {cls.MAX_IMAGE_SIZE/1024/1024}MB")
+            file_info.update({
+                'size': len(raw_data),
+                'format': extension,
+                'codec': image_codec,
+                'original_size': file_size,
+                'original_format': file_info['format']
+            })
+            
+        # Encode image
+        image_data = base64.b64encode(raw_data).decode('utf-8')
             
         return cls(
             sender_id=sender_id,
@@ -51,23 +90,32 @@ class Message:
             file_info=file_info
         )
 
-    def to_json(self):
-        return json.dumps({
+    def to_json(self, seq=None):
+        data = {
             "sender_id": self.sender_id,
             "message_type": self.message_type.value,
             "content": self.content,
             "target_node": self.target_node,
             "timestamp": self.timestamp,
-            "file_info": self.file_info
-        })
+            "file_info": self.file_info,
+            "message_id": self.message_id,
+            "overlay": self.overlay
+        }
+        if seq is not None:
+            data["seq"] = seq
+        return json.dumps(data)
 
     @staticmethod
     def from_json(json_str):
         data = json.loads(json_str)
-        return Message(
+        message = Message(
             sender_id=data["sender_id"],
             message_type=MessageType(data["message_type"]),
             content=data["content"],
             target_node=data.get("target_node"),
-            file_info=data.get("file_info")
-        )
\ No newline at end of file
+            file_info=data.get("file_info"),
+            message_id=data.get("message_id"),
+            overlay=data.get("overlay")
+        )
+        message.seq = data.get("seq")
+        return message
\ No newline at end of file
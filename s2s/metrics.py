@@ -0,0 +1,83 @@
+import bisect
+import json
+import signal
+import sys
+import threading
+import time
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open
+LATENCY_BUCKETS_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of samples"""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(0.5),
+            'p99': self.percentile(0.99),
+            'max': self.max
+        }
+
+class Metrics:
+    """In-process counters and latency histograms, dumped on demand"""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value_ms):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value_ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'uptime': time.time() - self.started,
+                'counters': dict(self.counters),
+                'latency_ms': {name: h.snapshot() for name, h in self.histograms.items()}
+            }
+
+    def dump(self, stream=None):
+        json.dump(self.snapshot(), stream or sys.stderr, indent=2, sort_keys=True)
+        (stream or sys.stderr).write('\n')
+
+METRICS = Metrics()
+
+def install_dump_handler():
+    """Dump METRICS to stderr on SIGUSR1 (where the platform has it)"""
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: METRICS.dump())
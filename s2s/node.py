@@ -3,9 +3,27 @@ import threading
 import time
 import os
 import base64
+import logging
+from collections import OrderedDict
+from compression import available_codecs, image_extension
+from connection import AckTracker
+from framing import (FLAG_BATCH, HEADER_SIZE, codec_offer, parse_hello, recv_frame, recv_line,
+                     unpack_batch)
+from log import get_logger, preview
 from message import Message, MessageType
+from metrics import METRICS
+from overlay import origin_address, relay_targets
+from send_message import relay_overlay, send_to_node
+from stream import KEYFRAME, STREAM_IDLE_TIMEOUT, StreamReceiver, save_frame
+from swarm import (MAX_UNANNOUNCED, RETENTION, REQUEST_TIMEOUT, TRANSFER_TIMEOUT, UNANNOUNCED_TIMEOUT,
+                   SwarmTransfer)
+
+logger = get_logger('node')
 
 class Node:
+    SEEN_CACHE_SIZE = 4096  # Broadcast message IDs remembered for deduplication
+    DELIVERED_CACHE_SIZE = 16384  # Acked message IDs remembered, so retries are not redelivered
+
     def __init__(self, node_id, host, port, max_connections=5):
         self.node_id = node_id
         self.host = host
@@ -15,6 +33,11 @@ class Node:
         self.is_running = False
         self.server_socket = None
         self._lock = threading.Lock()
+        self._seen_messages = OrderedDict()
+        self._delivered_messages = OrderedDict()
+        self._swarms = {}  # content_id -> SwarmTransfer
+        self._streams = {}  # (sender_id, stream_id) -> StreamReceiver
+        self._next_stream_sweep = 0.0
 
     def start(self):
         try:
@@ -25,36 +48,36 @@ class Node:
             self.is_running = True
             self.server_thread = threading.Thread(target=self.server_loop)
             self.server_thread.start()
-            print(f"[INFO] Node {self.node_id} started successfully on {self.host}:{self.port}")
+            logger.info("Node %s started successfully on %s:%s", self.node_id, self.host, self.port)
         except Exception as e:
-            print(f"[ERROR] Failed to start node {self.node_id}: {e}")
+            logger.error("Failed to start node %s: %s", self.node_id, e)
             raise
 
     def stop(self):
-        print(f"[INFO] Stopping node {self.node_id}...")
+        logger.info("Stopping node %s...", self.node_id)
         self.is_running = False
         
         if self.server_socket:
             try:
                 self.server_socket.close()
             except Exception as e:
-                print(f"[ERROR] Error closing server socket: {e}")
+                logger.error("Error closing server socket: %s", e)
 
         with self._lock:
             for node_id, conn in self.connections.items():
                 try:
                     conn.close()
-                    print(f"[INFO] Closed connection to node {node_id}")
+                    logger.info("Closed connection to node %s", node_id)
                 except Exception as e:
-                    print(f"[ERROR] Error closing connection to {node_id}: {e}")
+                    logger.error("Error closing connection to %s: %s", node_id, e)
             self.connections.clear()
 
         if hasattr(self, 'server_thread'):
             try:
                 self.server_thread.join(timeout=5)
-                print("[INFO] Server thread stopped successfully")
+                logger.info("Server thread stopped successfully")
             except Exception as e:
-                print(f"[ERROR] Error stopping server thread: {e}")
+                logger.error("Error stopping server thread: %s", e)
 
     def server_loop(self):
         while self.is_running:
@@ -69,109 +92,379 @@ class Node:
                     continue
                 except Exception as e:
                     if self.is_running:
-                        print(f"[ERROR] Error accepting connection: {e}")
+                        logger.error("Error accepting connection: %s", e)
             except Exception as e:
                 if self.is_running:
-                    print(f"[ERROR] Error in server loop: {e}")
+                    logger.error("Error in server loop: %s", e)
                 break
-        print("[INFO] Server loop ended")
+        logger.info("Server loop ended")
 
     def handle_connection(self, conn, addr):
         node_id = None
         try:
+            # Bytes read past the current field are kept here; the sender ID
+            # line and the first frame often arrive in the same segment
+            buffer = bytearray()
+
             # Receive sender ID with proper handling
-            sender_id_data = b""
-            while b'\n' not in sender_id_data:
-                chunk = conn.recv(1024)
-                if not chunk:
-                    return
-                sender_id_data += chunk
-            
-            node_id = sender_id_data.split(b'\n')[0].decode().strip()
+            line = recv_line(conn, buffer)
+            if line is None:
+                return
+            node_id, options = parse_hello(line)
+            # Senders that ask for acks get one whenever we drain our buffer
+            ack_tracker = AckTracker() if options.get('acks') == '1' else None
             if not node_id:
-                print("[WARNING] Received empty node ID, closing connection")
+                logger.warning("Received empty node ID, closing connection")
                 return
 
+            # Tell the sender which codecs it may compress frames with
+            conn.sendall(codec_offer(available_codecs()))
+
             with self._lock:
                 self.connections[node_id] = conn
-            print(f"[INFO] Connection established with {node_id} from {addr}")
+            logger.debug("Connection established with %s from %s", node_id, addr)
             
             while self.is_running:
                 try:
-                    # Read message length first (fixed header size)
-                    header = b""
-                    remaining = 8
-                    while remaining > 0:
-                        chunk = conn.recv(remaining)
-                        if not chunk:
-                            return
-                        header += chunk
-                        remaining -= len(chunk)
-                        
-                    message_length = int.from_bytes(header, byteorder='big')
-                    
-                    # Read the full message
-                    message_data = b""
-                    while len(message_data) < message_length:
-                        chunk_size = min(8192, message_length - len(message_data))
-                        chunk = conn.recv(chunk_size)
-                        if not chunk:
-                            return
-                        message_data += chunk
+                    frame = recv_frame(conn, buffer)
+                    if frame is None:
+                        return
+                    flags, body = frame
+                    METRICS.incr('frames_received')
+                    METRICS.incr('bytes_received', len(body))
                     
-                    # Process the message
-                    message = Message.from_json(message_data.decode())
-                    
-                    if message.message_type == MessageType.IMAGE:
-                        self._handle_image_message(message)
-                    else:
-                        self._handle_text_message(message)
+                    # Process the message(s); batch frames carry several
+                    payloads = unpack_batch(body) if flags & FLAG_BATCH else [body]
+                    for payload in payloads:
+                        message = Message.from_json(payload.decode())
+                        METRICS.incr('messages_received')
+                        # A sender whose ack got lost retries: deliver its
+                        # message once (broadcasts dedup themselves)
+                        if (ack_tracker is None or message.message_type == MessageType.BROADCAST or
+                                self._first_delivery(message.message_id)):
+                            self._dispatch_message(message)
+                        else:
+                            logger.debug("Dropping redelivered message %s", message.message_id)
+                            METRICS.incr('duplicates_dropped')
+                        if ack_tracker:
+                            ack_tracker.record(message.seq)
+
+                    # Ack once no further complete header is buffered, so
+                    # back-to-back frames share one ack
+                    if ack_tracker and len(buffer) < HEADER_SIZE:
+                        ack = ack_tracker.ack_frame()
+                        if ack:
+                            conn.sendall(ack)
                         
                 except socket.timeout:
                     continue
                 except Exception as e:
-                    print(f"[ERROR] Error receiving message from {node_id}: {e}")
+                    # stop() closes open connections under our feet
+                    if self.is_running:
+                        logger.error("Error receiving message from %s: %s", node_id, e)
+                        METRICS.incr('receive_errors')
                     break
         finally:
             if node_id:
                 with self._lock:
                     self.connections.pop(node_id, None)
             conn.close()
-            print(f"[INFO] Connection closed for {node_id if node_id else 'unknown node'}")
+            logger.debug("Connection closed for %s", node_id if node_id else 'unknown node')
+
+    def _dispatch_message(self, message):
+        if message.message_type == MessageType.BROADCAST:
+            first, targets, seen = self._record_broadcast(message)
+            if targets:
+                self._relay_broadcast(message, targets, seen)
+            if not first:
+                logger.debug("Dropping duplicate broadcast %s", message.message_id)
+                return
+
+        if message.message_type == MessageType.IMAGE:
+            self._handle_image_message(message)
+        elif message.message_type == MessageType.SWARM_ANNOUNCE:
+            self._handle_swarm_announce(message)
+        elif message.message_type == MessageType.SWARM_REQUEST:
+            self._handle_swarm_request(message)
+        elif message.message_type == MessageType.SWARM_CHUNK:
+            self._handle_swarm_chunk(message)
+        elif message.message_type == MessageType.STREAM_FRAME:
+            self._handle_stream_frame(message)
+        elif message.message_type == MessageType.OVERLAY_REPORT:
+            self._handle_overlay_report(message)
+        else:
+            self._handle_text_message(message)
+
+    def _first_delivery(self, message_id):
+        """Record a message_id, returning False if it was already delivered"""
+        with self._lock:
+            if message_id in self._delivered_messages:
+                self._delivered_messages.move_to_end(message_id)
+                return False
+            self._delivered_messages[message_id] = True
+            if len(self._delivered_messages) > self.DELIVERED_CACHE_SIZE:
+                self._delivered_messages.popitem(last=False)
+            return True
+
+    def _record_broadcast(self, message):
+        """Record a broadcast copy; returns (first copy?, peers to relay to, members seen).
+
+        Tree overlays relay the first copy only. Gossip relays again
+        whenever a copy names members this node had not seen yet.
+        """
+        overlay = message.overlay
+        gossip = bool(overlay) and overlay.get('mode') == 'gossip'
+        with self._lock:
+            seen = self._seen_messages.get(message.message_id)
+            first = seen is None
+            if first:
+                seen = self._seen_messages[message.message_id] = set()
+                if len(self._seen_messages) > self.SEEN_CACHE_SIZE:
+                    self._seen_messages.popitem(last=False)
+            else:
+                self._seen_messages.move_to_end(message.message_id)
+            if not overlay or not (first or gossip):
+                return first, {}, None
+            if not gossip:
+                targets = relay_targets(overlay, self.node_id)
+                return first, targets, set(targets)
+            news = set(overlay.get('seen') or ()) | {self.node_id}
+            if news <= seen:
+                return first, {}, None
+            seen |= news
+            targets = relay_targets(overlay, self.node_id, seen)
+            seen.update(targets)
+            return first, targets, set(seen)
+
+    def _relay_broadcast(self, message, targets, seen):
+        """Forward an overlay broadcast to this node's children/gossip peers"""
+        logger.debug("Relaying broadcast %s to %s", message.message_id, list(targets))
+        relay_thread = threading.Thread(
+            target=self._relay_worker, args=(message, targets, seen), daemon=True
+        )
+        relay_thread.start()
+
+    def _relay_worker(self, message, targets, seen):
+        _, undelivered = relay_overlay(self.node_id, message, targets, seen, max_workers=len(targets))
+        if not undelivered:
+            return
+        logger.warning("Relay of %s failed for %s", message.message_id, undelivered)
+        origin = message.overlay['members'][0][0]
+        address = origin_address(message.overlay)
+        if address is None or origin == self.node_id:
+            return
+        report = Message(
+            sender_id=self.node_id,
+            message_type=MessageType.OVERLAY_REPORT,
+            content="",
+            target_node=origin,
+            file_info={'message_id': message.message_id, 'undelivered': undelivered}
+        )
+        send_to_node(self.node_id, address[0], address[1], report, retries=1)
+
+    def _handle_overlay_report(self, message):
+        """A relay of one of our overlay broadcasts could not reach some members"""
+        info = message.file_info or {}
+        logger.warning("Broadcast %s: relay %s could not reach %s",
+                       info.get('message_id'), message.sender_id, info.get('undelivered'))
 
     def _handle_text_message(self, message):
         """Handle received text message"""
         msg_type = "broadcast" if message.message_type == MessageType.BROADCAST else "direct"
-        print(f"[INFO] Received {msg_type} message from {message.sender_id}")
-        print(f"[INFO] Content: {message.content}")
+        logger.debug("Received %s message from %s", msg_type, message.sender_id)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Content: %s", preview(message.content))
         
         # For broadcast messages, verify this node is not the sender before displaying
         if message.message_type == MessageType.BROADCAST and message.sender_id != self.node_id:
-            print(f"[INFO] Broadcast message from {message.sender_id}: {message.content}")
+            logger.info("Broadcast message from %s: %s", message.sender_id, message.content)
         # For direct messages, verify this node is the intended recipient
         elif message.message_type == MessageType.DIRECT and message.target_node == self.node_id:
-            print(f"[INFO] Direct message from {message.sender_id}: {message.content}")
+            logger.info("Direct message from %s: %s", message.sender_id, message.content)
 
     def _handle_image_message(self, message):
         """Handle received image message"""
         try:
             if not message.file_info:
-                print("[ERROR] Missing file information in image message")
+                logger.error("Missing file information in image message")
                 return
                 
-            # Create images directory if it doesn't exist
-            os.makedirs('received_images', exist_ok=True)
-            
-            # Generate unique filename
-            filename = f"received_images/{message.sender_id}_{int(time.time())}_{message.file_info['filename']}"
-            
-            # Decode and save image
+            # Decode and save image, named after the codec it was transcoded to
             image_data = base64.b64decode(message.content)
-            with open(filename, 'wb') as f:
-                f.write(image_data)
+            original_name = image_extension(message.file_info['filename'], message.file_info.get('codec'))
+            filename = self._save_image(message.sender_id, original_name, image_data)
                 
-            print(f"[INFO] Received image from {message.sender_id}, saved as {filename}")
-            print(f"[INFO] Image size: {message.file_info['size']/1024:.2f}KB")
+            logger.info("Received image from %s, saved as %s", message.sender_id, filename)
+            logger.info("Image size: %.2fKB", message.file_info['size']/1024)
+            if message.file_info.get('original_size'):
+                logger.info("Transcoded to %s from %.2fKB",
+                            message.file_info['codec'], message.file_info['original_size']/1024)
             
         except Exception as e:
-            print(f"[ERROR] Failed to handle image message: {e}")
\ No newline at end of file
+            logger.error("Failed to handle image message: %s", e)
+
+    def _save_image(self, sender_id, original_name, image_data):
+        # Create images directory if it doesn't exist
+        os.makedirs('received_images', exist_ok=True)
+        
+        # Generate unique filename
+        filename = f"received_images/{sender_id}_{int(time.time())}_{original_name}"
+        with open(filename, 'wb') as f:
+            f.write(image_data)
+        return filename
+
+    def _handle_stream_frame(self, message):
+        """Rebuild a streamed frame; keyframes refresh the saved snapshot"""
+        info = message.file_info or {}
+        key = (message.sender_id, info.get('stream_id'))
+        with self._lock:
+            self._expire_streams()
+            receiver = self._streams.get(key)
+            if receiver is None:
+                receiver = StreamReceiver(*key)
+                self._streams[key] = receiver
+                logger.info("Stream %s started by %s", key[1], message.sender_id)
+        try:
+            frame = receiver.receive(message)
+        except Exception as e:
+            logger.error("Failed to decode frame %s of stream %s: %s", info.get('seq'), key[1], e)
+            return
+
+        if info.get('kind') == KEYFRAME:
+            os.makedirs('received_streams', exist_ok=True)
+            path = save_frame(frame, f"received_streams/{message.sender_id}_{key[1]}_latest")
+            logger.info("Stream %s from %s: %s frames, %.1f fps, %.2fKB/frame, snapshot %s",
+                        key[1], message.sender_id, receiver.frames, receiver.fps(),
+                        receiver.bytes / receiver.frames / 1024, path)
+
+    def _expire_streams(self):
+        """Drop the decoder state of streams whose sender went quiet; call under _lock"""
+        now = time.time()
+        if now < self._next_stream_sweep:
+            return
+        self._next_stream_sweep = now + 1.0
+        for key, receiver in list(self._streams.items()):
+            if now - receiver.last_seen > STREAM_IDLE_TIMEOUT:
+                del self._streams[key]
+                logger.info("Stream %s from %s idle, dropped after %s frames", key[1], key[0], receiver.frames)
+
+    def _swarm_transfer(self, content_id):
+        with self._lock:
+            transfer = self._swarms.get(content_id)
+            if transfer is None:
+                transfer = SwarmTransfer(content_id)
+                self._swarms[content_id] = transfer
+            return transfer
+
+    def _handle_swarm_announce(self, message):
+        """Start pulling the chunks of an announced swarm image"""
+        info = message.file_info or {}
+        manifest = info.get('manifest')
+        if not manifest:
+            logger.error("Swarm announce without manifest")
+            return
+
+        transfer = self._swarm_transfer(manifest['content_id'])
+        members = {node_id: (ip, port) for node_id, ip, port in info.get('members', [])}
+        seeds = {int(index): holders for index, holders in info.get('seeds', {}).items()}
+        if not transfer.set_manifest(message.sender_id, manifest, members, seeds):
+            return  # Repeated announce; its fetch loop is already running
+        logger.info("Swarm image %s announced by %s: %s chunks, %.2fKB",
+                    manifest['filename'], message.sender_id, len(manifest['chunk_hashes']),
+                    manifest['size']/1024)
+
+        fetch_thread = threading.Thread(target=self._swarm_fetch_loop, args=(transfer,), daemon=True)
+        fetch_thread.start()
+
+    def _handle_swarm_request(self, message):
+        """Serve a chunk to a peer if we hold it"""
+        info = message.file_info or {}
+        with self._lock:
+            transfer = self._swarms.get(info.get('content_id'))
+        data = transfer.get_chunk(info.get('index')) if transfer else None
+        if data is None:
+            logger.debug("Cannot serve chunk %s to %s: not held", info.get('index'), message.sender_id)
+            return
+
+        reply = Message(
+            sender_id=self.node_id,
+            message_type=MessageType.SWARM_CHUNK,
+            content=base64.b64encode(data).decode('utf-8'),
+            target_node=message.sender_id,
+            file_info={'content_id': transfer.content_id, 'index': info['index']}
+        )
+        ip, port = info['reply_to']
+        threading.Thread(
+            target=send_to_node,
+            args=(self.node_id, ip, port, reply),
+            kwargs={'retries': 1, 'deadline': time.time() + REQUEST_TIMEOUT},
+            daemon=True
+        ).start()
+
+    def _handle_swarm_chunk(self, message):
+        info = message.file_info or {}
+        content_id = info.get('content_id')
+        with self._lock:
+            transfer = self._swarms.get(content_id)
+            if transfer is None:
+                # A seeded chunk can beat its announce; hold a few such
+                # transfers, and only until UNANNOUNCED_TIMEOUT
+                unannounced = sum(1 for other in self._swarms.values() if other.manifest is None)
+                if not isinstance(content_id, str) or unannounced >= MAX_UNANNOUNCED:
+                    logger.warning("Discarding chunk of unannounced content %s from %s",
+                                   content_id, message.sender_id)
+                    return
+                transfer = self._swarms[content_id] = SwarmTransfer(content_id)
+                timer = threading.Timer(UNANNOUNCED_TIMEOUT, self._drop_unannounced_swarm, args=(content_id,))
+                timer.daemon = True
+                timer.start()
+        if not transfer.add_chunk(info.get('index'), base64.b64decode(message.content)):
+            logger.warning("Discarding corrupt chunk %s from %s", info.get('index'), message.sender_id)
+
+    def _swarm_fetch_loop(self, transfer):
+        reply_to = list(transfer.members.get(self.node_id, (self.host, self.port)))
+        while self.is_running and not transfer.is_complete():
+            if time.time() - transfer.created > TRANSFER_TIMEOUT:
+                break
+            for index, holder in transfer.next_requests(self.node_id):
+                ip, port = transfer.members[holder]
+                request = Message(
+                    sender_id=self.node_id,
+                    message_type=MessageType.SWARM_REQUEST,
+                    content="",
+                    target_node=holder,
+                    file_info={'content_id': transfer.content_id, 'index': index, 'reply_to': reply_to}
+                )
+                threading.Thread(
+                    target=send_to_node,
+                    args=(self.node_id, ip, port, request),
+                    kwargs={'retries': 1, 'deadline': time.time() + REQUEST_TIMEOUT},
+                    daemon=True
+                ).start()
+            time.sleep(0.05)
+
+        if transfer.is_complete():
+            try:
+                filename = self._save_image(transfer.origin_id, transfer.manifest['filename'], transfer.assemble())
+                transfer.completed = True
+                logger.info("Received swarm image from %s, saved as %s", transfer.origin_id, filename)
+            except Exception as e:
+                logger.error("Failed to assemble swarm image %s: %s", transfer.content_id, e)
+        else:
+            logger.error("Swarm transfer %s incomplete: %s/%s chunks",
+                         transfer.content_id, len(transfer.chunks), len(transfer.manifest['chunk_hashes']))
+
+        # Keep serving our chunks for a while, then free them
+        timer = threading.Timer(RETENTION, self._drop_swarm, args=(transfer.content_id,))
+        timer.daemon = True
+        timer.start()
+
+    def _drop_swarm(self, content_id):
+        with self._lock:
+            self._swarms.pop(content_id, None)
+
+    def _drop_unannounced_swarm(self, content_id):
+        with self._lock:
+            transfer = self._swarms.get(content_id)
+            if transfer is not None and transfer.manifest is None:
+                del self._swarms[content_id]
@@ -0,0 +1,89 @@
+import random
+from typing import Collection, Dict, List, Optional, Set, Tuple
+
+# An overlay broadcast carries its own membership snapshot so relays never
+# have to ask the registry. ``members[0]`` is always the origin:
+#
+#   {"mode": "tree" | "gossip", "fanout": k, "members": [[id, ip, port], ...],
+#    "seen": [id, ...]}
+#
+# ``seen`` (gossip only) lists the members the copy's sender knows to have
+# been sent the message. A node merges the ``seen`` of every copy it gets
+# and pushes to ``fanout`` members outside it whenever it learns new IDs, so
+# gossip rounds continue until no node learns anything new, and by then
+# every member has been pushed to. A relay that cannot reach a peer stands
+# in for it: it sends to a failed tree child's children, or to fresh gossip
+# members.
+
+OVERLAY_MODES = ('tree', 'gossip')
+
+def build_overlay(origin_id: str, nodes: Dict[str, Tuple[str, int]], mode: str = 'tree',
+                  fanout: int = 3, origin_addr: Optional[Tuple[str, int]] = None) -> dict:
+    """Build the overlay header for a broadcast from ``origin_id`` to ``nodes``"""
+    if mode not in OVERLAY_MODES:
+        raise ValueError(f"Unknown overlay mode: {mode}")
+    if fanout < 1:
+        raise ValueError("Overlay fanout must be at least 1")
+
+    origin_ip, origin_port = origin_addr if origin_addr else (None, None)
+    others = [[node_id, ip, port] for node_id, (ip, port) in nodes.items() if node_id != origin_id]
+    # Shuffle so repeated broadcasts don't always load the same interior nodes
+    random.shuffle(others)
+    return {
+        'mode': mode,
+        'fanout': fanout,
+        'members': [[origin_id, origin_ip, origin_port]] + others
+    }
+
+def relay_targets(overlay: dict, node_id: str,
+                  seen: Optional[Collection[str]] = None) -> Dict[str, Tuple[str, int]]:
+    """Return the peers ``node_id`` must forward an overlay broadcast to.
+
+    Gossip skips the members in ``seen``, by default the overlay's own.
+    """
+    members: List[list] = overlay.get('members') or []
+    fanout = int(overlay.get('fanout', 3))
+    index = next((i for i, member in enumerate(members) if member[0] == node_id), None)
+    if index is None:
+        return {}
+
+    if overlay.get('mode') == 'gossip':
+        # Epidemic push to a random subset of the members not yet reached,
+        # never back to the origin
+        if seen is None:
+            seen = overlay.get('seen') or ()
+        seen = set(seen)
+        candidates = [m for i, m in enumerate(members) if i not in (0, index) and m[0] not in seen]
+        chosen = random.sample(candidates, min(fanout, len(candidates)))
+    else:
+        # Implicit k-ary spanning tree over the member list
+        first_child = index * fanout + 1
+        chosen = members[first_child:first_child + fanout]
+
+    return {member[0]: (member[1], member[2]) for member in chosen}
+
+def fallback_targets(overlay: dict, failed: Collection[str], seen: Set[str]) -> Dict[str, Tuple[str, int]]:
+    """Peers to send to in place of the ``failed`` ones.
+
+    A failed tree child is replaced by its own children, so one dead
+    interior node no longer cuts off its subtree. A failed gossip peer is
+    replaced by a random member outside ``seen``.
+    """
+    if not failed:
+        return {}
+    if overlay.get('mode') == 'gossip':
+        members: List[list] = overlay.get('members') or []
+        candidates = [m for m in members[1:] if m[0] not in seen]
+        chosen = random.sample(candidates, min(len(failed), len(candidates)))
+        return {member[0]: (member[1], member[2]) for member in chosen}
+    targets = {}
+    for node_id in failed:
+        targets.update(relay_targets(overlay, node_id))
+    return targets
+
+def origin_address(overlay: dict) -> Optional[Tuple[str, int]]:
+    """Where the origin of an overlay broadcast listens, if it is a node"""
+    members: List[list] = overlay.get('members') or []
+    if not members or members[0][1] is None:
+        return None
+    return members[0][1], members[0][2]
@@ -1,153 +1,669 @@
+import heapq
+import itertools
 import socket
 import json
 import threading
 import time
-from typing import Dict, Tuple, Optional
+from concurrent.futures import Future
+from typing import Dict, List, Tuple, Optional
+from log import get_logger
+from metrics import METRICS
+
+logger = get_logger('registry_client')
+
+RECV_BUFFER = 65535        # Largest UDP datagram we accept
+SNAPSHOT_TCP_PAGES = 4     # Fetch full snapshots over TCP beyond this many UDP pages
+HEARTBEAT_INTERVAL = 30    # Seconds between heartbeats
+HEARTBEAT_BATCH = 256      # Node IDs per heartbeat datagram
+RECEIVE_POLL = 0.1         # Longest the receiver sleeps before checking retransmits
+MAX_IN_FLIGHT = 64         # Outstanding requests per client; more block in submit()
+SOCKET_BUFFER = 1 << 20    # Receive buffer, so bursts of replies are not dropped
+
+class _PendingRequest:
+    __slots__ = ('payload', 'future', 'attempts', 'attempts_left', 'timeout', 'started')
+
+    def __init__(self, payload: bytes, future: Future, attempts: int, timeout: float):
+        self.payload = payload
+        self.future = future
+        self.attempts = self.attempts_left = attempts
+        self.timeout = timeout
+        self.started = time.time()
 
 class RegistryClient:
-    def __init__(self, registry_host: str, registry_port: int, timeout: int = 10):
+    """Client for one registry instance.
+
+    Requests carry an ID that the registry echoes, so any number of threads
+    can have requests in flight on the shared socket; a receiver thread
+    hands each reply to its request and retransmits unanswered ones.
+    """
+
+    def __init__(self, registry_host: str, registry_port: int, timeout: int = 10, retries: int = 5):
         self.registry_host = registry_host
         self.registry_port = registry_port
         self.timeout = timeout
+        self.retries = retries
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.settimeout(timeout)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+        self._window = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+        self._pending: Dict[int, _PendingRequest] = {}
+        self._due: List[Tuple[float, int]] = []  # Heap of (retransmit time, request ID)
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        self._receiver = None
+        self._closed = False
         self._heartbeat_thread = None
+        self._heartbeat_socket = None
         self._is_running = False
-        self._registered_node_id = None
-        print(f"[DEBUG] Initialized RegistryClient with host={registry_host}, port={registry_port}")
+        self._registered: Dict[str, int] = {}  # Local node IDs -> their ports, all heartbeated together
+        self._positions: Dict[str, dict] = {}  # Local node IDs -> last reported position
+        # Local membership view, kept current with get_changes deltas
+        self._nodes: Dict[str, Tuple[str, int]] = {}
+        self._version: Optional[int] = None
+        self._epoch: Optional[str] = None  # Registry incarnation _version belongs to
+        self._sync_lock = threading.Lock()
+        # Push subscription state; pushes arrive on their own socket
+        self._push_socket = None
+        self._push_thread = None
+        self._subscribed = False
+        self._lease = 60.0
+        self._lease_expires = 0.0
+        self._on_change = None
+        logger.debug("Initialized RegistryClient with host=%s, port=%s", registry_host, registry_port)
 
-    def register_node(self, node_id: str, node_port: int) -> bool:
+    def register_node(self, node_id: str, node_port: int, position: Optional[dict] = None) -> bool:
         request = {
             'command': 'register',
             'node_id': node_id,
             'node_port': node_port
         }
-        print(f"[DEBUG] Attempting to register node {node_id} on port {node_port}")
+        if position is not None:
+            request['position'] = self._positions[node_id] = position
+        logger.debug("Attempting to register node %s on port %s", node_id, node_port)
         response = self._send_request(request)
         if response and response.get('status') == 'success':
-            self._registered_node_id = node_id
-            print(f"[DEBUG] Node {node_id} registration successful")
+            self._registered[node_id] = node_port
+            logger.debug("Node %s registration successful", node_id)
             self._start_heartbeat()
             return True
-        print(f"[DEBUG] Node {node_id} registration failed")
+        logger.debug("Node %s registration failed", node_id)
         return False
 
+    def track_node(self, node_id: str, node_port: int, position: Optional[dict] = None):
+        """Heartbeat a node registered elsewhere (another holder of its shard)"""
+        self._registered[node_id] = node_port
+        if position is not None:
+            self._positions[node_id] = position
+        self._start_heartbeat()
+
+    def update_position(self, node_id: str, position: dict):
+        """Report a node's position, ``{'lat', 'lon'[, 'alt']}`` or ``{'ecef': [x, y, z]}``.
+
+        Later heartbeats carry it too; the update is sent right away as a
+        fire-and-forget heartbeat so moving nodes stay current between beats.
+        """
+        self._positions[node_id] = position
+        if node_id in self._registered and self._heartbeat_socket is not None:
+            try:
+                self._heartbeat_send({'command': 'heartbeat', 'node_ids': [node_id],
+                                      'positions': {node_id: position}, 'ack': False})
+            except OSError as e:
+                logger.debug("Position update for %s failed: %s", node_id, e)
+
+    def nearest_nodes(self, position: Optional[dict] = None, k: int = 1, max_km: Optional[float] = None,
+                      node_id: Optional[str] = None) -> List[Tuple[str, Tuple[str, int], float]]:
+        """Up to ``k`` (node_id, address, distance_km) nearest to ``position``, or to ``node_id``"""
+        request = {'command': 'nearest', 'k': k}
+        if max_km is not None:
+            request['max_km'] = max_km
+        return self._geo_query(request, position, node_id)
+
+    def nodes_within(self, radius_km: float, position: Optional[dict] = None,
+                     node_id: Optional[str] = None) -> List[Tuple[str, Tuple[str, int], float]]:
+        """(node_id, address, distance_km) within ``radius_km`` of ``position``, or of ``node_id``"""
+        return self._geo_query({'command': 'within', 'radius_km': radius_km}, position, node_id)
+
+    def _geo_query(self, request: dict, position: Optional[dict],
+                   node_id: Optional[str]) -> List[Tuple[str, Tuple[str, int], float]]:
+        if position is not None:
+            request['position'] = position
+        else:
+            request['node_id'] = node_id
+        response = self._send_request(request)
+        if not response or response.get('status') != 'success':
+            logger.debug("%s query failed: %s", request['command'], response and response.get('message'))
+            return []
+        return [(entry['node_id'], tuple(entry['address']), entry['distance_km'])
+                for entry in response.get('nodes', [])]
+
     def unregister_node(self, node_id: str) -> bool:
         request = {
             'command': 'unregister',
             'node_id': node_id
         }
-        print(f"[DEBUG] Attempting to unregister node {node_id}")
+        logger.debug("Attempting to unregister node %s", node_id)
         response = self._send_request(request)
         if response and response.get('status') == 'success':
-            self._stop_heartbeat()
-            print(f"[DEBUG] Node {node_id} unregistered successfully")
+            self._registered.pop(node_id, None)
+            self._positions.pop(node_id, None)
+            if not self._registered:
+                self._stop_heartbeat()
+            logger.debug("Node %s unregistered successfully", node_id)
             return True
         return False
 
     def get_nodes(self) -> Dict[str, Tuple[str, int]]:
-        request = {'command': 'get_nodes'}
-        print("[DEBUG] Requesting list of registered nodes")
-        response = self._send_request(request)
-        if response and response.get('status') == 'success':
-            nodes = response.get('nodes', {})
-            print(f"[DEBUG] Retrieved {len(nodes)} registered nodes")
-            return nodes
-        print("[DEBUG] Failed to retrieve nodes list")
-        return {}
-
-    def _send_request(self, request: dict, retries: int = 5) -> Optional[dict]:
-        last_exception = None
-        for attempt in range(retries):
+        nodes = self.sync_nodes()
+        return nodes if nodes is not None else {}
+
+    def sync_nodes(self) -> Optional[Dict[str, Tuple[str, int]]]:
+        """Return the current membership, or None if the registry is unreachable.
+
+        The first call fetches a full snapshot; later calls only fetch the
+        changes since the version already held, or a new snapshot if the
+        registry restarted as another epoch.
+        """
+        with self._sync_lock:
+            if self.is_live():
+                return dict(self._nodes)
+            if self._version is not None:
+                status = self._catch_up()
+                if status == 'success':
+                    return dict(self._nodes)
+                if status is None:
+                    logger.debug("Failed to retrieve membership changes")
+                    return None
+            logger.debug("Requesting list of registered nodes")
+            if self._fetch_snapshot():
+                logger.debug("Retrieved %s registered nodes (version %s)", len(self._nodes), self._version)
+                return dict(self._nodes)
+        logger.debug("Failed to retrieve nodes list")
+        return None
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._version
+
+    def is_live(self) -> bool:
+        """True while a push subscription keeps the local view current"""
+        return self._subscribed and time.time() < self._lease_expires
+
+    def subscribe(self, callback=None, lease: float = 60.0) -> bool:
+        """Keep the local view current from registry pushes.
+
+        ``callback(change)`` runs on the listener thread for every change
+        applied, and with None after a full resync. The lease is renewed
+        at half its length; a renewal that reveals a version we do not
+        hold triggers a catch-up.
+        """
+        if self._subscribed:
+            return True
+        if self._version is None:
+            self.sync_nodes()
+        if self._version is None:
+            return False  # Unreachable, or a registry without versioning
+        self._on_change = callback
+        self._lease = lease
+        self._push_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._push_socket.settimeout(1.0)
+        self._push_socket.bind(('', 0))
+        self._subscribed = True
+        self._push_thread = threading.Thread(target=self._push_loop, daemon=True)
+        self._push_thread.start()
+        return True
+
+    def unsubscribe(self):
+        if not self._subscribed:
+            return
+        self._subscribed = False
+        self._send_push_command({'command': 'unsubscribe'})
+        if self._push_thread:
+            self._push_thread.join(timeout=2)
+            self._push_thread = None
+        self._push_socket.close()
+        self._push_socket = None
+
+    def local_nodes(self) -> Dict[str, Tuple[str, int]]:
+        with self._sync_lock:
+            return dict(self._nodes)
+
+    def _send_push_command(self, request: dict):
+        try:
+            self._push_socket.sendto(json.dumps(request).encode(), (self.registry_host, self.registry_port))
+        except OSError as e:
+            logger.debug("Subscription request failed: %s", e)
+
+    def _push_loop(self):
+        renew_at = 0.0
+        while self._subscribed:
+            if time.time() >= renew_at:
+                self._send_push_command({'command': 'subscribe', 'lease': self._lease})
+                renew_at = time.time() + self._lease / 2
             try:
-                print(f"[DEBUG] Sending request to {self.registry_host}:{self.registry_port} (Attempt {attempt + 1}/{retries})")
-                print(f"[DEBUG] Request content: {request}")
-                
-                self.socket.sendto(
-                    json.dumps(request).encode(),
-                    (self.registry_host, self.registry_port)
-                )
-                
-                print(f"[DEBUG] Waiting for response...")
-                data, addr = self.socket.recvfrom(4096)
-                
-                print(f"[DEBUG] Received response from {addr}")
-                response = json.loads(data.decode())
-                print(f"[DEBUG] Response content: {response}")
-                
-                return response
-                
-            except socket.timeout as e:
-                last_exception = e
-                print(f"[DEBUG] Timeout on attempt {attempt + 1}: {e}")
-            except json.JSONDecodeError as e:
-                last_exception = e
-                print(f"[DEBUG] JSON decode error on attempt {attempt + 1}: {e}")
-            except Exception as e:
-                last_exception = e
-                print(f"[DEBUG] Unexpected error on attempt {attempt + 1}: {e}")
-                
-            if attempt < retries - 1:
-                wait_time = 2 * (attempt + 1)  # Exponential backoff
-                print(f"[DEBUG] Waiting {wait_time} seconds before retry...")
-                time.sleep(wait_time)
+                data, _ = self._push_socket.recvfrom(RECV_BUFFER)
+                message = json.loads(data.decode())
+            except socket.timeout:
+                continue
+            except (OSError, ValueError) as e:
+                if self._subscribed:
+                    logger.debug("Bad push from registry: %s", e)
+                continue
+
+            if message.get('type') == 'subscribed':
+                self._lease_expires = time.time() + message.get('lease', self._lease)
+                self._apply_push(message.get('epoch'), message['version'], None)
+            elif message.get('type') == 'membership':
+                METRICS.incr('pushes_received')
+                self._apply_push(message.get('epoch'), message['seq'], message['change'])
+
+    def _apply_push(self, epoch: Optional[str], seq: int, change: Optional[dict]):
+        """Apply change ``seq``, catching up first if earlier ones were missed"""
+        applied = []
+        with self._sync_lock:
+            same_epoch = epoch == self._epoch
+            if same_epoch and change is None and seq == self._version:
+                return  # Renewal, nothing missed
+            if same_epoch and change is not None and seq <= self._version:
+                return  # Duplicate, or already fetched by a catch-up
+            if same_epoch and change is not None and seq == self._version + 1:
+                self._apply_change(change)
+                self._version = seq
+                applied.append(change)
             else:
-                print(f"[ERROR] All {retries} attempts failed. Last error: {last_exception}")
-        
-        return None
+                # Gap, a renewal showing a newer version (missed pushes), or
+                # another epoch (registry restarted); get_changes sorts it out
+                METRICS.incr('push_resyncs')
+                status = self._catch_up(applied)
+                if status == 'resync' and self._fetch_snapshot():
+                    applied.append(None)
+        if self._on_change:
+            for applied_change in applied:
+                self._on_change(applied_change)
+
+    def get_changes(self, since: int, epoch: Optional[str] = None) -> Optional[dict]:
+        request = {'command': 'get_changes', 'since': since}
+        if epoch is not None:
+            request['epoch'] = epoch
+        return self._send_request(request)
+
+    def get_snapshot(self) -> Optional[dict]:
+        """Fetch the whole membership in one TCP request"""
+        try:
+            with socket.create_connection((self.registry_host, self.registry_port), timeout=self.timeout) as sock:
+                sock.sendall(json.dumps({'command': 'snapshot'}).encode() + b'\n')
+                with sock.makefile('rb') as reader:
+                    response = json.loads(reader.readline())
+        except (OSError, ValueError) as e:
+            logger.warning("TCP snapshot from %s:%s failed: %s", self.registry_host, self.registry_port, e)
+            return None
+        return response if response.get('status') == 'success' else None
+
+    def _fetch_snapshot(self) -> bool:
+        """Replace the local view with a full copy, paging over UDP or via TCP"""
+        response = self._send_request({'command': 'get_nodes'})
+        if not response or response.get('status') != 'success':
+            return False
+        nodes = _as_nodes(response.get('nodes', {}))
+        version, epoch = response.get('version'), response.get('epoch')
+        if version is None:
+            # Registry without versioning: the single reply is all there is
+            self._nodes, self._version, self._epoch = nodes, None, None
+            return True
+
+        cursor = response.get('next')
+        pages_left = (response.get('total', 0) - len(nodes)) / max(1, len(nodes))
+        if cursor is not None and pages_left > SNAPSHOT_TCP_PAGES:
+            snapshot = self.get_snapshot()
+            if snapshot:
+                self._nodes, self._version = _as_nodes(snapshot['nodes']), snapshot['version']
+                self._epoch = snapshot.get('epoch')
+                return True
+        while cursor is not None:
+            response = self._send_request({'command': 'get_nodes', 'after': cursor})
+            if not response or response.get('status') != 'success':
+                return False
+            if response.get('epoch') != epoch:
+                # Registry restarted mid-way: the pages so far belong to its last epoch
+                return self._fetch_snapshot()
+            nodes.update(_as_nodes(response.get('nodes', {})))
+            cursor = response.get('next')
+
+        # Pages were read at different versions; replaying the changes since
+        # the first page makes the view consistent
+        self._nodes, self._version, self._epoch = nodes, version, epoch
+        self._catch_up()
+        return True
+
+    def _catch_up(self, applied: Optional[list] = None) -> Optional[str]:
+        """Apply changes since our version, collecting them into ``applied``.
+
+        Returns 'success', 'resync' when the registry no longer has our
+        version in its changelog or is another epoch, or None if it did not
+        answer.
+        """
+        while True:
+            response = self.get_changes(self._version, self._epoch)
+            if not response:
+                return None
+            if response.get('status') != 'success' or response.get('epoch') != self._epoch:
+                return 'resync'
+            for change in response.get('changes', []):
+                self._apply_change(change)
+                if applied is not None:
+                    applied.append(change)
+            self._version = response['version']
+            if not response.get('more'):
+                return 'success'
+
+    def _apply_change(self, change: dict):
+        if change['op'] == 'join':
+            self._nodes[change['node_id']] = tuple(change['address'])
+        else:
+            self._nodes.pop(change['node_id'], None)
+
+    def submit(self, request: dict, retries: Optional[int] = None,
+               timeout: Optional[float] = None) -> Future:
+        """Send a request without waiting; the Future resolves to the reply.
+
+        The request is retransmitted with the same ID every ``timeout``
+        seconds (default: the client's) up to ``retries`` times in all (0
+        sends it once), and the Future resolves to None once the last
+        attempt times out. Up to MAX_IN_FLIGHT requests may be outstanding
+        at once.
+        """
+        retries = self.retries if retries is None else retries
+        timeout = self.timeout if timeout is None else timeout
+        future = Future()
+        self._window.acquire()
+        future.add_done_callback(lambda _: self._window.release())
+        with self._pending_lock:
+            if self._closed:
+                future.set_result(None)
+                return future
+            request_id = next(self._request_ids)
+            payload = json.dumps(dict(request, id=request_id)).encode()
+            self._pending[request_id] = _PendingRequest(payload, future, retries, timeout)
+            heapq.heappush(self._due, (time.time() + timeout, request_id))
+            if self._receiver is None:
+                self._receiver = threading.Thread(target=self._receive_loop, daemon=True)
+                self._receiver.start()
+        METRICS.incr('registry_requests')
+        logger.debug("Sending request %s to %s:%s: %s", request_id, self.registry_host, self.registry_port, request)
+        self._transmit(payload)
+        return future
+
+    def _send_request(self, request: dict, retries: Optional[int] = None,
+                      timeout: Optional[float] = None) -> Optional[dict]:
+        return self.submit(request, retries, timeout).result()
+
+    def _transmit(self, payload: bytes):
+        try:
+            self.socket.sendto(payload, (self.registry_host, self.registry_port))
+        except OSError as e:
+            # Treated like a lost datagram: the retransmit timer tries again
+            logger.debug("Send to registry failed: %s", e)
+
+    def _receive_loop(self):
+        """Hand replies to their requests by ID and retransmit overdue ones"""
+        while not self._closed:
+            self._retransmit_due()
+            with self._pending_lock:
+                wait = self._due[0][0] - time.time() if self._due else RECEIVE_POLL
+            try:
+                self.socket.settimeout(min(max(wait, 0.001), RECEIVE_POLL))
+                data, _ = self.socket.recvfrom(RECV_BUFFER)
+                response = json.loads(data.decode())
+            except socket.timeout:
+                continue
+            except ValueError as e:
+                logger.debug("Undecodable reply from registry: %s", e)
+                continue
+            except OSError:
+                break  # Closed
+            with self._pending_lock:
+                request_id = response.pop('id', None)
+                if request_id is None and self._pending:
+                    # Registry without request IDs: assume replies come in order
+                    request_id = min(self._pending)
+                pending = self._pending.pop(request_id, None)
+            if pending is None:
+                logger.debug("Dropping late or duplicate reply %s", request_id)
+                continue
+            METRICS.observe('registry_latency', (time.time() - pending.started) * 1000)
+            logger.debug("Response to request %s: %s", request_id, response)
+            pending.future.set_result(response)
+
+        with self._pending_lock:
+            abandoned, self._pending = self._pending, {}
+        for pending in abandoned.values():
+            pending.future.set_result(None)
+
+    def _retransmit_due(self):
+        now = time.time()
+        resend, failed = [], []
+        with self._pending_lock:
+            while self._due and self._due[0][0] <= now:
+                _, request_id = heapq.heappop(self._due)
+                pending = self._pending.get(request_id)
+                if pending is None:
+                    continue  # Already answered
+                METRICS.incr('registry_timeouts')
+                pending.attempts_left -= 1
+                if pending.attempts_left > 0:
+                    heapq.heappush(self._due, (now + pending.timeout, request_id))
+                    resend.append((request_id, pending))
+                else:
+                    del self._pending[request_id]
+                    failed.append(pending)
+        for request_id, pending in resend:
+            logger.debug("Timeout on request %s, %s attempt(s) left", request_id, pending.attempts_left)
+            self._transmit(pending.payload)
+        for pending in failed:
+            METRICS.incr('registry_failures')
+            logger.error("All %s attempts to reach registry %s:%s failed",
+                         pending.attempts, self.registry_host, self.registry_port)
+            pending.future.set_result(None)
 
     def _start_heartbeat(self):
-        if self._heartbeat_thread is None and self._registered_node_id:
-            print(f"[DEBUG] Starting heartbeat thread for node {self._registered_node_id}")
+        if self._heartbeat_thread is None and self._registered:
+            logger.debug("Starting heartbeat thread for %s node(s)", len(self._registered))
             self._is_running = True
+            self._heartbeat_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._heartbeat_socket.settimeout(1.0)
             self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop)
             self._heartbeat_thread.daemon = True
             self._heartbeat_thread.start()
 
     def _stop_heartbeat(self):
-        print("[DEBUG] Stopping heartbeat thread")
+        logger.debug("Stopping heartbeat thread")
         self._is_running = False
         if self._heartbeat_thread:
             self._heartbeat_thread.join(timeout=2)
             self._heartbeat_thread = None
-        print("[DEBUG] Heartbeat thread stopped")
+            self._heartbeat_socket.close()
+        logger.debug("Heartbeat thread stopped")
 
     def _heartbeat_loop(self):
-        while self._is_running and self._registered_node_id:
+        """Send fire-and-forget heartbeats for every registered node.
+
+        All local node IDs go out in batches of HEARTBEAT_BATCH per datagram
+        on a dedicated socket. The registry only answers to name IDs it does
+        not know (e.g. after it restarted); those are registered again.
+        """
+        while self._is_running and self._registered:
             try:
-                print(f"[DEBUG] Sending heartbeat for node {self._registered_node_id}")
-                request = {
-                    'command': 'heartbeat',
-                    'node_id': self._registered_node_id
-                }
-                response = self._send_request(request)
-                if response and response.get('status') == 'success':
-                    print("[DEBUG] Heartbeat successful")
-                else:
-                    print("[WARNING] Heartbeat failed")
-                    
-                # Wait for next heartbeat
-                for _ in range(30):  # 30 second interval split into 1-second checks
-                    if not self._is_running:
-                        return
-                    time.sleep(1)
-                    
+                node_ids = list(self._registered)
+                logger.debug("Sending heartbeat for %s node(s)", len(node_ids))
+                for i in range(0, len(node_ids), HEARTBEAT_BATCH):
+                    batch = node_ids[i:i + HEARTBEAT_BATCH]
+                    request = {'command': 'heartbeat', 'node_ids': batch, 'ack': False}
+                    positions = {}
+                    for node_id in batch:
+                        position = self._positions.get(node_id)
+                        if position is not None:
+                            positions[node_id] = position
+                    if positions:
+                        request['positions'] = positions
+                    self._heartbeat_send(request)
+
+                # Wait for the next heartbeat, handling notices meanwhile
+                next_beat = time.time() + HEARTBEAT_INTERVAL
+                while self._is_running and time.time() < next_beat:
+                    try:
+                        data, _ = self._heartbeat_socket.recvfrom(RECV_BUFFER)
+                        notice = json.loads(data.decode())
+                    except (socket.timeout, ValueError):
+                        continue
+                    if notice.get('type') == 'unknown_nodes':
+                        self._reregister(notice.get('node_ids', []))
+
             except Exception as e:
-                print(f"[ERROR] Heartbeat failed: {e}")
+                if not self._is_running:
+                    return
+                logger.error("Heartbeat failed: %s", e)
                 time.sleep(5)  # Wait a bit before retry if there's an error
 
+    def _heartbeat_send(self, request: dict):
+        self._heartbeat_socket.sendto(json.dumps(request).encode(), (self.registry_host, self.registry_port))
+
+    def _reregister(self, node_ids: List[str]):
+        for node_id in node_ids:
+            node_port = self._registered.get(node_id)
+            if node_port is None:
+                continue
+            logger.warning("Registry does not know node %s, registering it again", node_id)
+            METRICS.incr('reregistrations')
+            # The reply lands on the heartbeat socket and is ignored; a lost
+            # register just gets another unknown_nodes notice next beat
+            request = {'command': 'register', 'node_id': node_id, 'node_port': node_port}
+            if node_id in self._positions:
+                request['position'] = self._positions[node_id]
+            self._heartbeat_send(request)
+
     def close(self):
-        print("[DEBUG] Closing registry client")
+        logger.debug("Closing registry client")
+        self.unsubscribe()
         self._stop_heartbeat()
-        if self._registered_node_id:
-            self.unregister_node(self._registered_node_id)
+        for node_id in list(self._registered):
+            self.unregister_node(node_id)
+        with self._pending_lock:
+            self._closed = True
         self.socket.close()
-        print("[DEBUG] Registry client closed")
+        logger.debug("Registry client closed")
+
+class MembershipCache:
+    """Shared, thread-safe membership view that keeps the registry off the send path.
+
+    ``get`` answers from memory. Once the view is older than ``ttl`` it is
+    revalidated in the background with a version probe (a ``get_changes``
+    that is empty when nothing changed). Callers only wait for the registry
+    when there is no view yet, when it is older than ``max_stale``, or when
+    a node they need is missing. If the registry does not answer, the last
+    known membership is served.
+
+    With ``subscribe`` the client also takes registry pushes after the first
+    fetch, and while that subscription is live the pushed view is used
+    without any polling.
+    """
+
+    def __init__(self, client, ttl: float = 5.0, max_stale: float = 300.0, subscribe: bool = True):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.subscribe = subscribe
+        self.client = client  # RegistryClient or ClusterRegistryClient
+        self._nodes: Optional[Dict[str, Tuple[str, int]]] = None
+        self._fetched = 0.0
+        self._invalidated = False
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self, require: Optional[str] = None) -> Dict[str, Tuple[str, int]]:
+        """Return the membership, refreshing first if ``require`` is unknown"""
+        if self.client.is_live():
+            METRICS.incr('membership_cache_hits')
+            return self.client.local_nodes()
+        with self._lock:
+            nodes, age = self._nodes, time.time() - self._fetched
+            expired = age > self.ttl or self._invalidated
+            background = nodes is not None and expired and age <= self.max_stale and not self._refreshing
+            if background:
+                self._refreshing = True
+        if nodes is None or age > self.max_stale or (require is not None and require not in nodes):
+            return self.refresh()
+        if background:
+            threading.Thread(target=self._background_refresh, daemon=True).start()
+        METRICS.incr('membership_cache_hits')
+        return dict(nodes)
+
+    def refresh(self) -> Dict[str, Tuple[str, int]]:
+        """Revalidate now; on failure fall back to the last known membership"""
+        nodes = self.client.sync_nodes()
+        with self._lock:
+            if nodes is not None:
+                self._nodes, self._fetched = nodes, time.time()
+                self._invalidated = False
+        if nodes is not None:
+            if self.subscribe:
+                self.client.subscribe()
+            return dict(nodes)
+        with self._lock:
+            METRICS.incr('membership_stale_reads')
+            if self._nodes is None:
+                return {}
+            logger.warning("Registry unreachable, using membership from %.0fs ago",
+                           time.time() - self._fetched)
+            return dict(self._nodes)
+
+    def invalidate(self):
+        """Revalidate on the next ``get``, e.g. after a peer turned out to be gone"""
+        with self._lock:
+            self._invalidated = True
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def close(self):
+        self.client.close()
+
+_caches: Dict[Tuple[str, int], MembershipCache] = {}
+_caches_lock = threading.Lock()
+
+def get_membership_cache(registry_host: Optional[str] = None,
+                         registry_port: Optional[int] = None) -> MembershipCache:
+    """Process-wide MembershipCache for a registry (default: from the environment)"""
+    import os
+    cluster = os.getenv('REGISTRY_CLUSTER') if registry_host is None else None
+    if registry_host is None or registry_port is None:
+        registry_host, registry_port = get_registry_connection()
+    key = cluster or (registry_host, registry_port)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            client = (create_registry_client(timeout=2.0, retries=2) if cluster
+                      else RegistryClient(registry_host, registry_port, timeout=2.0, retries=2))
+            cache = _caches[key] = MembershipCache(client)
+        return cache
+
+def create_registry_client(timeout: float = 10, retries: int = 5):
+    """RegistryClient for $REGISTRY_HOST/$REGISTRY_PORT, or a cluster client if $REGISTRY_CLUSTER is set"""
+    import os
+    cluster = os.getenv('REGISTRY_CLUSTER')
+    if cluster:
+        from registry_cluster import ClusterRegistryClient, parse_members
+        return ClusterRegistryClient(parse_members(cluster), timeout, retries)
+    registry_host, registry_port = get_registry_connection()
+    return RegistryClient(registry_host, registry_port, timeout, retries)
+
+def _as_nodes(entries: dict) -> Dict[str, Tuple[str, int]]:
+    return {node_id: tuple(address) for node_id, address in entries.items()}
 
 def get_registry_connection():
     """Helper function to get registry connection parameters from environment"""
     import os
     host = os.getenv('REGISTRY_HOST', 'localhost')
     port = int(os.getenv('REGISTRY_PORT', '5000'))
-    print(f"[DEBUG] Registry connection parameters: host={host}, port={port}")
+    logger.debug("Registry connection parameters: host=%s, port=%s", host, port)
     return (host, port)
\ No newline at end of file
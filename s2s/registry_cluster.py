@@ -0,0 +1,244 @@
+import bisect
+import hashlib
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from log import configure_logging, get_logger
+from registry_client import RegistryClient
+
+# Registry cluster: node IDs are sharded over the registry instances by
+# consistent hashing, and each shard is held by REPLICAS instances (its
+# primary plus followers, the next distinct instances on the ring). The
+# ring is static; followers take over a shard's traffic while its primary
+# is down, but shards are not moved.
+
+CLUSTER_ENV = 'REGISTRY_CLUSTER'  # e.g. "10.0.0.1:5000,10.0.0.2:5000"
+REPLICAS = 2
+VIRTUAL_NODES = 64  # Ring points per instance, to even out shard sizes
+SUSPECT_PERIOD = 30.0  # Seconds an unresponsive instance is tried last
+
+logger = get_logger('registry_cluster')
+
+def _ring_hash(key: str) -> int:
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+def parse_member(member: str) -> Tuple[str, int]:
+    host, _, port = member.rpartition(':')
+    return host, int(port)
+
+def parse_members(text: str) -> List[str]:
+    return [member.strip() for member in text.split(',') if member.strip()]
+
+class HashRing:
+    """Consistent-hash ring over registry instances named "host:port" """
+
+    def __init__(self, members: List[str], vnodes: int = VIRTUAL_NODES):
+        if not members:
+            raise ValueError("A registry cluster needs at least one member")
+        self.members = sorted(set(members))
+        points = sorted((_ring_hash(f"{member}#{i}"), member)
+                        for member in self.members for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def holders(self, key: str, count: int = REPLICAS) -> List[str]:
+        """Primary first, then followers, for the shard holding ``key``"""
+        count = min(count, len(self.members))
+        index = bisect.bisect(self._hashes, _ring_hash(key))
+        holders = []
+        for step in range(len(self._owners)):
+            member = self._owners[(index + step) % len(self._owners)]
+            if member not in holders:
+                holders.append(member)
+                if len(holders) == count:
+                    break
+        return holders
+
+    def primary(self, key: str) -> str:
+        return self.holders(key, 1)[0]
+
+class ClusterRegistryClient:
+    """RegistryClient counterpart that routes by shard.
+
+    Registrations go to the shard's primary, falling back to its followers;
+    every holder of the shard also receives the node's heartbeats, so a
+    follower keeps expiring it if the primary goes away. Membership reads
+    take each shard from one replica, its primary unless that is suspect,
+    so a follower's stale copy of a node does not outlive the primary's
+    eviction. Each instance's view is kept current with its own deltas or
+    push subscription.
+    """
+
+    def __init__(self, members: List[str], timeout: float = 10, retries: int = 5, replicas: int = REPLICAS):
+        self.ring = HashRing(members)
+        self.replicas = replicas
+        self.clients: Dict[str, RegistryClient] = {
+            member: RegistryClient(*parse_member(member), timeout, retries) for member in self.ring.members
+        }
+        self._executor = ThreadPoolExecutor(max_workers=len(self.clients))
+        self._suspects: Dict[str, float] = {}  # member -> time it stops being suspect
+
+    def register_node(self, node_id: str, node_port: int, position: Optional[dict] = None) -> bool:
+        holders = self.ring.holders(node_id, self.replicas)
+        # Members that just failed us go last, so a dead primary costs one timeout
+        for member in sorted(holders, key=self._is_suspect):
+            if self.clients[member].register_node(node_id, node_port, position):
+                self._suspects.pop(member, None)
+                for other in holders:
+                    if other != member:
+                        self.clients[other].track_node(node_id, node_port, position)
+                return True
+            self._suspects[member] = time.time() + SUSPECT_PERIOD
+            logger.warning("Registry %s did not take node %s, trying its follower", member, node_id)
+        return False
+
+    def _is_suspect(self, member: str) -> bool:
+        return self._suspects.get(member, 0) > time.time()
+
+    def unregister_node(self, node_id: str) -> bool:
+        results = [self.clients[member].unregister_node(node_id)
+                   for member in self.ring.holders(node_id, self.replicas)]
+        return any(results)
+
+    def update_position(self, node_id: str, position: dict):
+        for member in self.ring.holders(node_id, self.replicas):
+            self.clients[member].update_position(node_id, position)
+
+    def nearest_nodes(self, position: Optional[dict] = None, k: int = 1, max_km: Optional[float] = None,
+                      node_id: Optional[str] = None) -> List[Tuple[str, Tuple[str, int], float]]:
+        """Each instance's nearest ``k``, merged"""
+        return self._merge(lambda client: client.nearest_nodes(position, k, max_km, node_id))[:k]
+
+    def nodes_within(self, radius_km: float, position: Optional[dict] = None,
+                     node_id: Optional[str] = None) -> List[Tuple[str, Tuple[str, int], float]]:
+        return self._merge(lambda client: client.nodes_within(radius_km, position, node_id))
+
+    def _merge(self, query) -> List[Tuple[str, Tuple[str, int], float]]:
+        """Run a geo query on every instance; replicas of a node count once"""
+        hits = {}
+        for answer in self._executor.map(lambda member: query(self.clients[member]), self._readable()):
+            for hit in answer:
+                hits.setdefault(hit[0], hit)
+        return sorted(hits.values(), key=lambda hit: hit[2])
+
+    def _readable(self) -> List[str]:
+        """Members to read from: all but the suspects, unless every one is suspect"""
+        members = [member for member in self.clients if not self._is_suspect(member)]
+        return members or list(self.clients)
+
+    def _reader(self, node_id: str, readers) -> Optional[str]:
+        """The replica a node's shard is read from: its first holder in ``readers``"""
+        for member in self.ring.holders(node_id, self.replicas):
+            if member in readers:
+                return member
+        return None
+
+    def _by_shard(self, views: Dict[str, Dict[str, Tuple[str, int]]],
+                  readers) -> Dict[str, Tuple[str, int]]:
+        """Merge instance views, taking each node only from its shard's reader.
+
+        Shards none of ``readers`` holds come from whichever other view
+        has them, i.e. what we last heard from an unreachable holder.
+        """
+        nodes = {}
+        for member, view in views.items():
+            for node_id, address in view.items():
+                reader = self._reader(node_id, readers)
+                if reader == member or (reader is None and node_id not in nodes):
+                    nodes[node_id] = address
+        return nodes
+
+    def get_nodes(self) -> Dict[str, Tuple[str, int]]:
+        nodes = self.sync_nodes()
+        return nodes if nodes is not None else {}
+
+    def sync_nodes(self) -> Optional[Dict[str, Tuple[str, int]]]:
+        """Membership with each shard read from one replica; None if none answered.
+
+        Every instance is the primary of some shards, so all non-suspect
+        instances are asked, but a node is only taken from the first
+        holder of its shard that answered. Suspect instances are not asked,
+        so a dead one costs a timeout once per SUSPECT_PERIOD rather than
+        on every read.
+        """
+        queried = self._readable()
+        views = dict(zip(queried, self._executor.map(lambda member: self.clients[member].sync_nodes(), queried)))
+        for member, view in views.items():
+            if view is None:
+                self._suspects[member] = time.time() + SUSPECT_PERIOD
+            else:
+                self._suspects.pop(member, None)
+        reachable = {member for member, view in views.items() if view is not None}
+        if not reachable:
+            return None
+        for member in self.clients:
+            if views.get(member) is None:
+                views[member] = self.clients[member].local_nodes()
+        return self._by_shard(views, reachable)
+
+    def local_nodes(self) -> Dict[str, Tuple[str, int]]:
+        views = {member: client.local_nodes() for member, client in self.clients.items()}
+        return self._by_shard(views, set(self._readable()))
+
+    def is_live(self) -> bool:
+        return all(client.is_live() for client in self.clients.values())
+
+    def subscribe(self, callback=None, lease: float = 60.0) -> bool:
+        results = [client.subscribe(callback, lease) for client in self.clients.values()]
+        return any(results)
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+        self._executor.shutdown(wait=False)
+
+def launch_local_cluster(instances: int, base_port: int, host: str = '127.0.0.1',
+                         env: Optional[Dict[str, str]] = None,
+                         workers: int = 1) -> Tuple[List[str], List[subprocess.Popen]]:
+    """Start ``instances`` registry_server.py processes on consecutive ports"""
+    members = [f"{host}:{base_port + i}" for i in range(instances)]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'registry_server.py')
+    processes = [
+        subprocess.Popen([sys.executable, script, '--host', host, '--port', str(base_port + i),
+                          '--cluster', ','.join(members), '--advertise', members[i],
+                          '--workers', str(workers)], env=env)
+        for i in range(instances)
+    ]
+    return members, processes
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Run a local sharded registry cluster')
+    parser.add_argument('--instances', type=int, default=3, help='Registry processes to start')
+    parser.add_argument('--base-port', type=int, default=5000, help='Port of the first instance')
+    parser.add_argument('--host', default='127.0.0.1', help='Host to bind to')
+    parser.add_argument('--workers', type=int, default=1, help='Processes serving each instance\'s port')
+    parser.add_argument('--log-level', default=None, help='DEBUG, INFO, WARNING or ERROR (default: $S2S_LOG_LEVEL or INFO)')
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    members, processes = launch_local_cluster(args.instances, args.base_port, args.host, workers=args.workers)
+    logger.info("Registry cluster running; point nodes at it with:")
+    logger.info("  export %s=%s", CLUSTER_ENV, ','.join(members))
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("Shutting down registry cluster...")
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+        for process in processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+if __name__ == '__main__':
+    main()
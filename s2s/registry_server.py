@@ -1,100 +1,319 @@
+import bisect
+import heapq
+import os
+import queue
+import random
+import shutil
 import socket
 import json
+import subprocess
+import sys
+import tempfile
 import threading
 import time
-from typing import Dict, Tuple
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+from log import configure_logging, get_logger
+from metrics import METRICS, install_dump_handler
+from registry_client import RegistryClient
+from geo_index import GeoIndex, position_to_ecef
+from registry_cluster import REPLICAS, HashRing, parse_member, parse_members
+from registry_store import MembershipStore
+
+logger = get_logger('registry_server')
+
+RECV_BUFFER = 65535      # Largest UDP datagram we accept
+PAGE_BYTES = 8 * 1024    # Node entries per get_nodes/get_changes response are capped to this
+CHANGELOG_SIZE = 4096    # Membership changes kept for delta queries
+MAX_LEASE = 300          # Longest subscription lease, in seconds
+HEARTBEAT_TIMEOUT = 90   # Seconds of silence before a node is evicted
+EXPIRY_POLL = 1.0        # Longest the expiry thread sleeps between checks
+REPLICATION_BATCH = 100  # Changes per replicate request
+RESTORE_JITTER = 30.0    # Spread over which restored nodes' first deadlines fall
+MAX_GEO_RESULTS = 100    # Nodes per nearest/within response
 
 class UDPRegistry:
-    def __init__(self, host: str = '0.0.0.0', port: int = 5000):
+    """Node registry over UDP, with versioned membership.
+
+    Every join/leave/expire bumps ``version`` and is kept in a bounded
+    changelog, so clients page through ``get_nodes`` once and then ask
+    ``get_changes`` for what happened since their version. Full snapshots
+    are also served over TCP on the same port, for lists too large to page
+    through comfortably.
+
+    Clients may also ``subscribe`` for a lease; every change is then pushed
+    to them as it happens, with its version as the sequence number so a
+    missed push shows up as a gap.
+
+    In a cluster (``cluster`` lists every instance as "host:port", this one
+    as ``advertise``) each change is also replicated to the other holders
+    of the node's shard; see registry_cluster.
+
+    With ``data_dir`` membership survives restarts: changes go to a
+    write-ahead log, a snapshot is taken every ``snapshot_interval``
+    seconds, and both are replayed on start before serving.
+
+    Nodes may report a position with register and heartbeat requests; the
+    ``nearest`` and ``within`` commands answer from a spatial index of
+    them. Positions are soft state: they are neither logged nor
+    replicated, and come back with the next heartbeat.
+
+    With ``workers`` > 1 the port is shared (SO_REUSEPORT) with that many
+    less one registry_worker processes. They follow membership through the
+    store (a temporary one without ``data_dir``), answer reads and
+    heartbeats themselves and forward everything else to this process.
+    """
+
+    def __init__(self, host: str = '0.0.0.0', port: int = 5000,
+                 cluster: Optional[List[str]] = None, advertise: Optional[str] = None,
+                 data_dir: Optional[str] = None, snapshot_interval: float = 60.0,
+                 workers: int = 1):
         self.host = host
         self.port = port
+        self.workers = workers
+        self._temp_dir = None
+        if workers > 1 and not data_dir:
+            data_dir = self._temp_dir = tempfile.mkdtemp(prefix='registry-')
+        self.store = MembershipStore(data_dir) if data_dir else None
+        self._internal = None  # Socket workers forward requests to
+        self._worker_processes: List[subprocess.Popen] = []
+        self._request = threading.local()  # Request being answered by this thread
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_version = 0
+        self.ring = HashRing(cluster) if cluster else None
+        self.advertise = advertise or f"{host}:{port}"
+        self._replication_queue = queue.Queue()
+        self._peers: Dict[str, RegistryClient] = {}
         self.nodes: Dict[str, Tuple[str, int]] = {}
+        self.geo = GeoIndex()
         self.lock = threading.Lock()
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.is_running = False
         self.last_heartbeat = {}  # Store last heartbeat time for each node
-        print(f"[DEBUG] Registry initialized with host={host}, port={port}")
+        self._deadlines: List[Tuple[float, str]] = []  # Heap of (expiry check time, node_id)
+        self._armed: Dict[str, float] = {}  # node_id -> its live entry in _deadlines
+        self.version = 0
+        self.epoch = uuid.uuid4().hex[:16]  # Incarnation the versions belong to
+        self.changelog = deque(maxlen=CHANGELOG_SIZE)
+        self._sorted_ids: List[str] = []
+        self._sorted_version = -1
+        self.subscribers: Dict[Tuple[str, int], float] = {}  # address -> lease expiry
+        self._push_queue = queue.Queue()
+        self._writers: List[threading.Thread] = []  # Threads that record membership changes
+        logger.debug("Registry initialized with host=%s, port=%s", host, port)
 
     def start(self):
         try:
+            if self.store:
+                self._restore()
+            if self.workers > 1:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             self.socket.bind((self.host, self.port))
+            self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.tcp_socket.bind((self.host, self.port))
+            self.tcp_socket.listen(16)
             self.is_running = True
-            print(f"[INFO] UDP Registry server started on {self.host}:{self.port}")
-            print("[DEBUG] Server socket bound successfully")
+            logger.info("UDP Registry server started on %s:%s", self.host, self.port)
+            logger.debug("Server socket bound successfully")
+            self._writers.append(threading.current_thread())
             self._start_heartbeat_checker()
-            self._handle_requests()
+            threading.Thread(target=self._serve_snapshots, daemon=True).start()
+            threading.Thread(target=self._push_loop, daemon=True).start()
+            if self.ring:
+                threading.Thread(target=self._replication_loop, daemon=True).start()
+            if self.store:
+                threading.Thread(target=self._snapshot_loop, daemon=True).start()
+            if self.workers > 1:
+                self._start_workers()
+            self._handle_requests(self.socket)
         except Exception as e:
-            print(f"[ERROR] Failed to start UDP registry server: {e}")
+            logger.error("Failed to start UDP registry server: %s", e)
             self.stop()
 
     def stop(self):
-        print("[DEBUG] Stopping registry server...")
+        logger.debug("Stopping registry server...")
         self.is_running = False
+        for process in self._worker_processes:
+            process.terminate()
+        for process in self._worker_processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
         if hasattr(self, 'socket'):
             try:
-                self.socket.close()
-                print("[DEBUG] Server socket closed")
+                for sock in filter(None, (self.socket, self.tcp_socket, self._internal)):
+                    try:
+                        sock.shutdown(socket.SHUT_RDWR)  # Wakes a blocked recvfrom/accept; close() does not
+                    except OSError:
+                        pass  # Not connected, which is expected for these sockets
+                    sock.close()
+                logger.debug("Server socket closed")
             except Exception as e:
-                print(f"[ERROR] Error closing socket: {e}")
-        print("[INFO] Registry server stopped")
+                logger.error("Error closing socket: %s", e)
+        # Let the request and expiry threads finish their last change, so
+        # the snapshot covers it and nothing appends to a closed store
+        for thread in self._writers:
+            if thread is not threading.current_thread():
+                thread.join(timeout=EXPIRY_POLL + 1)
+        if self.store:
+            self._take_snapshot()
+            with self.lock:
+                self.store.close()
+        if self._temp_dir:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+        logger.info("Registry server stopped")
+
+    def _start_workers(self):
+        """Start the registry_worker processes that share our port"""
+        self._take_snapshot()  # Workers load the epoch from it
+        self._internal = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._internal.bind(('127.0.0.1', 0))
+        thread = threading.Thread(target=self._handle_requests, args=(self._internal,), daemon=True)
+        thread.start()
+        self._writers.append(thread)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'registry_worker.py')
+        leader = f"127.0.0.1:{self._internal.getsockname()[1]}"
+        for _ in range(self.workers - 1):
+            self._worker_processes.append(subprocess.Popen(
+                [sys.executable, script, '--host', self.host, '--port', str(self.port),
+                 '--data-dir', self.store.directory, '--leader', leader]))
+        logger.info("Started %s worker process(es) on port %s", self.workers - 1, self.port)
+
+    def _restore(self):
+        """Reload membership from the data directory and re-arm expiry.
+
+        Restored nodes get a full heartbeat timeout plus a random share of
+        RESTORE_JITTER, so nodes that died while we were down expire
+        spread out rather than all at once.
+        """
+        started = time.time()
+        nodes, version, replayed = self.store.load()
+        now = time.time()
+        with self.lock:
+            self.nodes = nodes
+            self.version = self._snapshot_version = version
+            if self.store.epoch:
+                # Versions carried over from the snapshot keep their epoch
+                self.epoch = self.store.epoch
+            self.changelog.extend(replayed)  # Clients behind us can still catch up with deltas
+            for node_id in nodes:
+                self.last_heartbeat[node_id] = now
+                self._arm_deadline(node_id, now + HEARTBEAT_TIMEOUT + random.uniform(0, RESTORE_JITTER))
+        self.store.open()
+        logger.info("Restored %s nodes at version %s of epoch %s (%s logged changes) in %.1fms",
+                    len(nodes), version, self.epoch, len(replayed), (time.time() - started) * 1000)
+
+    def _snapshot_loop(self):
+        while self.is_running:
+            time.sleep(self.snapshot_interval)
+            if self.is_running and self.version != self._snapshot_version:
+                self._take_snapshot()
+
+    def _take_snapshot(self):
+        with self.lock:
+            if not self.store.is_open():
+                return
+            nodes, version = dict(self.nodes), self.version
+            self.store.rotate()
+        self.store.write_snapshot(nodes, version, self.epoch)
+        self._snapshot_version = version
+        logger.debug("Snapshot of %s nodes at version %s written", len(nodes), version)
 
     def _start_heartbeat_checker(self):
-        def check_heartbeats():
-            print("[DEBUG] Starting heartbeat checker thread")
-            while self.is_running:
-                time.sleep(30)  # Check every 30 seconds
-                current_time = time.time()
-                with self.lock:
-                    # Remove nodes that haven't sent a heartbeat in 90 seconds
-                    inactive_nodes = [
-                        node_id for node_id, last_time in self.last_heartbeat.items()
-                        if current_time - last_time > 90
-                    ]
-                    for node_id in inactive_nodes:
-                        print(f"[INFO] Removing inactive node: {node_id}")
-                        print(f"[DEBUG] Last heartbeat was {current_time - self.last_heartbeat[node_id]:.2f} seconds ago")
-                        self.nodes.pop(node_id, None)
-                        self.last_heartbeat.pop(node_id, None)
-                    if inactive_nodes:
-                        print(f"[DEBUG] Current active nodes after cleanup: {self.nodes}")
-        
-        thread = threading.Thread(target=check_heartbeats)
+        thread = threading.Thread(target=self._expire_nodes)
         thread.daemon = True
         thread.start()
-        print("[DEBUG] Heartbeat checker thread started")
+        self._writers.append(thread)
+        logger.debug("Heartbeat checker thread started")
+
+    def _arm_deadline(self, node_id: str, deadline: float):
+        """Schedule an expiry check for node_id; caller holds self.lock"""
+        self._armed[node_id] = deadline
+        heapq.heappush(self._deadlines, (deadline, node_id))
+
+    def _expire_nodes(self):
+        """Evict nodes silent for HEARTBEAT_TIMEOUT, touching only due deadlines.
+
+        Heartbeats only refresh ``last_heartbeat``; a due deadline whose node
+        has been heard from since is re-armed from its last heartbeat.
+        """
+        logger.debug("Starting heartbeat checker thread")
+        while self.is_running:
+            now = time.time()
+            expired = []
+            with self.lock:
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    deadline, node_id = heapq.heappop(self._deadlines)
+                    if self._armed.get(node_id) != deadline:
+                        continue  # Superseded or unregistered
+                    due = self.last_heartbeat.get(node_id, 0) + HEARTBEAT_TIMEOUT
+                    if node_id in self.nodes and due > now:
+                        self._arm_deadline(node_id, due)
+                        continue
+                    del self._armed[node_id]
+                    if self.nodes.pop(node_id, None) is not None:
+                        self._record_change('expire', node_id)
+                        expired.append((node_id, now - self.last_heartbeat.pop(node_id, now)))
+                wait = self._deadlines[0][0] - now if self._deadlines else EXPIRY_POLL
+            for node_id, silence in expired:
+                logger.info("Removing inactive node: %s", node_id)
+                logger.debug("Last heartbeat was %.2f seconds ago", silence)
+            time.sleep(min(max(wait, 0.01), EXPIRY_POLL))
 
-    def _handle_requests(self):
-        print("[DEBUG] Starting request handler")
+    def _handle_requests(self, sock: socket.socket):
+        logger.debug("Starting request handler")
         while self.is_running:
             try:
-                print("\n[DEBUG] Waiting for incoming requests...")
-                data, client_addr = self.socket.recvfrom(4096)
-                print(f"[DEBUG] Received {len(data)} bytes from {client_addr}")
+                logger.debug("Waiting for incoming requests...")
+                data, client_addr = sock.recvfrom(RECV_BUFFER)
+                if not self.is_running:
+                    break  # Woken by stop()
+                logger.debug("Received %s bytes from %s", len(data), client_addr)
                 try:
                     request = json.loads(data.decode())
-                    print(f"[DEBUG] Parsed request from {client_addr}: {request}")
+                    if sock is self._internal and 'reply_to' in request:
+                        client_addr = tuple(request.pop('reply_to'))  # Forwarded by a worker
+                    logger.debug("Parsed request from %s: %s", client_addr, request)
                     self._process_request(request, client_addr)
                 except json.JSONDecodeError as e:
-                    print(f"[ERROR] Invalid JSON received from {client_addr}: {e}")
-                    print(f"[DEBUG] Raw data received: {data}")
+                    logger.error("Invalid JSON received from %s: %s", client_addr, e)
+                    logger.debug("Raw data received: %s", data)
             except Exception as e:
                 if self.is_running:
-                    print(f"[ERROR] Error handling request: {e}")
+                    METRICS.incr('request_errors')
+                    logger.error("Error handling request: %s", e)
 
     def _process_request(self, request: dict, addr: Tuple[str, int]):
         command = request.get('command')
-        print(f"[DEBUG] Processing {command} command from {addr}")
-        
+        logger.debug("Processing %s command from %s", command, addr)
+        METRICS.incr(f'requests.{command}')
+        # Replies echo the request ID so pipelining clients can match them
+        self._request.id = request.get('id')
+
         if command == 'register':
             self._handle_register(request, addr)
         elif command == 'get_nodes':
-            self._handle_get_nodes(addr)
+            self._handle_get_nodes(request, addr)
+        elif command == 'get_changes':
+            self._handle_get_changes(request, addr)
+        elif command == 'subscribe':
+            self._handle_subscribe(request, addr)
+        elif command == 'unsubscribe':
+            self._handle_unsubscribe(addr)
         elif command == 'heartbeat':
             self._handle_heartbeat(request, addr)
         elif command == 'unregister':
             self._handle_unregister(request, addr)
+        elif command == 'replicate':
+            self._handle_replicate(request, addr)
+        elif command in ('nearest', 'within'):
+            self._handle_geo_query(command, request, addr)
         else:
-            print(f"[WARNING] Unknown command received: {command}")
+            logger.warning("Unknown command received: %s", command)
             self._send_response({
                 'status': 'error',
                 'message': f'Unknown command: {command}'
@@ -103,13 +322,13 @@ class UDPRegistry:
     def _handle_register(self, request: dict, addr: Tuple[str, int]):
         node_id = request.get('node_id')
         node_port = request.get('node_port')
-        print(f"[DEBUG] Processing registration request:")
-        print(f"[DEBUG] Node ID: {node_id}")
-        print(f"[DEBUG] Client Address: {addr}")
-        print(f"[DEBUG] Node Port: {node_port}")
+        logger.debug("Processing registration request:")
+        logger.debug("Node ID: %s", node_id)
+        logger.debug("Client Address: %s", addr)
+        logger.debug("Node Port: %s", node_port)
 
         if not all([node_id, node_port]):
-            print(f"[ERROR] Missing required fields in registration request")
+            logger.error("Missing required fields in registration request")
             self._send_response({
                 'status': 'error',
                 'message': 'Missing required fields'
@@ -117,21 +336,26 @@ class UDPRegistry:
             return
 
         with self.lock:
-            self.nodes[node_id] = (addr[0], node_port)
+            address = (addr[0], node_port)
+            if self.nodes.get(node_id) != address:
+                self.nodes[node_id] = address
+                self._record_change('join', node_id, address)
             self.last_heartbeat[node_id] = time.time()
-            print(f"[INFO] Registered node {node_id} at {addr[0]}:{node_port}")
-            print(f"[DEBUG] Current registered nodes: {self.nodes}")
-            self._send_response({
-                'status': 'success',
-                'message': f'Node {node_id} registered successfully'
-            }, addr)
+            if node_id not in self._armed:
+                self._arm_deadline(node_id, self.last_heartbeat[node_id] + HEARTBEAT_TIMEOUT)
+            self._update_positions(request, [node_id])
+        logger.info("Registered node %s at %s:%s", node_id, addr[0], node_port)
+        self._send_response({
+            'status': 'success',
+            'message': f'Node {node_id} registered successfully'
+        }, addr)
 
     def _handle_unregister(self, request: dict, addr: Tuple[str, int]):
         node_id = request.get('node_id')
-        print(f"[DEBUG] Processing unregister request for node {node_id} from {addr}")
+        logger.debug("Processing unregister request for node %s from %s", node_id, addr)
 
         if not node_id:
-            print(f"[ERROR] Missing node_id in unregister request")
+            logger.error("Missing node_id in unregister request")
             self._send_response({
                 'status': 'error',
                 'message': 'Missing node_id'
@@ -139,70 +363,345 @@ class UDPRegistry:
             return
 
         with self.lock:
-            if node_id in self.nodes:
-                del self.nodes[node_id]
+            known = self.nodes.pop(node_id, None) is not None
+            if known:
                 self.last_heartbeat.pop(node_id, None)
-                print(f"[INFO] Unregistered node {node_id}")
-                print(f"[DEBUG] Current registered nodes: {self.nodes}")
-                self._send_response({
-                    'status': 'success',
-                    'message': f'Node {node_id} unregistered successfully'
-                }, addr)
-            else:
-                print(f"[WARNING] Attempt to unregister unknown node {node_id}")
-                self._send_response({
-                    'status': 'error',
-                    'message': f'Node {node_id} not found'
-                }, addr)
-
-    def _handle_get_nodes(self, addr: Tuple[str, int]):
-        print(f"[DEBUG] Processing get_nodes request from {addr}")
-        with self.lock:
-            print(f"[DEBUG] Returning node list: {self.nodes}")
+                self._armed.pop(node_id, None)
+                self._record_change('leave', node_id)
+        if known:
+            logger.info("Unregistered node %s", node_id)
             self._send_response({
                 'status': 'success',
-                'nodes': self.nodes
+                'message': f'Node {node_id} unregistered successfully'
             }, addr)
-
-    def _handle_heartbeat(self, request: dict, addr: Tuple[str, int]):
-        node_id = request.get('node_id')
-        print(f"[DEBUG] Processing heartbeat from node {node_id} at {addr}")
-        
-        if node_id in self.nodes:
-            with self.lock:
-                self.last_heartbeat[node_id] = time.time()
-                print(f"[DEBUG] Updated heartbeat for node {node_id}")
-            self._send_response({'status': 'success'}, addr)
         else:
-            print(f"[WARNING] Heartbeat received from unregistered node {node_id}")
+            logger.warning("Attempt to unregister unknown node %s", node_id)
             self._send_response({
                 'status': 'error',
-                'message': 'Node not registered'
+                'message': f'Node {node_id} not found'
             }, addr)
 
+    def _record_change(self, op: str, node_id: str, address: Optional[Tuple[str, int]] = None,
+                       replicate: bool = True):
+        """Bump the membership version; caller holds self.lock"""
+        self.version += 1
+        change = {'version': self.version, 'op': op, 'node_id': node_id}
+        if address is not None:
+            change['address'] = address
+        else:
+            self.geo.remove(node_id)
+        self.changelog.append(change)
+        if self.store and self.store.is_open():
+            self.store.append(change)
+        self._push_queue.put(change)
+        if self.ring and replicate:
+            self._replication_queue.put(change)
+
+    def _handle_replicate(self, request: dict, addr: Tuple[str, int]):
+        """Apply changes another holder of the shard accepted"""
+        now = time.time()
+        with self.lock:
+            for change in request.get('changes', []):
+                node_id = change['node_id']
+                if change['op'] == 'join':
+                    address = tuple(change['address'])
+                    if self.nodes.get(node_id) != address:
+                        self.nodes[node_id] = address
+                        self._record_change('join', node_id, address, replicate=False)
+                    # Not armed here: expiry starts with the node's first
+                    # heartbeat to us, or arrives replicated from the primary
+                    self.last_heartbeat[node_id] = now
+                elif self.nodes.pop(node_id, None) is not None:
+                    self.last_heartbeat.pop(node_id, None)
+                    self._armed.pop(node_id, None)
+                    self._record_change(change['op'], node_id, replicate=False)
+        METRICS.incr('changes_replicated_in', len(request.get('changes', [])))
+        self._send_response({'status': 'success'}, addr)
+
+    def _replication_loop(self):
+        """Forward local changes, batched, to the other holders of each shard"""
+        while self.is_running:
+            try:
+                changes = [self._replication_queue.get(timeout=1.0)]
+            except queue.Empty:
+                continue
+            while len(changes) < REPLICATION_BATCH:
+                try:
+                    changes.append(self._replication_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            batches: Dict[str, List[dict]] = {}
+            for change in changes:
+                for member in self.ring.holders(change['node_id'], REPLICAS):
+                    if member != self.advertise:
+                        batches.setdefault(member, []).append(
+                            {key: change[key] for key in ('op', 'node_id', 'address') if key in change})
+            for member, batch in batches.items():
+                peer = self._peers.get(member)
+                if peer is None:
+                    peer = self._peers[member] = RegistryClient(*parse_member(member), timeout=0.5, retries=3)
+                response = peer._send_request({'command': 'replicate', 'changes': batch})
+                if response and response.get('status') == 'success':
+                    METRICS.incr('changes_replicated_out', len(batch))
+                else:
+                    METRICS.incr('replication_failures')
+                    logger.warning("Replication of %s change(s) to %s failed", len(batch), member)
+
+    def _sorted_node_ids(self) -> List[str]:
+        if self._sorted_version != self.version:
+            self._sorted_ids = sorted(self.nodes)
+            self._sorted_version = self.version
+        return self._sorted_ids
+
+    def _handle_get_nodes(self, request: dict, addr: Tuple[str, int]):
+        """Return one page of nodes, in node ID order after ``after``"""
+        after = request.get('after')
+        limit = request.get('limit')
+        logger.debug("Processing get_nodes request from %s (after=%s)", addr, after)
+        with self.lock:
+            ids = self._sorted_node_ids()
+            start = bisect.bisect_right(ids, after) if after is not None else 0
+            page, size = {}, 0
+            for node_id in islice(ids, start, None):
+                if limit and len(page) >= limit:
+                    break
+                size += len(node_id) + 32  # Rough JSON size of one entry
+                if page and size > PAGE_BYTES:
+                    break
+                page[node_id] = self.nodes[node_id]
+            more = start + len(page) < len(ids)
+            response = {
+                'status': 'success',
+                'epoch': self.epoch,
+                'version': self.version,
+                'total': len(ids),
+                'nodes': page,
+                'next': ids[start + len(page) - 1] if more and page else None
+            }
+        self._send_response(response, addr)
+
+    def _handle_get_changes(self, request: dict, addr: Tuple[str, int]):
+        """Return membership changes after version ``since``, or ask for a resync"""
+        since = request.get('since')
+        epoch = request.get('epoch', self.epoch)
+        with self.lock:
+            oldest = self.changelog[0]['version'] if self.changelog else self.version + 1
+            if (not isinstance(since, int) or epoch != self.epoch
+                    or since > self.version or since < oldest - 1):
+                # Another incarnation's version (registry restart) or changelog overrun
+                response = {'status': 'resync', 'epoch': self.epoch, 'version': self.version}
+            else:
+                changes, size = [], 0
+                for change in islice(self.changelog, since - oldest + 1, None):
+                    size += len(change['node_id']) + 64
+                    if changes and size > PAGE_BYTES:
+                        break
+                    changes.append(change)
+                response = {
+                    'status': 'success',
+                    'epoch': self.epoch,
+                    'version': changes[-1]['version'] if changes else self.version,
+                    'changes': changes,
+                    'more': bool(changes) and changes[-1]['version'] < self.version
+                }
+        self._send_response(response, addr)
+
+    def _handle_subscribe(self, request: dict, addr: Tuple[str, int]):
+        """Start or renew a push subscription for the requesting address"""
+        lease = min(float(request.get('lease', 60)), MAX_LEASE)
+        with self.lock:
+            renewal = addr in self.subscribers
+            self.subscribers[addr] = time.time() + lease
+            version = self.version
+        if not renewal:
+            logger.info("Subscriber %s:%s added (%s total)", addr[0], addr[1], len(self.subscribers))
+        self._send_response({'status': 'success', 'type': 'subscribed', 'epoch': self.epoch,
+                             'version': version, 'lease': lease}, addr)
+
+    def _handle_unsubscribe(self, addr: Tuple[str, int]):
+        with self.lock:
+            self.subscribers.pop(addr, None)
+        self._send_response({'status': 'success', 'type': 'unsubscribed'}, addr)
+
+    def _push_loop(self):
+        """Send queued membership changes to every live subscriber"""
+        while self.is_running:
+            try:
+                change = self._push_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            now = time.time()
+            with self.lock:
+                for addr in [addr for addr, expiry in self.subscribers.items() if expiry < now]:
+                    del self.subscribers[addr]
+                    logger.info("Subscription from %s:%s lapsed", addr[0], addr[1])
+                targets = list(self.subscribers)
+            push = json.dumps({'type': 'membership', 'epoch': self.epoch,
+                               'seq': change['version'], 'change': change}).encode()
+            for addr in targets:
+                try:
+                    self.socket.sendto(push, addr)
+                except OSError as e:
+                    logger.debug("Push to %s failed: %s", addr, e)
+            METRICS.incr('pushes_sent', len(targets))
+
+    def _serve_snapshots(self):
+        """Serve full membership snapshots over TCP: one JSON line each way"""
+        while self.is_running:
+            try:
+                conn, addr = self.tcp_socket.accept()
+            except OSError:
+                if self.is_running:
+                    logger.error("Snapshot listener failed")
+                return
+            threading.Thread(target=self._send_snapshot, args=(conn, addr), daemon=True).start()
+
+    def _send_snapshot(self, conn: socket.socket, addr: Tuple[str, int]):
+        try:
+            conn.settimeout(10)
+            with conn, conn.makefile('rb') as reader:
+                request = json.loads(reader.readline() or b'{}')
+                METRICS.incr('requests.snapshot')
+                if request.get('command') != 'snapshot':
+                    response = {'status': 'error', 'message': 'Only snapshot is served over TCP'}
+                else:
+                    with self.lock:
+                        response = {'status': 'success', 'epoch': self.epoch,
+                                    'version': self.version, 'nodes': dict(self.nodes)}
+                conn.sendall(json.dumps(response).encode() + b'\n')
+                logger.debug("Sent snapshot to %s", addr)
+        except (OSError, ValueError) as e:
+            logger.error("Snapshot request from %s failed: %s", addr, e)
+
+    def _handle_heartbeat(self, request: dict, addr: Tuple[str, int]):
+        """Refresh one node (``node_id``) or a batch (``node_ids``).
+
+        With ``ack`` false the heartbeat is fire-and-forget: the only reply
+        is an ``unknown_nodes`` notice listing IDs we do not know, so their
+        host can register them again.
+        """
+        node_ids = request.get('node_ids') or [request.get('node_id')]
+        logger.debug("Processing heartbeat for %s node(s) from %s", len(node_ids), addr)
+
+        now = time.time()
+        unknown = []
+        with self.lock:
+            for node_id in node_ids:
+                if node_id in self.nodes:
+                    self.last_heartbeat[node_id] = now
+                    if node_id not in self._armed:
+                        # Replicated entries start expiring once heartbeats reach us
+                        self._arm_deadline(node_id, now + HEARTBEAT_TIMEOUT)
+                else:
+                    unknown.append(node_id)
+            self._update_positions(request, node_ids)
+        METRICS.incr('heartbeats', len(node_ids) - len(unknown))
+
+        self._answer_heartbeat(request, unknown, addr)
+
+    def _answer_heartbeat(self, request: dict, unknown: List[str], addr: Tuple[str, int]):
+        if unknown:
+            logger.warning("Heartbeat received from unregistered node(s) %s", ', '.join(map(str, unknown[:10])))
+        if request.get('ack', True):
+            if unknown:
+                self._send_response({
+                    'status': 'error',
+                    'message': 'Node not registered',
+                    'unknown_nodes': unknown
+                }, addr)
+            else:
+                self._send_response({'status': 'success'}, addr)
+        elif unknown:
+            self._send_response({'status': 'error', 'type': 'unknown_nodes', 'node_ids': unknown}, addr)
+
+    def _update_positions(self, request: dict, node_ids: List[str]):
+        """Index ``position`` (single node) or ``positions`` (by ID); caller holds self.lock"""
+        positions = request.get('positions') or {}
+        if 'position' in request and len(node_ids) == 1:
+            positions = {node_ids[0]: request['position']}
+        for node_id, position in positions.items():
+            if node_id not in self.nodes:
+                continue
+            try:
+                self.geo.update(node_id, position_to_ecef(position))
+            except (KeyError, TypeError, ValueError):
+                logger.warning("Ignoring malformed position for node %s: %s", node_id, position)
+
+    def _handle_geo_query(self, command: str, request: dict, addr: Tuple[str, int]):
+        """Nodes nearest to, or within ``radius_km`` of, a position or another node.
+
+        The point is ``position`` or the indexed position of ``node_id``
+        (which is then left out of the answer). Distances are straight-line
+        km; at most MAX_GEO_RESULTS nodes are returned.
+        """
+        exclude = None
+        with self.lock:
+            try:
+                if 'position' in request:
+                    point = position_to_ecef(request['position'])
+                else:
+                    exclude = request.get('node_id')
+                    point = self.geo.position(exclude)
+                    if point is None:
+                        raise ValueError(f"No position known for node {exclude}")
+                if command == 'nearest':
+                    limit = min(int(request.get('k', 1)), MAX_GEO_RESULTS)
+                    hits = self.geo.nearest(point, limit + (exclude is not None), request.get('max_km'))
+                else:
+                    limit = MAX_GEO_RESULTS
+                    hits = self.geo.within(point, float(request['radius_km']))
+            except (KeyError, TypeError, ValueError) as e:
+                self._send_response({'status': 'error', 'message': f'Bad {command} query: {e}'}, addr)
+                return
+            hits = [(node_id, distance) for node_id, distance in hits if node_id != exclude]
+            nodes = [{'node_id': node_id, 'address': self.nodes[node_id], 'distance_km': round(distance, 3)}
+                     for node_id, distance in hits[:limit]]
+        self._send_response({
+            'status': 'success',
+            'nodes': nodes,
+            'truncated': len(hits) > len(nodes),
+            'epoch': self.epoch,
+            'version': self.version
+        }, addr)
+
     def _send_response(self, response: dict, addr: Tuple[str, int]):
         try:
-            print(f"[DEBUG] Sending response to {addr}:")
-            print(f"[DEBUG] Response content: {response}")
+            logger.debug("Sending response to %s:", addr)
+            logger.debug("Response content: %s", response)
+            request_id = getattr(self._request, 'id', None)
+            if request_id is not None:
+                response['id'] = request_id
             self.socket.sendto(json.dumps(response).encode(), addr)
-            print(f"[DEBUG] Response sent successfully")
+            logger.debug("Response sent successfully")
         except Exception as e:
-            print(f"[ERROR] Failed to send response to {addr}: {e}")
-            print(f"[DEBUG] Error details: {str(e)}")
+            logger.error("Failed to send response to %s: %s", addr, e)
+            logger.debug("Error details: %s", str(e))
 
 def main():
     import argparse
     parser = argparse.ArgumentParser(description='Start the UDP registry server')
     parser.add_argument('--host', default='0.0.0.0', help='Host to bind to')
     parser.add_argument('--port', type=int, default=5000, help='Port to bind to')
+    parser.add_argument('--cluster', default=None, help='Comma-separated host:port of every cluster instance')
+    parser.add_argument('--advertise', default=None, help='This instance as listed in --cluster')
+    parser.add_argument('--data-dir', default=None, help='Persist membership (snapshot + log) in this directory')
+    parser.add_argument('--snapshot-interval', type=float, default=60.0, help='Seconds between snapshots')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes serving the port (SO_REUSEPORT); extra ones are registry_worker.py')
+    parser.add_argument('--log-level', default=None, help='DEBUG, INFO, WARNING or ERROR (default: $S2S_LOG_LEVEL or INFO)')
     args = parser.parse_args()
+    configure_logging(args.log_level)
+    install_dump_handler()
 
-    print(f"[DEBUG] Starting registry server with arguments: host={args.host}, port={args.port}")
-    registry = UDPRegistry(args.host, args.port)
+    logger.debug("Starting registry server with arguments: host=%s, port=%s", args.host, args.port)
+    cluster = parse_members(args.cluster) if args.cluster else None
+    registry = UDPRegistry(args.host, args.port, cluster, args.advertise,
+                           args.data_dir, args.snapshot_interval, args.workers)
     try:
         registry.start()
     except KeyboardInterrupt:
-        print("\n[INFO] Shutting down registry server...")
+        logger.info("Shutting down registry server...")
         registry.stop()
 
 if __name__ == '__main__':
@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+from log import get_logger
+
+# Durable registry membership: a periodic snapshot plus an append-only log
+# of the membership changes made since. Snapshotting first moves the live
+# log aside, so a crash at any point leaves snapshot + logs that replay to
+# the latest state; entries the snapshot already covers are skipped by
+# version. If the log moved aside earlier was never covered by a snapshot
+# (a crash in between), the live log is merged into it rather than
+# replacing it. The snapshot also carries the registry epoch, so versions
+# that survive a restart keep the identity clients know them under.
+# LogFollower lets other processes (registry workers) tail the live log.
+
+SNAPSHOT_FILE = 'snapshot.json'
+WAL_FILE = 'wal.log'
+PREVIOUS_WAL_FILE = 'wal.prev'
+
+logger = get_logger('registry_store')
+
+class MembershipStore:
+    def __init__(self, directory: str, fsync: bool = False):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._wal = None
+        self._snapshot_lock = threading.Lock()
+        self.epoch: Optional[str] = None  # From the last snapshot loaded
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def load(self) -> Tuple[Dict[str, Tuple[str, int]], int, List[dict]]:
+        """Return (nodes, version, changes replayed from the logs)"""
+        nodes, version = {}, 0
+        try:
+            with open(self._path(SNAPSHOT_FILE)) as f:
+                snapshot = json.load(f)
+            nodes = {node_id: tuple(address) for node_id, address in snapshot['nodes'].items()}
+            version = snapshot['version']
+            self.epoch = snapshot.get('epoch')
+        except FileNotFoundError:
+            pass
+
+        replayed = []
+        for name in (PREVIOUS_WAL_FILE, WAL_FILE):
+            for change in self._read_log(self._path(name)):
+                if change['version'] <= version:
+                    continue
+                if change['op'] == 'join':
+                    nodes[change['node_id']] = tuple(change['address'])
+                else:
+                    nodes.pop(change['node_id'], None)
+                version = change['version']
+                replayed.append(change)
+        return nodes, version, replayed
+
+    def _read_log(self, path: str) -> List[dict]:
+        changes = []
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        changes.append(json.loads(line))
+                    except ValueError:
+                        # A torn last record from a crash mid-write
+                        logger.warning("Ignoring unreadable record in %s", path)
+                        break
+        except FileNotFoundError:
+            pass
+        return changes
+
+    def open(self):
+        self._wal = open(self._path(WAL_FILE), 'a')
+
+    def is_open(self) -> bool:
+        return self._wal is not None
+
+    def append(self, change: dict):
+        self._wal.write(json.dumps(change) + '\n')
+        self._wal.flush()
+        if self.fsync:
+            os.fsync(self._wal.fileno())
+
+    def rotate(self):
+        """Move the live log aside; call with membership changes blocked"""
+        self._wal.close()
+        previous = self._path(PREVIOUS_WAL_FILE)
+        if os.path.exists(previous):
+            # Its snapshot was never written: keep both logs, swapped in whole
+            changes = self._read_log(previous) + self._read_log(self._path(WAL_FILE))
+            temp = previous + '.tmp'
+            with open(temp, 'w') as f:
+                f.writelines(json.dumps(change) + '\n' for change in changes)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, previous)
+            os.remove(self._path(WAL_FILE))
+        else:
+            os.replace(self._path(WAL_FILE), previous)
+        self._wal = open(self._path(WAL_FILE), 'a')
+
+    def write_snapshot(self, nodes: Dict[str, Tuple[str, int]], version: int,
+                       epoch: Optional[str] = None):
+        """Persist a state captured at rotate() time and drop the log it covers"""
+        with self._snapshot_lock:
+            temp = self._path(SNAPSHOT_FILE + '.tmp')
+            with open(temp, 'w') as f:
+                json.dump({'version': version, 'epoch': epoch, 'nodes': nodes}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self._path(SNAPSHOT_FILE))
+            try:
+                os.remove(self._path(PREVIOUS_WAL_FILE))
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        if self._wal:
+            self._wal.close()
+            self._wal = None
+
+class LogFollower:
+    """Reads the changes another process's MembershipStore appends, across rotations.
+
+    Open it before loading the store: changes appended in between are then
+    read twice rather than missed, and callers skip them by version.
+    """
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, WAL_FILE)
+        self._file = None
+        self._partial = ''
+
+    def open(self):
+        self._file = open(self.path)
+
+    def read(self) -> List[dict]:
+        """Changes appended since the last call, oldest first"""
+        changes = self._read_to_end()
+        try:
+            rotated = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = False  # Mid-rotation; the new log shows up next time
+        if rotated:
+            # The old log is final once rotated; finish it, then move over
+            changes.extend(self._read_to_end())
+            self._file.close()
+            self._file, self._partial = open(self.path), ''
+            changes.extend(self._read_to_end())
+        return changes
+
+    def _read_to_end(self) -> List[dict]:
+        lines = (self._partial + self._file.read()).split('\n')
+        self._partial = lines.pop()  # A record still being written, or ''
+        changes = []
+        for line in lines:
+            try:
+                changes.append(json.loads(line))
+            except ValueError:
+                logger.warning("Ignoring unreadable record in %s", self.path)
+        return changes
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
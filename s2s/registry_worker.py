@@ -0,0 +1,163 @@
+import json
+import os
+import socket
+import threading
+import time
+from typing import Dict, List, Set, Tuple
+from log import configure_logging, get_logger
+from metrics import METRICS
+from registry_client import HEARTBEAT_BATCH
+from registry_cluster import parse_member
+from registry_server import UDPRegistry
+from registry_store import LogFollower, MembershipStore
+
+# A registry worker: an extra process on a registry's port (SO_REUSEPORT),
+# started by UDPRegistry with workers > 1. It keeps a read-only copy of the
+# membership by tailing the registry's store, catching up before every
+# request it answers (and every HEARTBEAT_FLUSH seconds), so a client
+# always sees its own writes. A hole in the versions it reads means the
+# log rotated more than once in between; the copy is then reloaded from
+# the store's snapshot and logs. Reads and
+# heartbeats are answered here; heartbeats reach the registry (the
+# "leader") in batches. Everything else is forwarded to the leader, which
+# replies to the client directly.
+
+LOCAL_COMMANDS = ('get_nodes', 'get_changes', 'heartbeat')
+HEARTBEAT_FLUSH = 1.0  # Seconds between batched heartbeats to the leader
+
+logger = get_logger('registry_worker')
+
+class RegistryWorker(UDPRegistry):
+    def __init__(self, host: str, port: int, data_dir: str, leader: str):
+        super().__init__(host, port)
+        self.leader = parse_member(leader)
+        self._store = MembershipStore(data_dir)  # Read only; the leader writes it
+        self._log = LogFollower(data_dir)
+        self._forward_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._heard: Set[str] = set()  # Nodes heartbeated since the last flush
+        self._heard_positions: Dict[str, dict] = {}
+        self._heard_lock = threading.Lock()
+        self._parent = os.getppid()
+
+    def start(self):
+        try:
+            with self.lock:
+                self._load()
+            if not self._store.epoch:
+                raise RuntimeError(f"No registry snapshot in {self._store.directory}")
+            self.epoch = self._store.epoch
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.socket.bind((self.host, self.port))
+            self.is_running = True
+            logger.info("Registry worker %s serving %s:%s at version %s",
+                        os.getpid(), self.host, self.port, self.version)
+            self._writers.append(threading.current_thread())
+            threading.Thread(target=self._flush_loop, daemon=True).start()
+            self._handle_requests(self.socket)
+        except Exception as e:
+            logger.error("Failed to start registry worker: %s", e)
+            self.stop()
+
+    def stop(self):
+        super().stop()
+        self._forward_socket.close()
+        with self.lock:
+            self._log.close()
+
+    def _process_request(self, request: dict, addr: Tuple[str, int]):
+        if request.get('command') not in LOCAL_COMMANDS:
+            METRICS.incr('requests_forwarded')
+            self._forward_socket.sendto(json.dumps(dict(request, reply_to=addr)).encode(), self.leader)
+            return
+        self._catch_up()
+        super()._process_request(request, addr)
+
+    def _load(self):
+        """Copy the membership from the store and follow its log; caller holds self.lock"""
+        self._log.close()
+        self._log.open()  # First, so nothing logged during the load is missed
+        self.nodes, self.version, replayed = self._store.load()
+        self.changelog.clear()
+        self.changelog.extend(replayed)
+
+    def _catch_up(self):
+        """Apply what the leader has logged since we last looked"""
+        with self.lock:
+            changes = self._unseen()
+            if not self._contiguous(changes):
+                # A log rotated away before we read it
+                METRICS.incr('worker_reloads')
+                logger.info("Missed changes after version %s, reloading from the store", self.version)
+                self._load()
+                changes = self._unseen()
+                if not self._contiguous(changes):
+                    self.changelog.clear()  # Still a hole; deltas across it cannot be served
+            for change in changes:
+                if change['op'] == 'join':
+                    self.nodes[change['node_id']] = tuple(change['address'])
+                else:
+                    self.nodes.pop(change['node_id'], None)
+                self.version = change['version']
+                self.changelog.append(change)
+
+    def _unseen(self) -> List[dict]:
+        return [change for change in self._log.read() if change['version'] > self.version]
+
+    def _contiguous(self, changes: List[dict]) -> bool:
+        return all(change['version'] == self.version + 1 + i for i, change in enumerate(changes))
+
+    def _handle_heartbeat(self, request: dict, addr: Tuple[str, int]):
+        """Answer from our copy; the leader hears of it at the next flush"""
+        node_ids = request.get('node_ids') or [request.get('node_id')]
+        with self.lock:
+            unknown = [node_id for node_id in node_ids if node_id not in self.nodes]
+        positions = request.get('positions') or {}
+        if 'position' in request and len(node_ids) == 1:
+            positions = {node_ids[0]: request['position']}
+        with self._heard_lock:
+            self._heard.update(node_id for node_id in node_ids if node_id not in unknown)
+            self._heard_positions.update(positions)
+        METRICS.incr('heartbeats', len(node_ids) - len(unknown))
+        self._answer_heartbeat(request, unknown, addr)
+
+    def _flush_loop(self):
+        while self.is_running:
+            time.sleep(HEARTBEAT_FLUSH)
+            if os.getppid() != self._parent:
+                logger.warning("Registry leader exited, stopping worker %s", os.getpid())
+                self.stop()
+                return
+            self._catch_up()  # Keeps up while idle, so rotations rarely outpace us
+            with self._heard_lock:
+                heard, positions = sorted(self._heard), self._heard_positions
+                self._heard, self._heard_positions = set(), {}
+            for i in range(0, len(heard), HEARTBEAT_BATCH):
+                batch = heard[i:i + HEARTBEAT_BATCH]
+                request = {'command': 'heartbeat', 'node_ids': batch, 'ack': False}
+                batch_positions = {node_id: positions[node_id] for node_id in batch if node_id in positions}
+                if batch_positions:
+                    request['positions'] = batch_positions
+                try:
+                    self._forward_socket.sendto(json.dumps(request).encode(), self.leader)
+                except OSError as e:
+                    logger.debug("Heartbeat flush to leader failed: %s", e)
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve a registry port alongside its leader (see registry_server --workers)')
+    parser.add_argument('--host', default='0.0.0.0', help='Host the registry is bound to')
+    parser.add_argument('--port', type=int, default=5000, help='Port the registry is bound to')
+    parser.add_argument('--data-dir', required=True, help="The leader's data directory")
+    parser.add_argument('--leader', required=True, help="host:port the leader takes forwarded requests on")
+    parser.add_argument('--log-level', default=None, help='DEBUG, INFO, WARNING or ERROR (default: $S2S_LOG_LEVEL or INFO)')
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    worker = RegistryWorker(args.host, args.port, args.data_dir, args.leader)
+    try:
+        worker.start()
+    except KeyboardInterrupt:
+        worker.stop()
+
+if __name__ == '__main__':
+    main()
@@ -2,64 +2,110 @@ import sys
 import socket
 import time
 import argparse
+import logging
+import base64
 import os
+from concurrent.futures import ThreadPoolExecutor
+from connection import PeerConnection
+from compression import CODEC_IDS, CODEC_NAMES, IMAGE_CODECS, negotiate_codec
+from framing import FLAG_ACK, decode_ack, encode_frame, hello_line, recv_codec_offer, recv_frame
+from log import Sampler, configure_logging, get_logger, log_sampled, preview
 from message import Message, MessageType
-from registry_client import RegistryClient, get_registry_connection
+from metrics import METRICS
+from overlay import OVERLAY_MODES, build_overlay, fallback_targets, relay_targets
+from stream import FrameStreamer, camera_frames, directory_frames
+from swarm import assign_seeds, split_image
+from registry_client import get_membership_cache
 
-def get_all_nodes():
-    registry_host, registry_port = get_registry_connection()
-    client = RegistryClient(registry_host, registry_port)
-    try:
-        return client.get_nodes()
-    finally:
-        client.close()
+logger = get_logger('send_message')
+chunk_sampler = Sampler(every=64)  # Per-8KB-chunk progress lines
+
+def get_all_nodes(require=None):
+    """Current membership from the shared cache; ``require`` forces a refresh if missing"""
+    return get_membership_cache().get(require)
 
-def send_to_node(sender_id, target_ip, target_port, message_obj, retries=3, retry_delay=1.0):
+def send_to_node(sender_id, target_ip, target_port, message_obj, retries=3, retry_delay=1.0, deadline=None,
+                 compression='auto'):
+    """Send a message to one node.
+
+    ``deadline`` is an absolute ``time.time()`` value; when given, connect
+    timeouts and retry sleeps are clipped so the call never outlives it.
+    ``compression`` is 'auto', 'none' or a codec name, negotiated against
+    the codecs the receiver offers.
+    """
     sock = None
+    start = time.time()
     for attempt in range(retries):
+        timeout = 10
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                logger.error("Deadline exceeded sending to %s:%s", target_ip, target_port)
+                return False
+            timeout = min(timeout, remaining)
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(10)
-            print(f"[DEBUG] Connecting to {target_ip}:{target_port}, attempt {attempt + 1}/{retries}")
+            sock.settimeout(timeout)
+            logger.debug("Connecting to %s:%s, attempt %s/%s", target_ip, target_port, attempt + 1, retries)
             sock.connect((target_ip, target_port))
 
-            # Send sender ID with newline
-            sender_id_bytes = f"{sender_id}\n".encode()
-            print(f"[DEBUG] Sending sender ID: {sender_id}")
-            sock.sendall(sender_id_bytes)
+            # Send sender ID with newline, asking the receiver to ack
+            logger.debug("Sending sender ID: %s", sender_id)
+            sock.sendall(hello_line(sender_id, acks=True))
             
+            # Receiver answers with the codecs it can decode
+            buffer = bytearray()
+            offered = recv_codec_offer(sock, buffer)
+            legacy = offered is None
+            if legacy:
+                logger.info("%s:%s sent no codec offer; sending uncompressed and unacknowledged",
+                            target_ip, target_port)
+            codec = negotiate_codec(compression, offered or [])
+
             # Prepare message data
-            message_data = message_obj.to_json().encode()
-            message_length = len(message_data)
-            print(f"[DEBUG] Message length: {message_length} bytes")
-            print(f"[DEBUG] Message content: {message_data.decode()}")
-
-            # Send message length as 8-byte header
-            length_header = message_length.to_bytes(8, byteorder='big')
-            print(f"[DEBUG] Sending length header: {len(length_header)} bytes")
-            sock.sendall(length_header)
+            message_data = message_obj.to_json(seq=1).encode()
+            logger.debug("Message length: %s bytes", len(message_data))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Message content: %s", preview(message_data.decode()))
+
+            # Header and body go out as one buffer
+            frame = encode_frame(message_data, codec)
+            frame_length = len(frame)
+            logger.debug("Sending frame: %s bytes (%s)", frame_length, CODEC_NAMES[frame[0]])
             
             # Send message data
             total_sent = 0
-            while total_sent < message_length:
-                chunk_size = min(8192, message_length - total_sent)
-                sent = sock.send(message_data[total_sent:total_sent + chunk_size])
+            while total_sent < frame_length:
+                chunk_size = min(8192, frame_length - total_sent)
+                sent = sock.send(frame[total_sent:total_sent + chunk_size])
                 if sent == 0:
                     raise RuntimeError("Socket connection broken")
                 total_sent += sent
-                print(f"[DEBUG] Sent {total_sent}/{message_length} bytes")
+                log_sampled(logger, chunk_sampler, logging.DEBUG,
+                            "Sent %s/%s bytes", total_sent, frame_length)
             
-            # Wait briefly to ensure data is sent
-            time.sleep(0.1)
-            print("[DEBUG] Message sent successfully")
+            # Success means the receiver processed it, not just that
+            # sendall returned (old receivers cannot tell us)
+            if not legacy:
+                reply = recv_frame(sock, buffer)
+                if reply is None or not reply[0] & FLAG_ACK or decode_ack(reply[1])[0] < 1:
+                    raise RuntimeError("Connection closed before the message was acknowledged")
+                logger.debug("Message sent and acknowledged")
+            METRICS.incr('messages_sent')
+            METRICS.incr('bytes_sent', frame_length)
+            METRICS.observe('send_latency', (time.time() - start) * 1000)
             return True
 
         except Exception as e:
-            print(f"[ERROR] Send failed: {str(e)}")
+            logger.error("Send failed: %s", str(e))
+            METRICS.incr('send_errors')
             if sock:
                 sock.close()
             if attempt < retries - 1:
-                print(f"[INFO] Retrying in {retry_delay} seconds...")
+                if deadline is not None and time.time() + retry_delay >= deadline:
+                    logger.error("No time left to retry %s:%s", target_ip, target_port)
+                    return False
+                logger.info("Retrying in %s seconds...", retry_delay)
                 time.sleep(retry_delay)
                 continue
             return False
@@ -67,47 +113,134 @@ def send_to_node(sender_id, target_ip, target_port, message_obj, retries=3, retr
             if sock:
                 sock.close()
 
-def broadcast_message(sender_id, content, exclude_nodes=None):
+def fan_out_message(sender_id, targets, message, max_workers=8, peer_timeout=15.0, compression='auto'):
+    """Send ``message`` to every ``(ip, port)`` in ``targets`` concurrently.
+
+    At most ``max_workers`` sends run at once and each peer gets
+    ``peer_timeout`` seconds (connects and retries included), so a dead
+    node only costs its own slot. Returns a delivery report keyed by node ID.
+    """
+    report = {}
+    if not targets:
+        return report
+
+    def deliver(node_id, ip, port):
+        start = time.time()
+        success = send_to_node(sender_id, ip, port, message, deadline=start + peer_timeout,
+                               compression=compression)
+        return {
+            'success': success,
+            'address': f"{ip}:{port}",
+            'elapsed': time.time() - start
+        }
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets)))) as pool:
+        futures = {
+            node_id: pool.submit(deliver, node_id, ip, port)
+            for node_id, (ip, port) in targets.items()
+        }
+        for node_id, future in futures.items():
+            try:
+                report[node_id] = future.result()
+            except Exception as e:
+                report[node_id] = {'success': False, 'error': str(e), 'elapsed': peer_timeout}
+    return report
+
+def relay_overlay(sender_id, message, targets, seen, max_workers=8, peer_timeout=15.0, compression='auto'):
+    """Send an overlay broadcast on to ``targets``, standing in for any that fail.
+
+    ``seen`` holds the members known to have been sent the message,
+    ``targets`` included; gossip copies carry it. Peers that cannot be
+    reached are replaced as ``overlay.fallback_targets`` says, until no
+    replacement is left. Returns the delivery report and the unreachable
+    members.
+    """
+    overlay = message.overlay
+    report = {}
+    undelivered = []
+    while targets:
+        if overlay.get('mode') == 'gossip':
+            message.overlay = dict(overlay, seen=sorted(seen))
+        batch = fan_out_message(sender_id, targets, message, max_workers, peer_timeout, compression)
+        report.update(batch)
+        failed = [node_id for node_id, entry in batch.items() if not entry['success']]
+        undelivered.extend(failed)
+        targets = fallback_targets(overlay, failed, seen)
+        seen.update(targets)
+        if targets:
+            logger.info("Relaying to %s in place of unreachable %s", list(targets), failed)
+    message.overlay = overlay
+    return report, undelivered
+
+def print_delivery_report(report):
+    success_count = sum(1 for entry in report.values() if entry['success'])
+    for node_id, entry in sorted(report.items()):
+        status = "delivered" if entry['success'] else "FAILED"
+        logger.info("  %s: %s in %.2fs", node_id, status, entry['elapsed'])
+    return success_count
+
+def broadcast_message(sender_id, content, exclude_nodes=None, max_workers=8, peer_timeout=15.0,
+                      overlay=None, fanout=3, compression='auto'):
+    """Broadcast ``content`` to all registered nodes.
+
+    With ``overlay`` set to 'tree' or 'gossip' the sender only pushes to
+    ``fanout`` peers and the nodes relay the rest of the way.
+    """
     if exclude_nodes is None:
         exclude_nodes = set()
     
     nodes = get_all_nodes()
     if not nodes:
-        print("[ERROR] No nodes available for broadcast")
+        logger.error("No nodes available for broadcast")
         return False
 
+    targets = {
+        node_id: tuple(addr) for node_id, addr in nodes.items()
+        if node_id not in exclude_nodes
+    }
+
+    overlay_info = None
+    if overlay:
+        origin_addr = targets.pop(sender_id, None)
+        overlay_info = build_overlay(sender_id, targets, overlay, fanout, origin_addr)
+        first_hop = relay_targets(overlay_info, sender_id, seen=())
+        logger.info("Overlay %s broadcast over %s nodes, first hop: %s",
+                    overlay, len(overlay_info['members']) - 1, list(first_hop))
+        targets = first_hop
+
     message = Message(
         sender_id=sender_id,
         message_type=MessageType.BROADCAST,
         content=content,
-        target_node=None
+        target_node=None,
+        overlay=overlay_info
     )
     
-    print(f"[DEBUG] Created broadcast message: {message.to_json()}")
-    
-    success_count = 0
-    total_nodes = len(nodes) - len(exclude_nodes)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Created broadcast message: %s", preview(message.to_json()))
 
-    print(f"[INFO] Broadcasting message to {total_nodes} nodes...")
+    logger.info("Broadcasting message to %s nodes (%s concurrent, %.1fs per peer)...",
+                len(targets), max_workers, peer_timeout)
     
-    for node_id, (ip, port) in nodes.items():
-        if node_id in exclude_nodes:
-            continue
-
-        print(f"[INFO] Sending to node {node_id} at {ip}:{port}...")
-        if send_to_node(sender_id, ip, port, message):
-            success_count += 1
-            print(f"[INFO] Successfully sent to {node_id}")
-        else:
-            print(f"[ERROR] Failed to send to {node_id}")
+    start = time.time()
+    if overlay_info:
+        # Relays report the members they could not reach to the origin node
+        report, undelivered = relay_overlay(sender_id, message, targets, {sender_id, *targets},
+                                            max_workers, peer_timeout, compression)
+        if undelivered:
+            logger.warning("Broadcast %s could not reach %s", message.message_id, undelivered)
+    else:
+        report = fan_out_message(sender_id, targets, message, max_workers, peer_timeout, compression)
+    success_count = print_delivery_report(report)
 
-    print(f"[INFO] Broadcast complete. Successfully sent to {success_count}/{total_nodes} nodes")
+    logger.info("Broadcast complete in %.2fs. Successfully sent to %s/%s nodes",
+                time.time() - start, success_count, len(report))
     return success_count > 0
 
-def direct_message(sender_id, target_node, content):
-    nodes = get_all_nodes()
+def direct_message(sender_id, target_node, content, compression='auto'):
+    nodes = get_all_nodes(require=target_node)
     if target_node not in nodes:
-        print(f"[ERROR] Target node {target_node} not found in registry")
+        logger.error("Target node %s not found in registry", target_node)
         return False
 
     message = Message(
@@ -117,47 +250,189 @@ def direct_message(sender_id, target_node, content):
         target_node=target_node
     )
     
-    print(f"[DEBUG] Created direct message: {message.to_json()}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Created direct message: %s", preview(message.to_json()))
     
     target_ip, target_port = nodes[target_node]
-    print(f"[INFO] Sending direct message to {target_node} at {target_ip}:{target_port}...")
+    logger.info("Sending direct message to %s at %s:%s...", target_node, target_ip, target_port)
     
-    success = send_to_node(sender_id, target_ip, target_port, message)
+    success = send_to_node(sender_id, target_ip, target_port, message, compression=compression)
     
     if success:
-        print(f"[INFO] Message successfully sent to {target_node}")
+        logger.info("Message successfully sent to %s", target_node)
     else:
-        print(f"[ERROR] Failed to send message to {target_node}")
+        logger.error("Failed to send message to %s", target_node)
     
     return success
 
-def send_image(sender_id, target_node, image_path):
-    """Send an image to a specific node"""
-    nodes = get_all_nodes()
+def send_burst(sender_id, target_node, contents, compression='auto', batch_bytes=16 * 1024,
+               batch_delay=0.005, window=64):
+    """Send many small direct messages over one coalescing connection.
+
+    Up to ``window`` messages are in flight unacknowledged; success means
+    the receiver acked every one of them.
+    """
+    nodes = get_all_nodes(require=target_node)
+    if target_node not in nodes:
+        logger.error("Target node %s not found in registry", target_node)
+        return False
+
+    target_ip, target_port = nodes[target_node]
+    start = time.time()
+    try:
+        with PeerConnection(sender_id, target_ip, target_port, compression,
+                            batch_bytes, batch_delay, window) as conn:
+            for content in contents:
+                conn.send(Message(
+                    sender_id=sender_id,
+                    message_type=MessageType.DIRECT,
+                    content=content,
+                    target_node=target_node
+                ))
+    except OSError as e:
+        logger.error("Burst to %s failed: %s", target_node, e)
+        return False
+
+    logger.info("Sent %s messages to %s in %s frames (%.3fs)",
+                conn.messages_sent, target_node, conn.frames_sent, time.time() - start)
+    if window:
+        logger.info("%s/%s acknowledged", conn.delivered, len(contents))
+        return conn.delivered == len(contents)
+    return conn.messages_sent == len(contents)
+
+def stream_frames(sender_id, target_node, source='camera', fps=10.0, duration=10.0,
+                  keyframe_interval=30, compression='auto', window=8):
+    """Stream frames from a directory (or the synthetic camera) to a node"""
+    nodes = get_all_nodes(require=target_node)
+    if target_node not in nodes:
+        logger.error("Target node %s not found in registry", target_node)
+        return False
+
+    try:
+        frames = camera_frames() if source == 'camera' else directory_frames(source)
+        target_ip, target_port = nodes[target_node]
+        with PeerConnection(sender_id, target_ip, target_port, compression, window=window) as conn:
+            streamer = FrameStreamer(sender_id, conn, frames, fps, keyframe_interval=keyframe_interval)
+            logger.info("Streaming %s to %s at %s fps for %ss...", source, target_node, fps, duration)
+            report = streamer.run(duration)
+    except (OSError, RuntimeError) as e:
+        logger.error("Stream to %s failed: %s", target_node, e)
+        return False
+
+    logger.info("Stream %s done: %s frames sent, %s dropped, %.1f fps achieved",
+                report['stream_id'], report['sent'], report['dropped'], report['achieved_fps'])
+    logger.info("Bytes/frame: %.0f avg, %.0f keyframe, %.0f delta",
+                report['bytes_per_frame'], report['bytes_per_keyframe'], report['bytes_per_delta'])
+    return report['sent'] > 0
+
+def send_image(sender_id, target_node, image_path, compression='auto', image_codec=None,
+               quality=85, max_bytes=None, max_dimension=None):
+    """Send an image to a specific node.
+
+    With ``image_codec`` set the image is transcoded before sending, see
+    ``Message.create_image_message``.
+    """
+    nodes = get_all_nodes(require=target_node)
     if target_node not in nodes:
-        print(f"[ERROR] Target node {target_node} not found in registry")
+        logger.error("Target node %s not found in registry", target_node)
         return False
 
     try:
-        message = Message.create_image_message(sender_id, image_path, target_node)
+        message = Message.create_image_message(sender_id, image_path, target_node, image_codec,
+                                               quality, max_bytes, max_dimension)
         target_ip, target_port = nodes[target_node]
         
-        print(f"[INFO] Sending image {image_path} to {target_node}...")
-        print(f"[INFO] File size: {message.file_info['size']/1024:.2f}KB")
+        logger.info("Sending image %s to %s...", image_path, target_node)
+        logger.info("File size: %.2fKB", message.file_info['size']/1024)
         
-        success = send_to_node(sender_id, target_ip, target_port, message)
+        success = send_to_node(sender_id, target_ip, target_port, message, compression=compression)
         
         if success:
-            print(f"[INFO] Image successfully sent to {target_node}")
+            logger.info("Image successfully sent to %s", target_node)
         else:
-            print(f"[ERROR] Failed to send image to {target_node}")
+            logger.error("Failed to send image to %s", target_node)
         
         return success
 
     except Exception as e:
-        print(f"[ERROR] Failed to send image: {e}")
+        logger.error("Failed to send image: %s", e)
+        return False
+
+def broadcast_image(sender_id, image_path, exclude_nodes=None, max_workers=8, peer_timeout=15.0,
+                    seed_replicas=1, compression='auto'):
+    """Distribute an image to all nodes, swarm style.
+
+    Every chunk is seeded to ``seed_replicas`` peers and the manifest is
+    announced to everyone; the nodes pull the rest from each other, so the
+    origin uploads about ``seed_replicas`` copies in total.
+    """
+    if exclude_nodes is None:
+        exclude_nodes = set()
+
+    if not os.path.exists(image_path):
+        logger.error("Image file not found: %s", image_path)
+        return False
+    if os.path.getsize(image_path) > Message.MAX_IMAGE_SIZE:
+        logger.error("Image size exceeds maximum limit of %sMB", Message.MAX_IMAGE_SIZE/1024/1024)
         return False
 
+    nodes = get_all_nodes()
+    targets = {
+        node_id: tuple(addr) for node_id, addr in nodes.items()
+        if node_id not in exclude_nodes and node_id != sender_id
+    }
+    if not targets:
+        logger.error("No nodes available for broadcast")
+        return False
+
+    manifest, chunks = split_image(image_path)
+    seeds = assign_seeds(len(chunks), list(targets), seed_replicas)
+    logger.info("Swarm broadcasting %s (%.2fKB, %s chunks) to %s nodes...",
+                image_path, manifest['size']/1024, len(chunks), len(targets))
+
+    start = time.time()
+    announce = Message(
+        sender_id=sender_id,
+        message_type=MessageType.SWARM_ANNOUNCE,
+        content="",
+        file_info={
+            'manifest': manifest,
+            'members': [[node_id, ip, port] for node_id, (ip, port) in targets.items()],
+            'seeds': seeds
+        }
+    )
+    report = fan_out_message(sender_id, targets, announce, max_workers, peer_timeout, compression)
+    success_count = print_delivery_report(report)
+
+    # Seed each peer with its share of chunks
+    def seed_peer(node_id):
+        ip, port = targets[node_id]
+        deadline = time.time() + peer_timeout
+        sent = 0
+        for index, holders in seeds.items():
+            if node_id not in holders:
+                continue
+            chunk_message = Message(
+                sender_id=sender_id,
+                message_type=MessageType.SWARM_CHUNK,
+                content=base64.b64encode(chunks[index]).decode('utf-8'),
+                target_node=node_id,
+                file_info={'content_id': manifest['content_id'], 'index': index}
+            )
+            if send_to_node(sender_id, ip, port, chunk_message, deadline=deadline,
+                            compression=compression):
+                sent += 1
+        return sent
+
+    seeded_to = [node_id for node_id, entry in report.items() if entry['success']]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets)))) as pool:
+        seeded = dict(zip(seeded_to, pool.map(seed_peer, seeded_to)))
+
+    logger.info("Swarm announce reached %s/%s nodes, seeded %s/%s chunks in %.2fs",
+                success_count, len(targets), sum(seeded.values()),
+                len(chunks) * min(seed_replicas, len(targets)), time.time() - start)
+    return success_count > 0
+
 def main():
     parser = argparse.ArgumentParser(description='Send messages or images to nodes')
     parser.add_argument('sender_id', help='ID of the sending node')
@@ -166,39 +441,94 @@ def main():
     parser.add_argument('--target', '-t', help='Target node ID for direct message')
     parser.add_argument('--message', '-m', help='Message content')
     parser.add_argument('--image', '-i', help='Path to image file to send')
+    parser.add_argument('--stream', '-s', metavar='SOURCE',
+                      help="Stream frames from a directory, or 'camera' for a synthetic feed")
+    parser.add_argument('--fps', type=float, default=10.0, help='Stream capture rate')
+    parser.add_argument('--duration', type=float, default=10.0, help='Stream length in seconds')
+    parser.add_argument('--keyframe-interval', type=int, default=30,
+                      help='Send a full keyframe every N stream frames')
     parser.add_argument('--exclude', '-e', nargs='+', help='Node IDs to exclude from broadcast')
+    parser.add_argument('--max-workers', type=int, default=8,
+                      help='Maximum concurrent sends during broadcast')
+    parser.add_argument('--peer-timeout', type=float, default=15.0,
+                      help='Per-peer delivery deadline in seconds during broadcast')
+    parser.add_argument('--overlay', choices=OVERLAY_MODES,
+                      help='Relay the broadcast through the nodes instead of sending N copies')
+    parser.add_argument('--seed-replicas', type=int, default=1,
+                      help='Peers seeded with each chunk during image broadcast')
+    parser.add_argument('--compression', '-c', default='auto',
+                      choices=['auto'] + list(CODEC_IDS),
+                      help='Frame compression codec, negotiated with the receiver')
+    parser.add_argument('--transcode', choices=list(IMAGE_CODECS),
+                      help='Re-encode the image with this codec before sending (needs Pillow)')
+    parser.add_argument('--quality', type=int, default=85, help='Transcoding quality (1-100)')
+    parser.add_argument('--max-bytes', type=int, help='Byte budget for the transcoded image')
+    parser.add_argument('--max-dimension', type=int, help='Downscale so width/height fit this size')
+    parser.add_argument('--count', type=int, default=1,
+                      help='Send the direct message this many times over one batched connection')
+    parser.add_argument('--batch-bytes', type=int, default=16 * 1024,
+                      help='Flush a batch once this many bytes are queued')
+    parser.add_argument('--batch-delay', type=float, default=0.005,
+                      help='Flush a batch once its oldest message waited this many seconds')
+    parser.add_argument('--window', type=int, default=64,
+                      help='Unacknowledged messages allowed in flight for bursts and streams (0 = no acks)')
+    parser.add_argument('--fanout', type=int, default=3,
+                      help='Children per node (tree) or peers per hop (gossip) in overlay mode')
+    parser.add_argument('--log-level', help='DEBUG, INFO, WARNING or ERROR (default: $S2S_LOG_LEVEL or INFO)')
+    parser.add_argument('--metrics', action='store_true', help='Dump counters and latency histograms on exit')
     
     args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    if not 1 <= args.quality <= 100:
+        parser.error("--quality must be between 1 and 100")
 
     if args.broadcast and args.target:
-        print("[ERROR] Cannot specify both broadcast and target node")
+        logger.error("Cannot specify both broadcast and target node")
         sys.exit(1)
 
     if not args.broadcast and not args.target:
-        print("[ERROR] Must specify either broadcast (-b) or target node (-t)")
+        logger.error("Must specify either broadcast (-b) or target node (-t)")
+        sys.exit(1)
+
+    if sum(map(bool, (args.message, args.image, args.stream))) != 1:
+        logger.error("Must specify exactly one of message (-m), image (-i) or stream (-s)")
         sys.exit(1)
 
-    if bool(args.message) == bool(args.image):
-        print("[ERROR] Must specify either message (-m) or image (-i), but not both")
+    if args.stream and args.broadcast:
+        logger.error("Streams go to a single target node")
         sys.exit(1)
 
-    print(f"[DEBUG] Starting with sender_id: {args.sender_id}")
-    print(f"[DEBUG] Message content: {args.message}")
-    print(f"[DEBUG] Target: {args.target}")
-    print(f"[DEBUG] Broadcast: {args.broadcast}")
+    logger.debug("Starting with sender_id: %s", args.sender_id)
+    logger.debug("Message content: %s", preview(args.message))
+    logger.debug("Target: %s", args.target)
+    logger.debug("Broadcast: %s", args.broadcast)
 
     success = False
-    if args.image:
-        if args.broadcast:
-            print("[ERROR] Image broadcast is not supported")
-            sys.exit(1)
-        success = send_image(args.sender_id, args.target, args.image)
+    exclude_nodes = set(args.exclude) if args.exclude else set()
+    if args.stream:
+        success = stream_frames(args.sender_id, args.target, args.stream, args.fps,
+                                args.duration, args.keyframe_interval, args.compression,
+                                args.window)
+    elif args.image and args.broadcast:
+        success = broadcast_image(args.sender_id, args.image, exclude_nodes,
+                                  args.max_workers, args.peer_timeout, args.seed_replicas,
+                                  args.compression)
+    elif args.image:
+        success = send_image(args.sender_id, args.target, args.image, args.compression,
+                             args.transcode, args.quality, args.max_bytes, args.max_dimension)
     elif args.broadcast:
-        exclude_nodes = set(args.exclude) if args.exclude else set()
-        success = broadcast_message(args.sender_id, args.message, exclude_nodes)
+        success = broadcast_message(args.sender_id, args.message, exclude_nodes,
+                                    args.max_workers, args.peer_timeout,
+                                    args.overlay, args.fanout, args.compression)
+    elif args.count > 1:
+        success = send_burst(args.sender_id, args.target, [args.message] * args.count,
+                             args.compression, args.batch_bytes, args.batch_delay, args.window)
     else:
-        success = direct_message(args.sender_id, args.target, args.message)
+        success = direct_message(args.sender_id, args.target, args.message, args.compression)
 
+    if args.metrics:
+        METRICS.dump()
     sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
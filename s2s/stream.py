@@ -0,0 +1,283 @@
+import base64
+import os
+import threading
+import time
+import uuid
+import zlib
+from typing import Iterator, Optional
+
+# Optional dependencies: numpy for frame maths, Pillow for image files
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from message import Message, MessageType
+
+KEYFRAME = 'key'
+DELTA = 'delta'
+STREAM_IDLE_TIMEOUT = 30.0  # Seconds without frames before a receiver's state is dropped
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Frame streaming requires numpy (pip install numpy)")
+
+def camera_frames(width: int = 320, height: int = 240) -> Iterator["np.ndarray"]:
+    """Synthetic camera: a static scene with one moving object"""
+    _require_numpy()
+    y, x = np.mgrid[0:height, 0:width]
+    background = np.stack([(x * 255 // width), (y * 255 // height),
+                           np.full_like(x, 96)], axis=-1).astype(np.uint8)
+    step = 0
+    while True:
+        frame = background.copy()
+        cx = (step * 4) % max(1, width - 32)
+        cy = height // 2 - 16
+        frame[cy:cy + 32, cx:cx + 32] = (255, 255, 255)
+        step += 1
+        yield frame
+
+def directory_frames(directory: str) -> Iterator["np.ndarray"]:
+    """Loop over the images in a directory, in name order"""
+    _require_numpy()
+    if Image is None:
+        raise RuntimeError("Streaming image files requires Pillow (pip install pillow)")
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))
+    )
+    if not paths:
+        raise FileNotFoundError(f"No image frames found in {directory}")
+    size = None
+    while True:
+        for path in paths:
+            image = Image.open(path).convert('RGB')
+            # Deltas need a fixed geometry; follow the first frame's size
+            size = size or image.size
+            if image.size != size:
+                image = image.resize(size)
+            yield np.asarray(image, dtype=np.uint8)
+
+class DeltaEncoder:
+    """Encode frames as periodic keyframes plus changed-block deltas"""
+
+    def __init__(self, block_size: int = 16, keyframe_interval: int = 30, threshold: int = 8):
+        _require_numpy()
+        self.block_size = block_size
+        self.keyframe_interval = keyframe_interval
+        self.threshold = threshold
+        self.reference = None
+        self.since_keyframe = 0
+
+    def encode(self, frame):
+        """Return (kind, payload bytes, extra file_info) for the next frame"""
+        if (self.reference is None or frame.shape != self.reference.shape
+                or self.since_keyframe >= self.keyframe_interval - 1):
+            self.reference = frame.copy()
+            self.since_keyframe = 0
+            return KEYFRAME, zlib.compress(frame.tobytes(), 1), {}
+
+        blocks, reference_blocks, changed = self._blocks(frame)
+        self.since_keyframe += 1
+        indices = np.flatnonzero(changed).astype('>u4')
+        block_shape = blocks.shape[2:]
+        data = blocks.reshape(-1, *block_shape)[indices]
+        # Track what the receiver will reconstruct, not the exact frame, so
+        # sub-threshold changes cannot accumulate into drift
+        flat_reference = reference_blocks.reshape(-1, *block_shape)
+        flat_reference[indices] = data
+        h, w = frame.shape[:2]
+        self.reference = _from_blocks(flat_reference.reshape(reference_blocks.shape))[:h, :w].copy()
+        payload = zlib.compress(indices.tobytes() + data.tobytes(), 1)
+        return DELTA, payload, {'num_blocks': int(len(indices))}
+
+    def _blocks(self, frame):
+        bs = self.block_size
+        h, w = frame.shape[:2]
+        rows, cols = -(-h // bs), -(-w // bs)
+        blocks = _to_blocks(_pad(frame, rows * bs, cols * bs), bs)
+        reference_blocks = _to_blocks(_pad(self.reference, rows * bs, cols * bs), bs)
+        diff = np.abs(blocks.astype(np.int16) - reference_blocks.astype(np.int16))
+        changed = diff.reshape(rows, cols, -1).max(axis=2) > self.threshold
+        return blocks, reference_blocks, changed
+
+class DeltaDecoder:
+    """Rebuild frames from DeltaEncoder output"""
+
+    def __init__(self):
+        _require_numpy()
+        self.frame = None
+
+    def decode(self, kind: str, payload: bytes, info: dict):
+        shape = tuple(info['shape'])
+        raw = zlib.decompress(payload)
+        if kind == KEYFRAME:
+            self.frame = np.frombuffer(raw, dtype=np.uint8).reshape(shape).copy()
+            return self.frame
+        if self.frame is None:
+            raise ValueError("Delta frame received before any keyframe")
+
+        bs = info['block_size']
+        h, w = shape[:2]
+        rows, cols = -(-h // bs), -(-w // bs)
+        count = info['num_blocks']
+        indices = np.frombuffer(raw[:count * 4], dtype='>u4')
+        data = np.frombuffer(raw[count * 4:], dtype=np.uint8).reshape(count, bs, bs, *shape[2:])
+        padded = _pad(self.frame, rows * bs, cols * bs)
+        blocks = _to_blocks(padded, bs).reshape(-1, bs, bs, *shape[2:])
+        blocks[indices] = data
+        self.frame = _from_blocks(blocks.reshape(rows, cols, bs, bs, *shape[2:]))[:h, :w].copy()
+        return self.frame
+
+def _pad(frame, height, width):
+    h, w = frame.shape[:2]
+    if (h, w) == (height, width):
+        return frame
+    pad = [(0, height - h), (0, width - w)] + [(0, 0)] * (frame.ndim - 2)
+    return np.pad(frame, pad, mode='edge')
+
+def _to_blocks(frame, bs):
+    h, w = frame.shape[:2]
+    rest = frame.shape[2:]
+    # (rows, bs, cols, bs, ...) -> (rows, cols, bs, bs, ...)
+    return frame.reshape(h // bs, bs, w // bs, bs, *rest).swapaxes(1, 2).copy()
+
+def _from_blocks(blocks):
+    rows, cols, bs = blocks.shape[:3]
+    rest = blocks.shape[4:]
+    return blocks.swapaxes(1, 2).reshape(rows * bs, cols * bs, *rest)
+
+class FrameStreamer:
+    """Push frames to one node, dropping stale frames when the link lags.
+
+    Capture runs at ``fps`` into a single-slot buffer; the sender always
+    takes the newest frame, so a slow link drops frames instead of queueing
+    them. Deltas are computed against the last frame actually sent.
+    """
+
+    def __init__(self, sender_id, connection, frames, fps=10.0, block_size=16,
+                 keyframe_interval=30, threshold=8):
+        self.sender_id = sender_id
+        self.connection = connection
+        self.frames = frames
+        self.fps = fps
+        self.encoder = DeltaEncoder(block_size, keyframe_interval, threshold)
+        self.stream_id = uuid.uuid4().hex[:12]
+        self._slot = None
+        self._slot_lock = threading.Condition()
+        self._running = False
+        self.stats = {'captured': 0, 'sent': 0, 'dropped': 0, 'keyframes': 0,
+                      'bytes': 0, 'key_bytes': 0, 'delta_bytes': 0}
+
+    def run(self, duration: float) -> dict:
+        self._running = True
+        capture = threading.Thread(target=self._capture_loop, daemon=True)
+        start = time.time()
+        capture.start()
+        seq = 0
+        try:
+            while time.time() - start < duration:
+                with self._slot_lock:
+                    if self._slot is None:
+                        self._slot_lock.wait(timeout=0.1)
+                    frame, self._slot = self._slot, None
+                if frame is None:
+                    continue
+                self._send_frame(seq, frame)
+                seq += 1
+        finally:
+            self._running = False
+            capture.join(timeout=1)
+        return self.report(time.time() - start)
+
+    def _capture_loop(self):
+        interval = 1.0 / self.fps
+        next_capture = time.time()
+        while self._running:
+            frame = next(self.frames)
+            with self._slot_lock:
+                if self._slot is not None:
+                    self.stats['dropped'] += 1
+                self._slot = frame
+                self.stats['captured'] += 1
+                self._slot_lock.notify()
+            next_capture += interval
+            time.sleep(max(0.0, next_capture - time.time()))
+
+    def _send_frame(self, seq, frame):
+        kind, payload, extra = self.encoder.encode(frame)
+        file_info = {
+            'stream_id': self.stream_id,
+            'seq': seq,
+            'kind': kind,
+            'shape': list(frame.shape),
+            'block_size': self.encoder.block_size,
+            'fps': self.fps
+        }
+        file_info.update(extra)
+        self.connection.send(Message(
+            sender_id=self.sender_id,
+            message_type=MessageType.STREAM_FRAME,
+            content=base64.b64encode(payload).decode('utf-8'),
+            file_info=file_info
+        ))
+        self.stats['sent'] += 1
+        self.stats['bytes'] += len(payload)
+        if kind == KEYFRAME:
+            self.stats['keyframes'] += 1
+            self.stats['key_bytes'] += len(payload)
+        else:
+            self.stats['delta_bytes'] += len(payload)
+
+    def report(self, elapsed: float) -> dict:
+        stats = dict(self.stats)
+        deltas = stats['sent'] - stats['keyframes']
+        stats.update({
+            'stream_id': self.stream_id,
+            'elapsed': elapsed,
+            'achieved_fps': stats['sent'] / elapsed if elapsed > 0 else 0.0,
+            'bytes_per_frame': stats['bytes'] / stats['sent'] if stats['sent'] else 0.0,
+            'bytes_per_keyframe': stats['key_bytes'] / stats['keyframes'] if stats['keyframes'] else 0.0,
+            'bytes_per_delta': stats['delta_bytes'] / deltas if deltas else 0.0
+        })
+        return stats
+
+class StreamReceiver:
+    """Receiver-side state for one incoming frame stream"""
+
+    def __init__(self, sender_id: str, stream_id: str):
+        self.sender_id = sender_id
+        self.stream_id = stream_id
+        self.decoder = DeltaDecoder()
+        self.frames = 0
+        self.bytes = 0
+        self.started = time.time()
+        self.last_seen = self.started
+
+    def receive(self, message):
+        self.last_seen = time.time()
+        info = message.file_info
+        payload = base64.b64decode(message.content)
+        frame = self.decoder.decode(info['kind'], payload, info)
+        self.frames += 1
+        self.bytes += len(payload)
+        return frame
+
+    def fps(self) -> float:
+        elapsed = time.time() - self.started
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+def save_frame(frame, path_stem: str) -> Optional[str]:
+    """Write a frame as PNG (with Pillow) or .npy, returning the path"""
+    if Image is not None:
+        path = f"{path_stem}.png"
+        Image.fromarray(frame).save(path)
+    else:
+        path = f"{path_stem}.npy"
+        np.save(path, frame)
+    return path
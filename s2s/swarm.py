@@ -0,0 +1,147 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Swarm image broadcast: the origin seeds each content-addressed chunk to
+# one peer and announces the manifest to everyone; peers then pull the
+# chunks they are missing from whichever peer holds them.
+
+CHUNK_SIZE = 64 * 1024
+REQUEST_TIMEOUT = 3.0     # Seconds before a chunk request is retried
+MAX_INFLIGHT = 4          # Outstanding chunk requests per transfer
+SEED_ATTEMPTS = 2         # Requests sent to the seed holder before trying random peers
+TRANSFER_TIMEOUT = 120.0  # Give up on an incomplete transfer after this long
+RETENTION = 120.0         # Keep completed chunks this long to serve other peers
+MAX_UNANNOUNCED = 16      # Transfers held open for chunks that beat their manifest
+MAX_UNVERIFIED = 64       # Chunks held per transfer until its manifest arrives
+UNANNOUNCED_TIMEOUT = 30.0  # Drop held chunks whose manifest never came
+
+def chunk_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def split_image(image_path: str, chunk_size: int = CHUNK_SIZE) -> Tuple[dict, List[bytes]]:
+    """Split an image into chunks and build its manifest"""
+    with open(image_path, 'rb') as f:
+        data = f.read()
+
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)] or [b'']
+    manifest = {
+        'content_id': chunk_hash(data),
+        'filename': os.path.basename(image_path),
+        'size': len(data),
+        'format': os.path.splitext(image_path)[1][1:].lower(),
+        'chunk_size': chunk_size,
+        'chunk_hashes': [chunk_hash(chunk) for chunk in chunks]
+    }
+    return manifest, chunks
+
+def assign_seeds(num_chunks: int, node_ids: List[str], replicas: int = 1) -> Dict[int, List[str]]:
+    """Spread chunk indexes round-robin over peers, ``replicas`` holders each"""
+    if not node_ids:
+        return {}
+    order = list(node_ids)
+    random.shuffle(order)
+    replicas = max(1, min(replicas, len(order)))
+    return {
+        index: [order[(index * replicas + r) % len(order)] for r in range(replicas)]
+        for index in range(num_chunks)
+    }
+
+class SwarmTransfer:
+    """Receiver-side state for one swarm-distributed image"""
+
+    def __init__(self, content_id: str):
+        self.content_id = content_id
+        self.origin_id: Optional[str] = None
+        self.manifest: Optional[dict] = None
+        self.members: Dict[str, Tuple[str, int]] = {}
+        self.seeds: Dict[int, List[str]] = {}
+        self.chunks: Dict[int, bytes] = {}
+        self.unverified: Dict[int, bytes] = {}  # Chunks that beat the manifest here
+        self.requested: Dict[int, float] = {}   # index -> time of last request
+        self.attempts: Dict[int, int] = {}
+        self.created = time.time()
+        self.completed = False
+        self.lock = threading.Lock()
+
+    def set_manifest(self, origin_id: str, manifest: dict, members: Dict[str, Tuple[str, int]],
+                     seeds: Dict[int, List[str]]) -> bool:
+        """Install the announced manifest; False if an earlier announce already did"""
+        with self.lock:
+            if self.manifest is not None:
+                return False
+            self.origin_id = origin_id
+            self.manifest = manifest
+            self.members = members
+            self.seeds = seeds
+            pending, self.unverified = self.unverified, {}
+        for index, data in pending.items():
+            self.add_chunk(index, data)
+        return True
+
+    def add_chunk(self, index: int, data: bytes) -> bool:
+        """Store a chunk if it matches the manifest hash"""
+        if not isinstance(index, int):
+            return False
+        with self.lock:
+            if self.manifest is None:
+                if len(self.unverified) >= MAX_UNVERIFIED and index not in self.unverified:
+                    return False
+                self.unverified[index] = data
+                return True
+            hashes = self.manifest['chunk_hashes']
+            if not 0 <= index < len(hashes) or chunk_hash(data) != hashes[index]:
+                return False
+            self.chunks[index] = data
+            self.requested.pop(index, None)
+            return True
+
+    def get_chunk(self, index: int) -> Optional[bytes]:
+        with self.lock:
+            return self.chunks.get(index)
+
+    def is_complete(self) -> bool:
+        with self.lock:
+            return self.manifest is not None and len(self.chunks) == len(self.manifest['chunk_hashes'])
+
+    def next_requests(self, self_id: str) -> List[Tuple[int, str]]:
+        """Pick (chunk index, holder) pairs to request now"""
+        now = time.time()
+        with self.lock:
+            if self.manifest is None:
+                return []
+            inflight = sum(1 for t in self.requested.values() if now - t < REQUEST_TIMEOUT)
+            picks = []
+            for index in range(len(self.manifest['chunk_hashes'])):
+                if inflight >= MAX_INFLIGHT:
+                    break
+                if index in self.chunks:
+                    continue
+                if now - self.requested.get(index, 0) < REQUEST_TIMEOUT:
+                    continue
+                holder = self._pick_holder(index, self_id)
+                if holder is None:
+                    continue
+                self.requested[index] = now
+                self.attempts[index] = self.attempts.get(index, 0) + 1
+                picks.append((index, holder))
+                inflight += 1
+            return picks
+
+    def _pick_holder(self, index: int, self_id: str) -> Optional[str]:
+        seeds = [node_id for node_id in self.seeds.get(index, []) if node_id != self_id]
+        if seeds and self.attempts.get(index, 0) < SEED_ATTEMPTS * len(seeds):
+            return seeds[self.attempts.get(index, 0) % len(seeds)]
+        # Seed holders did not answer; any peer may have pulled it by now
+        peers = [node_id for node_id in self.members if node_id != self_id]
+        return random.choice(peers) if peers else None
+
+    def assemble(self) -> bytes:
+        with self.lock:
+            data = b''.join(self.chunks[i] for i in range(len(self.manifest['chunk_hashes'])))
+        if chunk_hash(data) != self.content_id:
+            raise ValueError(f"Assembled image does not match content ID {self.content_id}")
+        return data
@@ -0,0 +1,93 @@
+import socket
+import pytest
+from connection import AckTracker, PeerConnection
+from framing import (FLAG_ACK, HEADER_SIZE, decode_ack, decode_header, encode_frame, hello_line, recv_frame,
+                     recv_line)
+from message import Message, MessageType
+from node import Node
+
+def _ack(tracker):
+    frame = tracker.ack_frame()
+    if frame is None:
+        return None
+    _, _, flags = decode_header(frame[:HEADER_SIZE])
+    assert flags == FLAG_ACK
+    return decode_ack(frame[HEADER_SIZE:])
+
+def test_in_order_sequence_advances_cumulative():
+    tracker = AckTracker()
+    for seq in (1, 2, 3):
+        tracker.record(seq)
+    assert _ack(tracker) == (3, [])
+
+def test_gaps_are_reported_selectively_then_filled():
+    tracker = AckTracker()
+    for seq in (1, 3, 5, 4):
+        tracker.record(seq)
+    assert _ack(tracker) == (1, [3, 4, 5])
+    tracker.record(2)
+    assert _ack(tracker) == (5, [])
+    assert tracker.selective == set()
+
+def test_duplicates_and_unsequenced_messages_are_ignored():
+    tracker = AckTracker()
+    tracker.record(1)
+    assert _ack(tracker) == (1, [])
+    tracker.record(1)
+    tracker.record(None)
+    assert _ack(tracker) is None  # Nothing new to acknowledge
+
+def test_selective_list_is_capped():
+    tracker = AckTracker()
+    for seq in range(2, AckTracker.MAX_SELECTIVE + 50):
+        tracker.record(seq)
+    cumulative, selective = _ack(tracker)
+    assert cumulative == 0
+    assert selective == list(range(2, AckTracker.MAX_SELECTIVE + 2))
+
+@pytest.fixture
+def node(monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    receiver = Node('receiver', '127.0.0.1', port)
+    delivered = []
+    monkeypatch.setattr(receiver, '_handle_text_message', delivered.append)
+    receiver.start()
+    yield receiver, delivered
+    receiver.stop()
+
+def _send_twice(node, message):
+    """Send one message twice on fresh connections, as a sender whose ack was lost would"""
+    for _ in range(2):
+        with socket.create_connection(('127.0.0.1', node.port), timeout=5) as sock:
+            sock.sendall(hello_line('sender', acks=True))
+            buffer = bytearray()
+            recv_line(sock, buffer)
+            sock.sendall(encode_frame(message.to_json(seq=1).encode()))
+            flags, body = recv_frame(sock, buffer)
+            assert flags & FLAG_ACK and decode_ack(body)[0] == 1
+
+def test_retried_direct_message_is_delivered_once(node):
+    receiver, delivered = node
+    _send_twice(receiver, Message('sender', MessageType.DIRECT, 'hello', target_node='receiver'))
+    assert [message.content for message in delivered] == ['hello']
+
+def test_distinct_messages_are_all_delivered(node):
+    receiver, delivered = node
+    with PeerConnection('sender', '127.0.0.1', receiver.port, window=4) as conn:
+        for i in range(3):
+            conn.send(Message('sender', MessageType.DIRECT, f"m{i}", target_node='receiver'))
+    assert conn.delivered == 3
+    assert sorted(message.content for message in delivered) == ['m0', 'm1', 'm2']
+
+def test_ack_round_trips_go_to_the_callback(node):
+    receiver, _ = node
+    samples = []
+    with PeerConnection('sender', '127.0.0.1', receiver.port, window=4,
+                        on_ack=lambda seq, rtt: samples.append((seq, rtt))) as conn:
+        for i in range(5):
+            conn.send(Message('sender', MessageType.DIRECT, f"m{i}", target_node='receiver'))
+    assert sorted(seq for seq, _ in samples) == [1, 2, 3, 4, 5]
+    assert all(rtt >= 0 for _, rtt in samples)
+    assert not hasattr(conn, 'rtt_samples')
@@ -0,0 +1,131 @@
+import io
+import socket
+import pytest
+import compression
+from compression import available_codecs, compress, decompress, negotiate_codec
+from framing import (HEADER_SIZE, codec_offer, decode_body, decode_header, encode_frame, hello_line,
+                     parse_codec_offer, parse_hello, recv_codec_offer, recv_frame, recv_line)
+
+PAYLOAD = b'satellite telemetry ' * 100
+
+@pytest.mark.parametrize('codec', available_codecs())
+def test_compress_round_trip(codec):
+    packed, used = compress(PAYLOAD, codec)
+    assert used == codec and len(packed) < len(PAYLOAD)
+    assert decompress(packed, used) == PAYLOAD
+
+def test_small_or_incompressible_payloads_stay_plain():
+    assert compress(b'tiny', 'zlib') == (b'tiny', 'none')
+    noise = bytes((i * 7919) % 251 for i in range(1000))
+    packed, used = compress(noise, 'zlib')
+    assert used in ('none', 'zlib') and decompress(packed, used) == noise
+
+def test_unknown_codecs_are_rejected():
+    with pytest.raises(ValueError):
+        compress(PAYLOAD, 'brotli')
+    with pytest.raises(ValueError):
+        decode_header(bytes([0x0F]) + (0).to_bytes(HEADER_SIZE - 1, 'big'))
+
+def test_negotiation():
+    assert negotiate_codec('none', ['zlib']) == 'none'
+    assert negotiate_codec('zlib', ['zlib']) == 'zlib'
+    assert negotiate_codec('auto', ['zlib']) == 'zlib'
+    assert negotiate_codec('auto', []) == 'none'  # Old receivers offer nothing
+    assert negotiate_codec('zstd', ['zlib']) == 'zlib'
+
+def test_negotiation_without_optional_codecs(monkeypatch):
+    monkeypatch.setattr(compression, 'zstandard', None)
+    monkeypatch.setattr(compression, 'lz4_frame', None)
+    assert available_codecs() == ['zlib']
+    assert negotiate_codec('auto', ['zstd', 'lz4', 'zlib']) == 'zlib'
+
+def test_handshake_lines():
+    assert parse_hello(hello_line('node1')) == ('node1', {})
+    assert parse_hello(hello_line('node1', acks=True)) == ('node1', {'acks': '1'})
+    assert parse_hello(b'') == ('', {})
+    assert parse_codec_offer(codec_offer(['zstd', 'zlib']).strip()) == ['zstd', 'zlib']
+    assert parse_codec_offer(b'something else') == []
+
+def test_frame_header_carries_codec_and_length():
+    frame = encode_frame(PAYLOAD, 'zlib')
+    codec, length, flags = decode_header(frame[:HEADER_SIZE])
+    assert (codec, length, flags) == ('zlib', len(frame) - HEADER_SIZE, 0)
+    assert decode_body(codec, frame[HEADER_SIZE:]) == PAYLOAD
+    # Uncompressed frames keep the original plain length prefix
+    assert encode_frame(b'hi')[:HEADER_SIZE] == (2).to_bytes(HEADER_SIZE, 'big')
+
+def test_handshake_then_frames_over_a_socket():
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        # The first frame may arrive in the same read as the hello line
+        sender.sendall(hello_line('node1') + encode_frame(PAYLOAD, 'zlib'))
+        buffer = bytearray()
+        assert parse_hello(recv_line(receiver, buffer))[0] == 'node1'
+        assert recv_frame(receiver, buffer) == (0, PAYLOAD)
+        sender.close()
+        assert recv_frame(receiver, buffer) is None
+
+def test_transcode_fits_the_byte_budget():
+    Image = pytest.importorskip('PIL.Image')
+    source = io.BytesIO()
+    Image.effect_noise((256, 256), 64).convert('RGB').save(source, format='PNG')
+    data, extension = compression.transcode_image(source.getvalue(), 'jpeg', max_bytes=8000)
+    assert extension == 'jpg' and len(data) <= 8000
+    assert Image.open(io.BytesIO(data)).format == 'JPEG'
+
+def test_codec_offer_or_legacy_silence():
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.settimeout(5.0)
+        receiver.sendall(codec_offer(['zlib']))
+        assert recv_codec_offer(sender, bytearray()) == ['zlib']
+        assert recv_codec_offer(sender, bytearray(), timeout=0.05) is None
+        assert sender.gettimeout() == 5.0
+        receiver.close()
+        with pytest.raises(ConnectionError):
+            recv_codec_offer(sender, bytearray(), timeout=0.05)
+
+def test_send_to_a_receiver_without_negotiation(monkeypatch):
+    import threading
+    import framing
+    from message import Message, MessageType
+    from send_message import send_to_node
+    monkeypatch.setattr(framing, 'OFFER_TIMEOUT', 0.1)
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    received = []
+
+    def legacy_receiver():
+        # Reads the ID line and one plain length-prefixed frame, never answers
+        conn, _ = listener.accept()
+        with conn:
+            buffer = bytearray()
+            recv_line(conn, buffer)
+            received.append(recv_frame(conn, buffer))
+    thread = threading.Thread(target=legacy_receiver)
+    thread.start()
+    message = Message('node1', MessageType.DIRECT, PAYLOAD.decode(), target_node='old')
+    with listener:
+        assert send_to_node('node1', '127.0.0.1', listener.getsockname()[1], message, retries=1)
+        thread.join(5)
+    flags, body = received[0]
+    assert flags == 0 and Message.from_json(body.decode()).content == PAYLOAD.decode()
+
+def test_transcode_rejects_bad_quality_and_huge_input(monkeypatch):
+    pytest.importorskip('PIL.Image')
+    for quality in (0, 101):
+        with pytest.raises(ValueError):
+            compression.transcode_image(b'', 'jpeg', quality)
+    monkeypatch.setattr(compression, 'MAX_TRANSCODE_INPUT', 10)
+    with pytest.raises(ValueError):
+        compression.transcode_image(b'x' * 11, 'jpeg')
+
+def test_image_message_checks_the_transcode_cap_before_reading(tmp_path, monkeypatch):
+    import message
+    path = tmp_path / 'big.png'
+    path.write_bytes(b'x' * 100)
+    monkeypatch.setattr(message, 'MAX_TRANSCODE_INPUT', 10)
+    monkeypatch.setattr('builtins.open', lambda *args, **kwargs: pytest.fail("file was read"))
+    with pytest.raises(ValueError):
+        message.Message.create_image_message('node1', str(path), 'node2', 'jpeg')
@@ -0,0 +1,58 @@
+import socket
+import threading
+import pytest
+from framing import FLAG_BATCH, HEADER_SIZE, decode_header, encode_frame, pack_batch, recv_frame, unpack_batch
+from connection import PeerConnection
+from message import Message, MessageType
+
+def test_batch_round_trip():
+    payloads = [b'', b'a', b'x' * 5000, '{"content": "é"}'.encode()]
+    assert unpack_batch(pack_batch(payloads)) == payloads
+    assert unpack_batch(b'') == []
+
+@pytest.mark.parametrize('cut', [2, 6])
+def test_truncated_batches_are_rejected(cut):
+    body = pack_batch([b'hello'])
+    with pytest.raises(ValueError):
+        unpack_batch(body[:cut])
+
+def test_batch_flag_survives_compression():
+    body = pack_batch([b'message ' * 50] * 4)
+    frame = encode_frame(body, 'zlib', FLAG_BATCH)
+    codec, length, flags = decode_header(frame[:HEADER_SIZE])
+    assert flags == FLAG_BATCH and codec == 'zlib'
+
+def _receiver(listener, frames, ready):
+    conn, _ = listener.accept()
+    with conn:
+        buffer = bytearray()
+        while b'\n' not in buffer:
+            buffer += conn.recv(1024)
+        del buffer[:buffer.index(b'\n') + 1]
+        conn.sendall(b'codecs=zlib\n')
+        ready.set()
+        while True:
+            frame = recv_frame(conn, buffer)
+            if frame is None:
+                return
+            frames.append(frame)
+
+def test_peer_connection_coalesces_small_messages():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    frames, ready = [], threading.Event()
+    thread = threading.Thread(target=_receiver, args=(listener, frames, ready), daemon=True)
+    thread.start()
+    connection = PeerConnection('sender', *listener.getsockname(), batch_bytes=1 << 20, batch_delay=10)
+    with connection:
+        for i in range(20):
+            connection.send(Message('sender', MessageType.DIRECT, f"message {i}"))
+    thread.join(5)
+    listener.close()
+
+    assert connection.messages_sent == 20 and connection.frames_sent == 1
+    (flags, body), = frames
+    assert flags == FLAG_BATCH
+    contents = [Message.from_json(payload.decode()).content for payload in unpack_batch(body)]
+    assert contents == [f"message {i}" for i in range(20)]
@@ -0,0 +1,72 @@
+import math
+import random
+from geo_index import GeoIndex, position_to_ecef
+
+def _brute_nearest(points, point, k):
+    return sorted(((node_id, math.dist(point, other)) for node_id, other in points.items()),
+                  key=lambda hit: hit[1])[:k]
+
+def _random_point(rng):
+    return position_to_ecef({'lat': rng.uniform(-90, 90), 'lon': rng.uniform(-180, 180),
+                             'alt': rng.choice([0.0, 550.0, 1200.0])})
+
+def _bounds(index):
+    return [index._bounds(axis) for axis in range(3)]
+
+def _scanned_bounds(index):
+    return [(min(cell[axis] for cell in index._cells), max(cell[axis] for cell in index._cells))
+            for axis in range(3)]
+
+def test_position_to_ecef():
+    assert position_to_ecef({'lat': 0, 'lon': 0}) == (6378.0, 0.0, 0.0)
+    assert position_to_ecef({'ecef': [1, 2, 3]}) == (1.0, 2.0, 3.0)
+
+def test_nearest_and_within_match_brute_force():
+    rng = random.Random(43)
+    index = GeoIndex()
+    points = {}
+    for i in range(300):
+        points[f'n{i}'] = _random_point(rng)
+        index.update(f'n{i}', points[f'n{i}'])
+    for _ in range(50):
+        query = _random_point(rng)
+        expected = _brute_nearest(points, query, 5)
+        got = index.nearest(query, k=5)
+        assert [round(d, 6) for _, d in got] == [round(d, 6) for _, d in expected]
+        radius = rng.uniform(100, 3000)
+        assert sorted(node_id for node_id, _ in index.within(query, radius)) == \
+            sorted(node_id for node_id, d in _brute_nearest(points, query, len(points)) if d <= radius)
+
+def test_bounds_follow_updates_and_removals():
+    rng = random.Random(7)
+    index = GeoIndex()
+    points = {}
+    for step in range(2000):
+        node_id = f'n{rng.randrange(60)}'
+        if node_id in points and rng.random() < 0.4:
+            index.remove(node_id)
+            del points[node_id]
+        else:
+            points[node_id] = _random_point(rng)
+            index.update(node_id, points[node_id])
+        if points:
+            assert _bounds(index) == _scanned_bounds(index)
+            if step % 100 == 0:
+                query = _random_point(rng)
+                assert [round(d, 6) for _, d in index.nearest(query, k=3)] == \
+                    [round(d, 6) for _, d in _brute_nearest(points, query, 3)]
+        else:
+            assert _bounds(index) == [None, None, None]
+    assert len(index) == len(points)
+
+def test_remove_and_empty_index():
+    index = GeoIndex()
+    index.update('a', (0.0, 0.0, 0.0))
+    index.update('b', (5000.0, 0.0, 0.0))
+    assert index.nearest((4000.0, 0.0, 0.0)) == [('b', 1000.0)]
+    index.remove('b')
+    assert 'b' not in index
+    assert index.nearest((4000.0, 0.0, 0.0)) == [('a', 4000.0)]
+    assert _bounds(index) == [(0, 0)] * 3
+    index.remove('a')
+    assert index.nearest((0.0, 0.0, 0.0)) == []
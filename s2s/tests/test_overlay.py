@@ -0,0 +1,117 @@
+import random
+import pytest
+from overlay import OVERLAY_MODES, build_overlay, fallback_targets, origin_address, relay_targets
+
+NODES = {f"node{i}": ('127.0.0.1', 9000 + i) for i in range(20)}
+
+def _delivered(overlay):
+    """Every node an overlay broadcast reaches through its relays"""
+    origin = overlay['members'][0][0]
+    reached, queue = {origin}, [origin]
+    while queue:
+        for target in relay_targets(overlay, queue.pop()):
+            if target not in reached:
+                reached.add(target)
+                queue.append(target)
+    return reached
+
+def test_origin_comes_first_and_only_once():
+    overlay = build_overlay('node0', NODES, origin_addr=('127.0.0.1', 9000))
+    ids = [member[0] for member in overlay['members']]
+    assert ids[0] == 'node0'
+    assert sorted(ids) == sorted(NODES)
+
+@pytest.mark.parametrize('fanout', [1, 2, 3, 7])
+def test_tree_reaches_every_member_exactly_once(fanout):
+    overlay = build_overlay('node0', NODES, 'tree', fanout)
+    children = [target for node_id in NODES for target in relay_targets(overlay, node_id)]
+    assert sorted(children) == sorted(set(NODES) - {'node0'})
+    assert all(len(relay_targets(overlay, node_id)) <= fanout for node_id in NODES)
+
+def test_tree_targets_carry_addresses():
+    overlay = build_overlay('node0', NODES, 'tree', 3)
+    for node_id, address in relay_targets(overlay, 'node0').items():
+        assert address == NODES[node_id]
+
+def test_gossip_never_targets_origin_or_self():
+    overlay = build_overlay('node0', NODES, 'gossip', 4)
+    for node_id in NODES:
+        targets = relay_targets(overlay, node_id)
+        assert len(targets) == 4
+        assert 'node0' not in targets and node_id not in targets
+
+def test_gossip_with_full_fanout_reaches_everyone():
+    overlay = build_overlay('node0', NODES, 'gossip', len(NODES))
+    assert _delivered(overlay) == set(NODES)
+
+def test_unknown_node_relays_nothing():
+    overlay = build_overlay('node0', NODES)
+    assert relay_targets(overlay, 'stranger') == {}
+    assert relay_targets({}, 'node0') == {}
+
+def test_bad_parameters_are_rejected():
+    with pytest.raises(ValueError):
+        build_overlay('node0', NODES, 'flood')
+    with pytest.raises(ValueError):
+        build_overlay('node0', NODES, 'tree', 0)
+
+def _simulate(overlay, dead=(), seed=0):
+    """Run an overlay broadcast over Node's relay bookkeeping, delivering copies in random order"""
+    from message import Message, MessageType
+    from node import Node
+    rng = random.Random(seed)
+    random.seed(seed)
+    nodes = {node_id: Node(node_id, '127.0.0.1', 0) for node_id in NODES}
+    origin = overlay['members'][0][0]
+    reached, pending, undelivered = set(), [], []
+
+    def relay(sender, targets, seen):
+        while targets:
+            copy = dict(overlay, seen=sorted(seen)) if overlay['mode'] == 'gossip' else overlay
+            failed = [node_id for node_id in targets if node_id in dead]
+            pending.extend((node_id, copy) for node_id in targets if node_id not in dead)
+            undelivered.extend(failed)
+            targets = fallback_targets(overlay, failed, seen)
+            seen.update(targets)
+
+    first_hop = relay_targets(overlay, origin, seen=())
+    relay(origin, first_hop, {origin, *first_hop})
+    while pending:
+        node_id, copy = pending.pop(rng.randrange(len(pending)))
+        message = Message(origin, MessageType.BROADCAST, 'hi', message_id='m1', overlay=copy)
+        first, targets, seen = nodes[node_id]._record_broadcast(message)
+        if first:
+            reached.add(node_id)
+        if targets:
+            relay(node_id, targets, seen)
+    return reached, undelivered
+
+@pytest.mark.parametrize('fanout', [1, 2, 3])
+@pytest.mark.parametrize('seed', range(10))
+def test_gossip_rounds_reach_every_member(fanout, seed):
+    overlay = build_overlay('node0', NODES, 'gossip', fanout)
+    reached, undelivered = _simulate(overlay, seed=seed)
+    assert reached == set(NODES) - {'node0'} and not undelivered
+
+@pytest.mark.parametrize('mode', OVERLAY_MODES)
+@pytest.mark.parametrize('seed', range(5))
+def test_relays_stand_in_for_dead_members(mode, seed):
+    random.seed(seed)
+    overlay = build_overlay('node0', NODES, mode, 2)
+    dead = {member[0] for member in overlay['members'][1:6]}  # The first hop and its children
+    reached, undelivered = _simulate(overlay, dead, seed)
+    assert reached == set(NODES) - dead - {'node0'}
+    if mode == 'tree':
+        assert sorted(undelivered) == sorted(dead)
+    else:  # Nodes that had not heard of a failure may try the same dead member
+        assert set(undelivered) == dead
+
+def test_tree_fallback_is_the_failed_childs_children():
+    overlay = build_overlay('node0', NODES, 'tree', 3)
+    child = next(iter(relay_targets(overlay, 'node0')))
+    assert fallback_targets(overlay, [child], set()) == relay_targets(overlay, child)
+    assert fallback_targets(overlay, [], set()) == {}
+
+def test_origin_address():
+    assert origin_address(build_overlay('node0', NODES, origin_addr=('10.0.0.1', 9000))) == ('10.0.0.1', 9000)
+    assert origin_address(build_overlay('node0', NODES)) is None
@@ -0,0 +1,87 @@
+import time
+from registry_client import RegistryClient
+from test_registry_cluster import _free_port, _start
+
+def _restart(registry, client, data_dir=None):
+    """Replace ``registry`` with a new incarnation that ``client`` talks to"""
+    registry.stop()
+    registry = _start(_free_port(), data_dir)
+    client.registry_port = registry.port
+    return registry
+
+def _register(port, *node_ids):
+    """A client holding registrations of ``node_ids``; closing it unregisters them"""
+    client = RegistryClient('127.0.0.1', port, timeout=0.5, retries=3)
+    for i, node_id in enumerate(node_ids):
+        assert client.register_node(node_id, 9001 + i)
+    return client
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+def test_restart_at_same_version_forces_resync():
+    port = _free_port()
+    registry = _start(port)
+    owners = [_register(port, 'sat1', 'sat2')]
+    client = RegistryClient('127.0.0.1', port, timeout=0.5, retries=3)
+    try:
+        assert set(client.sync_nodes()) == {'sat1', 'sat2'}
+        old_epoch = client._epoch
+
+        # A fresh registry that happens to reach the same version number
+        registry = _restart(registry, client)
+        owners.append(_register(registry.port, 'sat3', 'sat4'))
+        assert registry.version == client.version
+        assert set(client.sync_nodes()) == {'sat3', 'sat4'}
+        assert client._epoch == registry.epoch != old_epoch
+    finally:
+        for owner in [client] + owners:
+            owner.close()
+        registry.stop()
+
+def test_subscriber_resyncs_when_epoch_changes():
+    port = _free_port()
+    registry = _start(port)
+    owners = [_register(port, 'sat1', 'sat2')]
+    client = RegistryClient('127.0.0.1', port, timeout=0.5, retries=3)
+    resyncs = []
+    try:
+        assert client.subscribe(lambda change: change is None and resyncs.append(change), lease=1.0)
+        registry = _restart(registry, client)
+        owners.append(_register(registry.port, 'sat3', 'sat4'))
+        # The next lease renewal reports the new epoch
+        assert _wait_for(lambda: set(client.local_nodes()) == {'sat3', 'sat4'})
+        assert resyncs
+    finally:
+        for owner in [client] + owners:
+            owner.close()
+        registry.stop()
+
+def test_epoch_survives_restart_with_data_dir(tmp_path):
+    port = _free_port()
+    registry = _start(port, str(tmp_path))
+    owner = _register(port, 'sat1')
+    epoch, version = registry.epoch, registry.version
+    registry.stop()
+    owner.close()
+
+    registry = _start(_free_port(), str(tmp_path))
+    try:
+        assert registry.epoch == epoch and registry.version == version > 0
+    finally:
+        registry.stop()
+
+def test_explicit_zero_retries_is_not_replaced_by_the_default():
+    client = RegistryClient('127.0.0.1', _free_port(), timeout=0.2, retries=5)
+    sent = []
+    transmit = client._transmit
+    client._transmit = lambda payload: (sent.append(payload), transmit(payload))
+    try:
+        started = time.time()
+        assert client.submit({'command': 'get_nodes'}, retries=0).result() is None
+        assert len(sent) == 1 and time.time() - started < 1.0
+    finally:
+        client.close()
@@ -0,0 +1,93 @@
+import socket
+import threading
+import time
+import pytest
+from registry_cluster import ClusterRegistryClient, HashRing
+from registry_server import UDPRegistry
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _start(port, data_dir=None):
+    registry = UDPRegistry('127.0.0.1', port, data_dir=data_dir)
+    threading.Thread(target=registry.start, daemon=True).start()
+    deadline = time.time() + 5
+    while not registry.is_running and time.time() < deadline:
+        time.sleep(0.01)
+    return registry
+
+@pytest.fixture
+def registry():
+    registry = _start(_free_port())
+    yield f"127.0.0.1:{registry.port}"
+    registry.stop()
+
+def test_ring_holders_are_distinct_and_stable():
+    members = ['10.0.0.1:5000', '10.0.0.2:5000', '10.0.0.3:5000']
+    ring = HashRing(members)
+    for key in ('sat1', 'sat2', 'ground7'):
+        holders = ring.holders(key, 2)
+        assert len(set(holders)) == 2 and set(holders) <= set(members)
+        assert HashRing(list(reversed(members))).holders(key, 2) == holders
+        assert ring.primary(key) == holders[0]
+    assert ring.holders('sat1', 10) == ring.holders('sat1', 3)
+
+def test_ring_spreads_keys():
+    ring = HashRing([f"10.0.0.{i}:5000" for i in range(4)])
+    counts = {}
+    for i in range(4000):
+        primary = ring.primary(f"node{i}")
+        counts[primary] = counts.get(primary, 0) + 1
+    assert min(counts.values()) > 500
+
+def test_reads_skip_a_dead_instance_after_it_fails_once(registry):
+    dead = f"127.0.0.1:{_free_port()}"
+    client = ClusterRegistryClient([registry, dead], timeout=0.3, retries=1)
+    try:
+        live = client.clients[registry]
+        assert live.register_node('sat1', 9001)
+
+        started = time.time()
+        assert client.sync_nodes() == {'sat1': ('127.0.0.1', 9001)}
+        assert time.time() - started >= 0.3  # Found out the hard way
+
+        started = time.time()
+        assert client.get_nodes() == {'sat1': ('127.0.0.1', 9001)}
+        assert client.nearest_nodes({'lat': 0, 'lon': 0}) == []
+        assert time.time() - started < 0.3
+    finally:
+        client.close()
+
+def test_all_suspect_instances_are_still_tried(registry):
+    client = ClusterRegistryClient([registry], timeout=0.3, retries=1)
+    try:
+        client._suspects[registry] = time.time() + 60
+        assert client.sync_nodes() == {}
+        assert not client._is_suspect(registry)
+    finally:
+        client.close()
+
+def test_each_shard_is_read_from_one_replica():
+    registries = [_start(_free_port()) for _ in range(2)]
+    members = [f"127.0.0.1:{registry.port}" for registry in registries]
+    client = ClusterRegistryClient(members, timeout=0.3, retries=1)
+    try:
+        assert client.register_node('sat1', 9001)
+        primary = client.ring.primary('sat1')
+        follower, = set(members) - {primary}
+        # A copy the primary no longer has, e.g. it was evicted there first
+        assert client.clients[primary].unregister_node('sat1')
+        assert client.sync_nodes() == {}
+        assert client.local_nodes() == {}
+
+        # With the primary gone the follower's copy is what there is
+        registries[members.index(primary)].stop()
+        client.sync_nodes()
+        assert client.sync_nodes() == {'sat1': ('127.0.0.1', 9001)}
+        assert client._is_suspect(primary) and not client._is_suspect(follower)
+    finally:
+        client.close()
+        for registry in registries:
+            registry.stop()
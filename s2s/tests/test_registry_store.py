@@ -0,0 +1,99 @@
+import json
+import os
+from registry_store import PREVIOUS_WAL_FILE, SNAPSHOT_FILE, WAL_FILE, MembershipStore
+
+def _join(version, node_id):
+    return {'version': version, 'op': 'join', 'node_id': node_id, 'address': ['10.0.0.1', 9000 + version]}
+
+def _restart(directory):
+    """A fresh store over the same directory, as after a crash"""
+    store = MembershipStore(str(directory))
+    nodes, version, replayed = store.load()
+    store.open()
+    return store, nodes, version, replayed
+
+def test_empty_directory(tmp_path):
+    store, nodes, version, replayed = _restart(tmp_path)
+    assert (nodes, version, replayed) == ({}, 0, [])
+    store.close()
+
+def test_snapshot_plus_log(tmp_path):
+    store, *_ = _restart(tmp_path)
+    store.append(_join(1, 'a'))
+    store.append(_join(2, 'b'))
+    store.rotate()
+    store.write_snapshot({'a': ('10.0.0.1', 9001), 'b': ('10.0.0.1', 9002)}, 2)
+    store.append({'version': 3, 'op': 'leave', 'node_id': 'a'})
+    store.close()
+    assert not os.path.exists(tmp_path / PREVIOUS_WAL_FILE)
+
+    store, nodes, version, replayed = _restart(tmp_path)
+    assert nodes == {'b': ('10.0.0.1', 9002)} and version == 3
+    assert [change['version'] for change in replayed] == [3]
+    store.close()
+
+def test_repeated_crashes_between_rotate_and_snapshot_lose_nothing(tmp_path):
+    store, *_ = _restart(tmp_path)
+    store.append(_join(1, 'a'))
+    store.append(_join(2, 'b'))
+    store.rotate()
+    store.write_snapshot({'a': ('10.0.0.1', 9001), 'b': ('10.0.0.1', 9002)}, 2)
+    store.append(_join(3, 'c'))
+    store.rotate()  # Crash before the snapshot is written
+    store.close()
+
+    store, nodes, version, _ = _restart(tmp_path)
+    assert set(nodes) == {'a', 'b', 'c'} and version == 3
+    store.append(_join(4, 'd'))
+    store.rotate()  # And again
+    store.close()
+
+    store, nodes, version, replayed = _restart(tmp_path)
+    assert set(nodes) == {'a', 'b', 'c', 'd'} and version == 4
+    assert [change['version'] for change in replayed] == [3, 4]
+    store.rotate()
+    store.write_snapshot(nodes, version)
+    store.close()
+    assert not os.path.exists(tmp_path / PREVIOUS_WAL_FILE)
+    with open(tmp_path / SNAPSHOT_FILE) as f:
+        assert json.load(f)['version'] == 4
+
+def test_torn_last_record_is_ignored(tmp_path):
+    store, *_ = _restart(tmp_path)
+    store.append(_join(1, 'a'))
+    store.close()
+    with open(tmp_path / WAL_FILE, 'a') as f:
+        f.write('{"version": 2, "op": "jo')
+
+    store, nodes, version, _ = _restart(tmp_path)
+    assert set(nodes) == {'a'} and version == 1
+    assert store.is_open()
+    store.close()
+    assert not store.is_open()
+
+def test_stop_while_changes_are_recorded(tmp_path):
+    import threading
+    from test_registry_cluster import _free_port, _start
+    registry = _start(_free_port(), str(tmp_path))
+    errors = []
+    def churn():
+        for i in range(5000):
+            with registry.lock:
+                registry.nodes[f"n{i}"] = ('10.0.0.1', 9000)
+                try:
+                    registry._record_change('join', f"n{i}", ('10.0.0.1', 9000))
+                except Exception as e:
+                    errors.append(e)
+                    return
+    writer = threading.Thread(target=churn)
+    writer.start()
+    registry.stop()
+    writer.join()
+    assert errors == []
+
+    # Stopping released the port and left a snapshot that replays cleanly
+    registry = _start(registry.port, str(tmp_path))
+    try:
+        assert registry.is_running and registry.version > 0
+    finally:
+        registry.stop()
@@ -0,0 +1,104 @@
+import json
+import socket
+import threading
+import time
+from metrics import METRICS
+from registry_client import RegistryClient
+from registry_server import UDPRegistry
+from registry_store import LogFollower, MembershipStore
+from registry_worker import RegistryWorker
+from test_registry_cluster import _free_port
+from test_registry_store import _join
+
+def test_log_follower_reads_across_rotations(tmp_path):
+    store = MembershipStore(str(tmp_path))
+    store.load()
+    store.open()
+    follower = LogFollower(str(tmp_path))
+    follower.open()
+    store.append(_join(1, 'a'))
+    assert [change['version'] for change in follower.read()] == [1]
+    assert follower.read() == []
+
+    store.append(_join(2, 'b'))
+    store.rotate()
+    store.append(_join(3, 'c'))
+    assert [change['version'] for change in follower.read()] == [2, 3]
+    store.append(_join(4, 'd'))
+    store.rotate()  # No snapshot in between: the logs are merged into wal.prev
+    store.append(_join(5, 'e'))
+    assert [change['version'] for change in follower.read()] == [4, 5]
+    follower.close()
+    store.close()
+
+def test_worker_reloads_after_missing_a_rotated_log(tmp_path):
+    store = MembershipStore(str(tmp_path))
+    store.load()
+    store.open()
+    store.append(_join(1, 'a'))
+    store.rotate()
+    store.write_snapshot({'a': ('10.0.0.1', 9001)}, 1, 'e1')
+    worker = RegistryWorker('127.0.0.1', 0, str(tmp_path), '127.0.0.1:1')
+    with worker.lock:
+        worker._load()
+    assert worker.version == 1
+
+    # Two snapshots before the worker looks again: the log holding 2 is gone
+    nodes = {'a': ('10.0.0.1', 9001)}
+    for version, node_id in ((2, 'b'), (3, 'c')):
+        change = _join(version, node_id)
+        store.append(change)
+        nodes[node_id] = tuple(change['address'])
+        store.rotate()
+        store.write_snapshot(nodes, version, 'e1')
+    store.append(_join(4, 'd'))
+    worker._catch_up()
+    assert worker.version == 4 and set(worker.nodes) == {'a', 'b', 'c', 'd'}
+    assert [change['version'] for change in worker.changelog][-1] == 4
+    worker.stop()
+    store.close()
+
+def _ask(request, port):
+    """Send from a fresh socket, so requests spread over the port's processes"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(2)
+        sock.sendto(json.dumps(request).encode(), ('127.0.0.1', port))
+        return json.loads(sock.recvfrom(65535)[0])
+
+def test_workers_share_one_membership():
+    registry = UDPRegistry('127.0.0.1', _free_port(), workers=2)
+    threading.Thread(target=registry.start, daemon=True).start()
+    owners = []
+    try:
+        # Wait for the worker to take a share of the requests
+        deadline = time.time() + 10
+        while not registry.is_running and time.time() < deadline:
+            time.sleep(0.01)
+        while time.time() < deadline:
+            before = METRICS.counters.get('requests.get_changes', 0)
+            for _ in range(16):
+                assert _ask({'command': 'get_changes', 'since': 0}, registry.port)['status'] == 'success'
+            if METRICS.counters.get('requests.get_changes', 0) - before < 16:
+                break
+            time.sleep(0.2)
+        else:
+            raise AssertionError("No request reached the worker")
+
+        for i in range(8):
+            owner = RegistryClient('127.0.0.1', registry.port, timeout=0.5, retries=3)
+            assert owner.register_node(f'sat{i}', 9000 + i)
+            owners.append(owner)
+            # Whichever process answers has the registration already
+            reply = _ask({'command': 'get_changes', 'since': 0}, registry.port)
+            assert reply['epoch'] == registry.epoch and reply['version'] == registry.version
+            assert _ask({'command': 'heartbeat', 'node_id': f'sat{i}'}, registry.port)['status'] == 'success'
+        assert _ask({'command': 'heartbeat', 'node_id': 'ghost'}, registry.port)['unknown_nodes'] == ['ghost']
+
+        client = RegistryClient('127.0.0.1', registry.port, timeout=0.5, retries=3)
+        assert set(client.sync_nodes()) == {f'sat{i}' for i in range(8)}
+        client.close()
+    finally:
+        for owner in owners:
+            owner.close()
+        registry.stop()
+    assert all(process.poll() is not None for process in registry._worker_processes)
@@ -0,0 +1,83 @@
+import base64
+import itertools
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import node
+from message import Message, MessageType
+from stream import DELTA, KEYFRAME, DeltaDecoder, DeltaEncoder, StreamReceiver, camera_frames
+
+def _decode(encoder, decoder, frame):
+    kind, payload, extra = encoder.encode(frame)
+    info = dict(extra, shape=list(frame.shape), block_size=encoder.block_size)
+    return kind, decoder.decode(kind, payload, info)
+
+def test_lossless_with_zero_threshold():
+    encoder, decoder = DeltaEncoder(block_size=16, threshold=0), DeltaDecoder()
+    kinds = []
+    for frame in itertools.islice(camera_frames(100, 70), 12):  # Not a multiple of the block size
+        kind, decoded = _decode(encoder, decoder, frame)
+        kinds.append(kind)
+        assert np.array_equal(decoded, frame)
+    assert kinds[0] == KEYFRAME and set(kinds[1:]) == {DELTA}
+
+def test_deltas_only_carry_changed_blocks():
+    encoder = DeltaEncoder(block_size=16)
+    frames = camera_frames(320, 240)
+    encoder.encode(next(frames))
+    kind, _, extra = encoder.encode(next(frames))
+    assert kind == DELTA
+    assert 0 < extra['num_blocks'] < (320 // 16) * (240 // 16) // 10
+
+def test_noise_under_threshold_does_not_drift():
+    rng = np.random.default_rng(0)
+    encoder, decoder = DeltaEncoder(threshold=8, keyframe_interval=1000), DeltaDecoder()
+    base = next(camera_frames(64, 64)).astype(np.int16)
+    for _ in range(50):
+        frame = np.clip(base + rng.integers(-4, 5, base.shape), 0, 255).astype(np.uint8)
+        _, decoded = _decode(encoder, decoder, frame)
+        assert np.abs(decoded.astype(np.int16) - frame).max() <= 8
+
+def test_keyframe_interval_and_shape_change():
+    encoder, decoder = DeltaEncoder(keyframe_interval=3), DeltaDecoder()
+    frames = camera_frames(64, 48)
+    kinds = [_decode(encoder, decoder, next(frames))[0] for _ in range(6)]
+    assert kinds == [KEYFRAME, DELTA, DELTA] * 2
+    resized = next(camera_frames(32, 32))
+    assert _decode(encoder, decoder, resized)[0] == KEYFRAME
+
+def test_delta_before_keyframe_is_rejected():
+    encoder = DeltaEncoder()
+    frames = camera_frames(32, 32)
+    encoder.encode(next(frames))
+    kind, payload, extra = encoder.encode(next(frames))
+    with pytest.raises(ValueError):
+        DeltaDecoder().decode(kind, payload, dict(extra, shape=[32, 32, 3], block_size=16))
+
+def _frame_message(sender_id, stream_id, kind, payload, shape):
+    return Message(sender_id, MessageType.STREAM_FRAME, base64.b64encode(payload).decode(),
+                   file_info={'stream_id': stream_id, 'seq': 0, 'kind': kind, 'shape': shape,
+                              'block_size': 16})
+
+def test_node_drops_idle_streams(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(node, 'STREAM_IDLE_TIMEOUT', 0.0)
+    receiver = node.Node('me', '127.0.0.1', 0)
+    frame = next(camera_frames(32, 32))
+    kind, payload, _ = DeltaEncoder().encode(frame)
+    receiver._handle_stream_frame(_frame_message('camera1', 'a', kind, payload, list(frame.shape)))
+    assert list(receiver._streams) == [('camera1', 'a')]
+
+    receiver._next_stream_sweep = 0.0
+    receiver._handle_stream_frame(_frame_message('camera2', 'b', kind, payload, list(frame.shape)))
+    assert list(receiver._streams) == [('camera2', 'b')]
+
+def test_stream_receiver_counts_frames():
+    frame = next(camera_frames(32, 32))
+    kind, payload, _ = DeltaEncoder().encode(frame)
+    receiver = StreamReceiver('camera1', 'a')
+    decoded = receiver.receive(_frame_message('camera1', 'a', kind, payload, list(frame.shape)))
+    assert np.array_equal(decoded, frame)
+    assert receiver.frames == 1 and receiver.bytes == len(payload)
+    assert receiver.last_seen >= receiver.started
@@ -0,0 +1,128 @@
+import base64
+import time
+import pytest
+import node
+import swarm
+from message import Message, MessageType
+from swarm import SwarmTransfer, assign_seeds, chunk_hash, split_image
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / 'picture.png'
+    path.write_bytes(bytes(range(256)) * 40)
+    return str(path)
+
+def _transfer(image, chunk_size=1000):
+    manifest, chunks = split_image(image, chunk_size)
+    transfer = SwarmTransfer(manifest['content_id'])
+    return transfer, manifest, chunks
+
+def test_split_image_manifest(image):
+    manifest, chunks = split_image(image, 1000)
+    assert len(chunks) == 11 and len(chunks[-1]) == 240
+    assert manifest['size'] == 10240 and manifest['format'] == 'png'
+    assert manifest['content_id'] == chunk_hash(b''.join(chunks))
+    assert manifest['chunk_hashes'] == [chunk_hash(chunk) for chunk in chunks]
+
+def test_verified_chunks_assemble(image):
+    transfer, manifest, chunks = _transfer(image)
+    transfer.set_manifest('origin', manifest, {}, {})
+    for index in reversed(range(len(chunks))):
+        assert transfer.add_chunk(index, chunks[index])
+    assert transfer.is_complete()
+    assert transfer.assemble() == b''.join(chunks)
+
+def test_corrupt_and_out_of_range_chunks_are_rejected(image):
+    transfer, manifest, chunks = _transfer(image)
+    transfer.set_manifest('origin', manifest, {}, {})
+    assert not transfer.add_chunk(0, chunks[1])
+    assert not transfer.add_chunk(len(chunks), chunks[0])
+    assert not transfer.add_chunk(-1, chunks[0])
+    assert not transfer.add_chunk(None, chunks[0])
+    assert transfer.get_chunk(0) is None
+
+def test_early_chunks_are_verified_when_the_manifest_arrives(image):
+    transfer, manifest, chunks = _transfer(image)
+    assert transfer.add_chunk(0, chunks[0])
+    assert transfer.add_chunk(1, b'forged')
+    transfer.set_manifest('origin', manifest, {}, {})
+    assert transfer.get_chunk(0) == chunks[0]
+    assert transfer.get_chunk(1) is None
+    assert not transfer.unverified
+
+def test_early_chunks_are_capped(image):
+    transfer, _, chunks = _transfer(image)
+    for index in range(swarm.MAX_UNVERIFIED):
+        assert transfer.add_chunk(index, chunks[0])
+    assert not transfer.add_chunk(swarm.MAX_UNVERIFIED, chunks[0])
+    assert transfer.add_chunk(0, chunks[0])  # Replacing a held chunk is fine
+    assert len(transfer.unverified) == swarm.MAX_UNVERIFIED
+
+def test_assemble_checks_the_content_id(image):
+    transfer, manifest, chunks = _transfer(image)
+    manifest = dict(manifest, chunk_hashes=[chunk_hash(b'x')] + manifest['chunk_hashes'][1:])
+    transfer.set_manifest('origin', manifest, {}, {})
+    transfer.add_chunk(0, b'x')
+    for index in range(1, len(chunks)):
+        transfer.add_chunk(index, chunks[index])
+    with pytest.raises(ValueError):
+        transfer.assemble()
+
+def test_requests_go_to_seeds_then_any_peer(image, monkeypatch):
+    transfer, manifest, chunks = _transfer(image)
+    members = {'me': ('h', 1), 'a': ('h', 2), 'b': ('h', 3)}
+    transfer.set_manifest('origin', manifest, members, {0: ['a']})
+    monkeypatch.setattr(swarm, 'REQUEST_TIMEOUT', 0)
+    holders = []
+    for _ in range(swarm.SEED_ATTEMPTS + 1):
+        holders.append(dict(transfer.next_requests('me'))[0])
+    assert holders[:swarm.SEED_ATTEMPTS] == ['a'] * swarm.SEED_ATTEMPTS
+    assert holders[-1] in ('a', 'b')
+
+def test_assign_seeds_spreads_replicas():
+    seeds = assign_seeds(10, ['a', 'b', 'c'], replicas=2)
+    assert sorted(seeds) == list(range(10))
+    assert all(len(set(holders)) == 2 for holders in seeds.values())
+    assert assign_seeds(3, []) == {}
+
+def _chunk_message(content_id, index=0, data=b'chunk'):
+    return Message('peer', MessageType.SWARM_CHUNK, base64.b64encode(data).decode(),
+                   file_info={'content_id': content_id, 'index': index})
+
+def test_node_caps_and_expires_unannounced_transfers(monkeypatch):
+    monkeypatch.setattr(node, 'UNANNOUNCED_TIMEOUT', 0.05)
+    receiver = node.Node('me', '127.0.0.1', 0)
+    receiver._handle_swarm_chunk(_chunk_message(None))
+    for i in range(swarm.MAX_UNANNOUNCED + 5):
+        receiver._handle_swarm_chunk(_chunk_message(f"content{i}"))
+    assert len(receiver._swarms) == swarm.MAX_UNANNOUNCED
+    assert None not in receiver._swarms
+
+    time.sleep(0.3)
+    assert receiver._swarms == {}
+
+def test_only_the_first_manifest_is_installed(image):
+    transfer, manifest, _ = _transfer(image)
+    assert transfer.set_manifest('origin', manifest, {}, {})
+    assert not transfer.set_manifest('other', dict(manifest, filename='x.png'), {}, {})
+    assert transfer.origin_id == 'origin'
+
+def test_concurrent_announces_start_one_fetch_loop(image, monkeypatch):
+    import threading
+    manifest, _ = split_image(image, 1000)
+    receiver = node.Node('me', '127.0.0.1', 0)
+    started = []
+    monkeypatch.setattr(receiver, '_swarm_fetch_loop', lambda transfer: started.append(transfer))
+    announce = Message('origin', MessageType.SWARM_ANNOUNCE, '',
+                       file_info={'manifest': manifest, 'members': [], 'seeds': {}})
+    barrier = threading.Barrier(8)
+
+    def deliver():
+        barrier.wait()
+        receiver._handle_swarm_announce(announce)
+    threads = [threading.Thread(target=deliver) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(started) == 1
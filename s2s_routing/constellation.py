@@ -0,0 +1,194 @@
+import argparse
+import logging
+import os
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+# Shared constellation state: one writer process propagates every satellite
+# and computes the routing tables once per tick, and publishes positions and
+# next hops into a shared memory block that every satellite process reads.
+#
+# Block layout:
+#   int64[4]       header: seqlock counter, number of satellites, tick, unused
+#   float64[1]     time of the last publish
+#   float64[N, 2]  lat/lon per satellite
+#   int32[N, N]    next hop from row to column, -1 if unreachable
+# The writer makes the counter odd while publishing, so readers retry any
+# copy taken while it was odd or that changed underneath them.
+
+DEFAULT_NAME = 's2s_constellation'
+HEADER_FIELDS = 4
+
+logging.basicConfig(
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+
+def _block_size(num_sats: int) -> int:
+    return 8 * HEADER_FIELDS + 8 + 16 * num_sats + 4 * num_sats * num_sats
+
+def _layout(buffer, num_sats: int):
+    header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=buffer)
+    published = np.ndarray((1,), dtype=np.float64, buffer=buffer, offset=8 * HEADER_FIELDS)
+    offset = 8 * HEADER_FIELDS + 8
+    positions = np.ndarray((num_sats, 2), dtype=np.float64, buffer=buffer, offset=offset)
+    offset += 16 * num_sats
+    next_hops = np.ndarray((num_sats, num_sats), dtype=np.int32, buffer=buffer, offset=offset)
+    return header, published, positions, next_hops
+
+class ConstellationWriter:
+    """Owns the shared block and the single InterSatelliteLinks computing it"""
+
+    def __init__(self, num_sats: int, max_isl_distance: float = 1000, name: str = DEFAULT_NAME,
+                 orbit_z_axis: Tuple[float, float] = (0, 0), velocity: float = 27000/111.3/(60*60)):
+        from satellite_server import InterSatelliteLinks
+        from movement_simulation import init_satellites
+
+        self.num_sats = num_sats
+        self.orbit_z_axis = orbit_z_axis
+        self.velocity = velocity
+        self.isl_network = InterSatelliteLinks(num_sats, max_isl_distance)
+        self.positions = dict(enumerate(init_satellites(orbit_z_axis, num_sats)))
+        self.isl_network.move_all(self.positions)  # Links and routes for the first publish
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=_block_size(num_sats))
+        except FileExistsError:
+            # Left behind by a writer that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=_block_size(num_sats))
+        self.header, self.published, self.shared_positions, self.next_hops = _layout(self.shm.buf, num_sats)
+        self.header[:] = (0, num_sats, 0, 0)
+        self.next_hops.fill(-1)
+        logging.info(f"Constellation of {num_sats} satellites published in shared memory '{name}'.")
+
+    def step(self, time_delta: float):
+        """Move every satellite by time_delta seconds and publish the result"""
+        from movement_simulation import satellites_move
+
+        self.positions = {
+            sat_id: satellites_move(position, self.orbit_z_axis, self.velocity, time_delta)
+            for sat_id, position in self.positions.items()
+        }
+        self.isl_network.move_all(self.positions)
+        self.publish()
+
+    def publish(self):
+        self.header[0] += 1  # Odd: readers back off
+        for sat_id, (lat, lon) in self.positions.items():
+            self.shared_positions[sat_id] = (lat, lon)
+        self.next_hops.fill(-1)
+        for sat_id, sat in self.isl_network.satellites.items():
+            if sat.routing_table:
+                destinations = np.fromiter(sat.routing_table.keys(), dtype=np.int64, count=len(sat.routing_table))
+                hops = np.fromiter(sat.routing_table.values(), dtype=np.int32, count=len(sat.routing_table))
+                self.next_hops[sat_id, destinations] = hops
+        self.header[2] += 1
+        self.published[0] = time.time()
+        self.header[0] += 1  # Even: consistent again
+
+    def run(self, interval: float = 1.0):
+        last = time.time()
+        self.publish()
+        while True:
+            time.sleep(interval)
+            now = time.time()
+            self.step(now - last)
+            last = now
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+class SharedISLView:
+    """Read-only view of a ConstellationWriter's block.
+
+    Stands in for InterSatelliteLinks wherever only positions and next hops
+    are needed, without computing anything.
+    """
+
+    def __init__(self, name: str = DEFAULT_NAME, attach_timeout: float = 10.0):
+        deadline = time.time() + attach_timeout
+        while True:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name)
+                break
+            except FileNotFoundError:
+                if time.time() >= deadline:
+                    raise
+                time.sleep(0.1)  # Writer not up yet
+        if os.name == 'posix':
+            # Only the writer may unlink the block; stop this process's
+            # resource tracker from doing so when it exits
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        num_sats = int(np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf)[1])
+        self.num_sats = num_sats
+        self.header, self.published, self.positions, self.next_hops = _layout(self.shm.buf, num_sats)
+
+    def _read(self, read):
+        while True:
+            seq = int(self.header[0])
+            if seq % 2 == 0:
+                value = read()
+                if int(self.header[0]) == seq:
+                    return value
+            time.sleep(0)  # Writer mid-publish
+
+    def get_next_hop(self, source_id: int, dest_id: int) -> Optional[int]:
+        if not (0 <= source_id < self.num_sats and 0 <= dest_id < self.num_sats):
+            return None
+        hop = self._read(lambda: int(self.next_hops[source_id, dest_id]))
+        return hop if hop >= 0 else None
+
+    def get_position(self, sat_id: int) -> Tuple[float, float]:
+        lat, lon = self._read(lambda: self.positions[sat_id].copy())
+        return float(lat), float(lon)
+
+    def routing_table(self, sat_id: int) -> Dict[int, int]:
+        row = self._read(lambda: self.next_hops[sat_id].copy())
+        return {int(dest_id): int(row[dest_id]) for dest_id in np.flatnonzero(row >= 0)}
+
+    def tick(self) -> int:
+        return int(self.header[2])
+
+    def close(self):
+        self.shm.close()
+
+def follow_shared(global_dequeue, isl_view: SharedISLView, sat_index: int):
+    """Stand-in for keep_moving when the constellation writer moves the satellites"""
+    last_tick = -1
+    while True:
+        time.sleep(1)
+        tick = isl_view.tick()
+        if tick == last_tick:
+            continue
+        last_tick = tick
+        lat, lon = isl_view.get_position(sat_index)
+        print(f"Satellite {sat_index} position: lat {lat}, lon {lon}")
+        global_dequeue.append((lat, lon))
+        routing_table = isl_view.routing_table(sat_index)
+        if routing_table:
+            print(f"Routing table: {routing_table}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Propagate the constellation into shared memory')
+    parser.add_argument('--num-sats', type=int, required=True, help='Number of satellites')
+    parser.add_argument('--max-isl-distance', type=float, default=1000, help='Longest inter-satellite link, in km')
+    parser.add_argument('--name', default=DEFAULT_NAME, help='Shared memory block name')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between updates')
+    args = parser.parse_args()
+
+    writer = ConstellationWriter(args.num_sats, args.max_isl_distance, args.name)
+    try:
+        writer.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+
+if __name__ == '__main__':
+    main()
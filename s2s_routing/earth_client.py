@@ -1,3 +1,5 @@
+import json
+import os
 import subprocess
 import socket
 import time
@@ -5,7 +7,7 @@ import numpy as np
 import threading
 import psutil
 from datetime import datetime
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 class EarthStation:
     def __init__(self, lat: float, lon: float, node_num: int):
@@ -78,37 +80,168 @@ def earth_sat_distance(earth_lat: float, earth_lon: float, sat_lat: float, sat_l
     distance = np.sqrt(ground_distance**2 + SAT_H**2)
     return distance
 
-def query_satellite_network(socket: socket.socket, server_addr: Tuple[str, int], 
-                          buffer_size: int, timeout: float) -> Dict[int, Tuple[float, float]]:
-    """Query all satellites in the network for their positions"""
+DEFAULT_SATELLITES = 'localhost:8081-8085'
+BEACON_FLAG = 2  # As in satellite_server
+BEACON_RENEW = 10.0  # Seconds between beacon subscription renewals (satellites keep them 30s)
+
+def parse_satellite_addresses(spec: str) -> List[Tuple[str, int]]:
+    """Parse "host:port" entries, with port ranges, e.g. "localhost:8081-8085,10.0.0.7:9000" """
+    addresses = []
+    for entry in spec.split(','):
+        if not entry.strip():
+            continue
+        host, _, ports = entry.strip().rpartition(':')
+        first, _, last = ports.partition('-')
+        addresses.extend((host or 'localhost', port) for port in range(int(first), int(last or first) + 1))
+    return addresses
+
+def registry_satellite_addresses(registry_addr: Tuple[str, int], prefix: str = 'sat',
+                                 timeout: float = 2.0, retries: int = 3) -> List[Tuple[str, int]]:
+    """Addresses of the nodes in an s2s registry whose IDs start with prefix.
+
+    Each page is asked for up to retries times; raises socket.timeout if
+    the registry never answers.
+    """
+    nodes = {}  # A late answer to a retried request may repeat a page
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        request = {'command': 'get_nodes'}
+        while True:
+            for attempt in range(retries):
+                sock.sendto(json.dumps(request).encode(), registry_addr)
+                try:
+                    response = json.loads(sock.recvfrom(65535)[0].decode())
+                    break
+                except socket.timeout:
+                    if attempt == retries - 1:
+                        raise
+            if response.get('status') != 'success':
+                raise ConnectionError(f"Registry refused get_nodes: {response.get('message')}")
+            nodes.update((node_id, tuple(address)) for node_id, address in response.get('nodes', {}).items()
+                         if node_id.startswith(prefix))
+            if response.get('next') is None:
+                return list(nodes.values())
+            request = {'command': 'get_nodes', 'after': response['next']}
+
+def _parse_position(packet: bytes) -> Tuple[int, int, Tuple[float, float]]:
+    flag = int.from_bytes(packet[:4], 'big')
+    sat_id = int.from_bytes(packet[4:8], 'big')
+    sat_lat = int.from_bytes(packet[8:12], 'big', signed=True)
+    sat_lon = int.from_bytes(packet[12:16], 'big', signed=True)
+    return flag, sat_id, (sat_lat, sat_lon)
+
+def _resolve(satellite_addrs: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    # Replies come from numeric addresses; resolve once so they can be matched
+    return [(socket.gethostbyname(host), port) for host, port in satellite_addrs]
+
+def query_satellite_network(sock: socket.socket, satellite_addrs: List[Tuple[str, int]],
+                            buffer_size: int, timeout: float,
+                            satellite_book: Optional[Dict[int, Tuple[str, int]]] = None) -> Dict[int, Tuple[float, float]]:
+    """Query all satellites in the network for their positions.
+
+    Every probe goes out at once and replies are gathered until a single
+    deadline (or until all satellites answered), so silent satellites cost
+    one timeout in total. satellite_book, if given, is filled with the
+    address each satellite ID answered from.
+    """
     satellite_positions = {}
+    pending = set(_resolve(satellite_addrs))
     
-    for port in range(8081, 8086):  # Assuming 5 satellites
+    flag = 0
+    node_num = 0
+    header = flag.to_bytes(4, 'big') + node_num.to_bytes(4, 'big') + \
+            (0).to_bytes(4, 'big') + (0).to_bytes(4, 'big')
+    inquiry = header + (0).to_bytes(4, 'big')
+    for address in pending:
         try:
-            current_addr = (server_addr[0], port)
-            flag = 0
-            node_num = 0
-            header = flag.to_bytes(4, 'big') + node_num.to_bytes(4, 'big') + \
-                    (0).to_bytes(4, 'big') + (0).to_bytes(4, 'big')
-            inquiry = header + (0).to_bytes(4, 'big')
-            
-            socket.sendto(inquiry, current_addr)
-            ack, _ = socket.recvfrom(buffer_size)
-            
-            flag = int.from_bytes(ack[:4], 'big')
-            sat_id = int.from_bytes(ack[4:8], 'big')
-            sat_lat = int.from_bytes(ack[8:12], 'big', signed=True)
-            sat_lon = int.from_bytes(ack[12:16], 'big', signed=True)
-            
-            satellite_positions[sat_id] = (sat_lat, sat_lon)
-            
+            sock.sendto(inquiry, address)
+        except OSError as e:
+            print(f"Error querying satellite at {address[0]}:{address[1]}: {e}")
+    
+    deadline = time.time() + timeout
+    while pending:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        sock.settimeout(remaining)
+        try:
+            ack, address = sock.recvfrom(buffer_size)
         except socket.timeout:
+            break
+        except OSError as e:
+            print(f"Error receiving satellite position: {e}")
             continue
-        except Exception as e:
-            print(f"Error querying satellite at port {port}: {e}")
-            
+        if address not in pending or len(ack) < 16:
+            continue  # Late reply to an earlier query
+        pending.discard(address)
+        _, sat_id, position = _parse_position(ack)
+        satellite_positions[sat_id] = position
+        if satellite_book is not None:
+            satellite_book[sat_id] = address
+    sock.settimeout(timeout)
     return satellite_positions
 
+class BeaconListener:
+    """Satellite positions kept current by subscribing to their beacons.
+
+    Subscriptions are renewed every BEACON_RENEW seconds; positions older
+    than max_age are left out, so a satellite that stops beaconing drops
+    out of the candidates.
+    """
+    
+    def __init__(self, satellite_addrs: List[Tuple[str, int]], buffer_size: int = 1024, max_age: float = 3.0):
+        self.satellite_addrs = _resolve(satellite_addrs)
+        self.buffer_size = buffer_size
+        self.max_age = max_age
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.settimeout(0.5)
+        self.positions: Dict[int, Tuple[Tuple[float, float], float]] = {}  # sat_id: (position, received)
+        self.addresses: Dict[int, Tuple[str, int]] = {}
+        self.lock = threading.Lock()
+        self.running = False
+    
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+    
+    def stop(self):
+        self.running = False
+    
+    def snapshot(self) -> Tuple[Dict[int, Tuple[float, float]], Dict[int, Tuple[str, int]]]:
+        """(positions, addresses) of satellites heard from within max_age"""
+        now = time.time()
+        with self.lock:
+            fresh = {sat_id: position for sat_id, (position, received) in self.positions.items()
+                     if now - received <= self.max_age}
+            return fresh, {sat_id: self.addresses[sat_id] for sat_id in fresh}
+    
+    def _run(self):
+        subscribe = BEACON_FLAG.to_bytes(4, 'big') + (0).to_bytes(4, 'big')
+        renew_at = 0.0
+        while self.running:
+            if time.time() >= renew_at:
+                for address in self.satellite_addrs:
+                    try:
+                        self.sock.sendto(subscribe, address)
+                    except OSError as e:
+                        print(f"Error subscribing to satellite at {address[0]}:{address[1]}: {e}")
+                renew_at = time.time() + BEACON_RENEW
+            try:
+                beacon, address = self.sock.recvfrom(self.buffer_size)
+            except socket.timeout:
+                continue
+            except OSError:
+                continue
+            if len(beacon) < 16:
+                continue
+            flag, sat_id, position = _parse_position(beacon)
+            if flag != BEACON_FLAG:
+                continue
+            with self.lock:
+                self.positions[sat_id] = (position, time.time())
+                self.addresses[sat_id] = address
+
 class NetworkMonitor:
     def __init__(self):
         self.packet_loss_window = []
@@ -144,21 +277,171 @@ class NetworkMonitor:
         print(f"Average Latency: {avg_latency:.2f}ms")
         print("==========================\n")
 
+class SelectiveRepeatSender:
+    """Selective-repeat ARQ for the uplink.
+
+    Up to window packets are in flight at once, each with its own
+    retransmission timer; an expired packet is resent on its own, up to
+    max_retries sends in all. The timeout follows RFC 6298: smoothed RTT
+    and RTT variance from packets acked on their first send (Karn's rule),
+    doubled when packets sent under it expire, until a fresh sample comes
+    in.
+
+    Acks name only a packet number, so each transfer starts by discarding
+    whatever earlier ones left queued, and an ack counts only if it comes
+    from the satellite addressed, with the packets' flag, for a packet
+    still in flight.
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    MIN_RTO = 0.2  # seconds
+    MAX_RTO = 60.0
+
+    def __init__(self, sock: socket.socket, buffer_size: int, window: int = 8, max_retries: int = 3,
+                 initial_rto: float = 1.0, earth_station: Optional[EarthStation] = None,
+                 network_monitor: Optional[NetworkMonitor] = None):
+        self.sock = sock
+        self.buffer_size = buffer_size
+        self.window = max(1, window)
+        self.max_retries = max_retries
+        self.rto = initial_rto
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+        self._backed_off = 0.0  # When the timeout was last doubled
+        self.earth_station = earth_station
+        self.network_monitor = network_monitor
+
+    def send(self, packets: List[bytes], address: Tuple[str, int],
+             sat_node_number: Optional[int] = None) -> Tuple[int, int]:
+        """Deliver packets, numbered by their index; returns (acked, given up).
+
+        With sat_node_number, acks must also carry that satellite's number.
+        """
+        address = _resolve([address])[0]  # Acks come from the numeric address
+        flag = packets[0][:4] if packets else b''
+        self._drain()
+        done = [False] * len(packets)
+        in_flight: Dict[int, Tuple[float, float, int]] = {}  # packet_number: (sent, deadline, sends)
+        base = next_number = 0
+        acked = failed = 0
+
+        while base < len(packets):
+            # Fill the window
+            while next_number < len(packets) and next_number < base + self.window:
+                self._transmit(packets, next_number, address, in_flight, 1)
+                next_number += 1
+
+            # Wait for an ack, at most until the earliest timer fires
+            next_deadline = min(deadline for _, deadline, _ in in_flight.values())
+            self.sock.settimeout(max(next_deadline - time.time(), 0.001))
+            try:
+                ack, source = self.sock.recvfrom(self.buffer_size)
+            except socket.timeout:
+                ack, source = b'', None
+
+            if (source == address and len(ack) >= 12 and ack[:4] == flag and
+                    (sat_node_number is None or int.from_bytes(ack[4:8], 'big') == sat_node_number)):
+                packet_number = int.from_bytes(ack[8:12], 'big')
+                entry = in_flight.pop(packet_number, None)
+                if entry is not None:
+                    sent, _, sends = entry
+                    rtt = time.time() - sent
+                    if sends == 1:
+                        self._sample(rtt)
+                    done[packet_number] = True
+                    acked += 1
+                    if self.earth_station:
+                        self.earth_station.successful_transmissions += 1
+                    if self.network_monitor:
+                        self.network_monitor.update_metrics(rtt * 1000, True)
+
+            # Retransmit whatever timed out
+            now = time.time()
+            for packet_number, (sent, deadline, sends) in list(in_flight.items()):
+                if deadline > now:
+                    continue
+                if self.network_monitor:
+                    self.network_monitor.update_metrics(float('inf'), False)
+                print(f"Timeout: packet={packet_number}, retry={sends}")
+                if sent >= self._backed_off:
+                    # Once per timeout period, not once per packet lost in it
+                    self.rto = min(self.rto * 2, self.MAX_RTO)
+                    self._backed_off = now
+                if sends >= self.max_retries:
+                    # Give up on it so the window can move on
+                    del in_flight[packet_number]
+                    done[packet_number] = True
+                    failed += 1
+                else:
+                    self._transmit(packets, packet_number, address, in_flight, sends + 1)
+
+            while base < len(packets) and done[base]:
+                base += 1
+
+        return acked, failed
+
+    def _drain(self):
+        """Discard acks left over from earlier transfers"""
+        timeout = self.sock.gettimeout()
+        self.sock.setblocking(False)
+        try:
+            while True:
+                try:
+                    self.sock.recvfrom(self.buffer_size)
+                except BlockingIOError:
+                    return
+                except ConnectionResetError:
+                    continue  # Windows reports an earlier ICMP unreachable here
+        finally:
+            self.sock.settimeout(timeout)
+
+    def _transmit(self, packets: List[bytes], packet_number: int, address: Tuple[str, int],
+                  in_flight: Dict[int, Tuple[float, float, int]], sends: int):
+        now = time.time()
+        try:
+            self.sock.sendto(packets[packet_number], address)
+        except OSError as e:
+            print(f"Error sending packet {packet_number}: {e}")
+        in_flight[packet_number] = (now, now + self.rto, sends)
+        if self.earth_station:
+            self.earth_station.total_data_sent += len(packets[packet_number])
+
+    def _sample(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, self.MIN_RTO), self.MAX_RTO)
+
 def client(server_addr: Tuple[str, int], buffer_size: int, timeout: float, 
-          debug_interval: float, chunk_size: int, earth_station: EarthStation):
+          debug_interval: float, chunk_size: int, earth_station: EarthStation,
+          satellite_addrs: Optional[List[Tuple[str, int]]] = None, beacons: Optional[BeaconListener] = None,
+          window: int = 8, max_retries: int = 3):
     message = "This is a test string that will be sent as binary data over UDP in smaller packets."
     binary_stream = message.encode('utf-8')
     chunks = [binary_stream[i:i + chunk_size] for i in range(0, len(binary_stream), chunk_size)]
     
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     client_socket.settimeout(timeout)
+    # Discovery gets its own socket so late position replies never pass for data acks
+    discovery_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if satellite_addrs is None:
+        satellite_addrs = [(server_addr[0], port) for port in range(8081, 8086)]
     
     network_monitor = NetworkMonitor()
+    sender = SelectiveRepeatSender(client_socket, buffer_size, window, max_retries, timeout,
+                                   earth_station, network_monitor)
 
     while True:
         try:
             # Query satellite network
-            satellite_positions = query_satellite_network(client_socket, server_addr, buffer_size, timeout)
+            satellite_positions, satellite_book = beacons.snapshot() if beacons else ({}, {})
+            if not satellite_positions:
+                satellite_positions = query_satellite_network(discovery_socket, satellite_addrs, buffer_size,
+                                                              timeout, satellite_book)
             if not satellite_positions:
                 print("No satellites available. Retrying...")
                 time.sleep(debug_interval)
@@ -171,49 +454,20 @@ def client(server_addr: Tuple[str, int], buffer_size: int, timeout: float,
                 time.sleep(debug_interval)
                 continue
             
-            # Use the port of the best satellite
-            current_addr = (server_addr[0], 8080 + best_sat)
+            # Use the address the best satellite answered from
+            current_addr = satellite_book.get(best_sat, (server_addr[0], 8080 + best_sat))
             
-            # Send data chunks
-            for packet_number, chunk in enumerate(chunks):
-                success = False
-                retries = 0
-                max_retries = 3
-                
-                while not success and retries < max_retries:
-                    try:
-                        start_time = time.time()
-                        
-                        # Prepare and send packet
-                        flag = 1
-                        header = flag.to_bytes(4, 'big') + earth_station.node_num.to_bytes(4, 'big') + \
-                                packet_number.to_bytes(4, 'big') + len(chunks).to_bytes(4, 'big')
-                        packet = header + chunk
-                        
-                        client_socket.sendto(packet, current_addr)
-                        earth_station.total_data_sent += len(packet)
-                        
-                        # Wait for acknowledgment
-                        ack, _ = client_socket.recvfrom(buffer_size)
-                        end_time = time.time()
-                        
-                        rtt = (end_time - start_time) * 1000
-                        earth_station.successful_transmissions += 1
-                        success = True
-                        
-                        # Update network metrics
-                        network_monitor.update_metrics(rtt, True)
-                        
-                    except socket.timeout:
-                        retries += 1
-                        network_monitor.update_metrics(float('inf'), False)
-                        print(f"Timeout: packet={packet_number}, retry={retries}")
-                    except Exception as e:
-                        print(f"Error sending packet {packet_number}: {e}")
-                        break
-                        
-                    time.sleep(debug_interval)
-                
+            # Send data chunks, a window of them at a time
+            flag = 1
+            packets = [
+                flag.to_bytes(4, 'big') + earth_station.node_num.to_bytes(4, 'big') +
+                packet_number.to_bytes(4, 'big') + len(chunks).to_bytes(4, 'big') + chunk
+                for packet_number, chunk in enumerate(chunks)
+            ]
+            acked, failed = sender.send(packets, current_addr, best_sat)
+            if failed:
+                print(f"Gave up on {failed} of {len(packets)} packets to satellite {best_sat}")
+
             time.sleep(5)  # Wait before next transmission
             
         except Exception as e:
@@ -228,12 +482,34 @@ if __name__ == "__main__":
     TIMEOUT = 2
     DEBUG_INTER = 0.5
     CHUNK_SIZE = 10
+    WINDOW = int(os.getenv('UPLINK_WINDOW', '8'))  # Unacknowledged packets in flight
+    # Satellites to discover: "host:port" entries with port ranges, or the
+    # nodes named sat* in the s2s registry at SATELLITE_REGISTRY ("host:port")
+    SATELLITES = os.getenv('SATELLITES', DEFAULT_SATELLITES)
+    SATELLITE_REGISTRY = os.getenv('SATELLITE_REGISTRY')
+    USE_BEACONS = os.getenv('SATELLITE_BEACONS', '0') == '1'
+    
+    satellite_addrs = []
+    if SATELLITE_REGISTRY:
+        registry_host, _, registry_port = SATELLITE_REGISTRY.rpartition(':')
+        try:
+            satellite_addrs = registry_satellite_addresses((registry_host or 'localhost', int(registry_port)))
+        except (OSError, ValueError) as e:  # Timeouts, refusals and garbled replies alike
+            print(f"Satellite registry {SATELLITE_REGISTRY} unavailable ({e}), using {SATELLITES}")
+        else:
+            if not satellite_addrs:
+                print(f"No satellites registered at {SATELLITE_REGISTRY}, using {SATELLITES}")
+    if not satellite_addrs:
+        satellite_addrs = parse_satellite_addresses(SATELLITES)
+    print(f"Discovering {len(satellite_addrs)} satellites{' with beacons' if USE_BEACONS else ''}")
+    beacons = BeaconListener(satellite_addrs, BUFFER_SIZE).start() if USE_BEACONS else None
     
     earth_station = EarthStation(EARTH_LL[0], EARTH_LL[1], EARTH_NODE_NUM)
     
     client_thread = threading.Thread(
         target=client,
-        args=(SERVER_ADDR, BUFFER_SIZE, TIMEOUT, DEBUG_INTER, CHUNK_SIZE, earth_station),
+        args=(SERVER_ADDR, BUFFER_SIZE, TIMEOUT, DEBUG_INTER, CHUNK_SIZE, earth_station,
+              satellite_addrs, beacons, WINDOW),
         daemon=True
     )
     
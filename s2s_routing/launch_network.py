@@ -2,13 +2,23 @@ import subprocess
 import time
 import sys
 import os
-from typing import List
+from typing import List, Optional
 
-def create_satellite_script(sat_id: int, sat_index: int, port: int, server_ip: str, num_sats: int, max_isl_distance: float) -> str:
+def create_satellite_script(sat_id: int, sat_index: int, port: int, server_ip: str, num_sats: int, max_isl_distance: float,
+                            shared_memory: Optional[str] = None) -> str:
     """
     Generates a satellite script file with the given configuration.
+    With shared_memory, the satellite reads positions and routes from that
+    constellation block instead of simulating the whole network itself.
     """
     filename = f"satellite_{sat_id}.py"
+    if shared_memory:
+        network_setup = f"""from constellation import SharedISLView, follow_shared
+    isl_network = SharedISLView('{shared_memory}')
+    movement = (follow_shared, (global_dequeue, isl_network, SAT_INDEX))"""
+    else:
+        network_setup = f"""isl_network = InterSatelliteLinks(NUM_SATS, max_isl_distance={max_isl_distance})
+    movement = (keep_moving, (global_dequeue, ORBIT_Z_AXIS, NUM_SATS, VELOCITY, SAT_INDEX, isl_network))"""
     config = f"""
 if __name__ == "__main__":
     # Configuration
@@ -19,21 +29,26 @@ if __name__ == "__main__":
     ORBIT_Z_AXIS = (0, 0)
     VELOCITY = 27000/111.3/(60*60)  # degrees per second
     SERVER_ADDR = ('{server_ip}', {port})
+    # ISL IDs are satellite indices; satellite i listens on {port - sat_index} + i
+    HOP_ADDRESS = sequential_hop_address(SERVER_ADDR[0], {port - sat_index})
     BUFFER_SIZE = 1024
+    # s2s registry ("host:port") to announce this satellite to, if any
+    REGISTRY_ADDR = registry_address(os.getenv('SATELLITE_REGISTRY'))
     
     # Initialize ISL network
-    isl_network = InterSatelliteLinks(NUM_SATS, max_isl_distance={max_isl_distance})
+    {network_setup}
     
     # Create threads
     simulation_thread = threading.Thread(
-        target=keep_moving,
-        args=(global_dequeue, ORBIT_Z_AXIS, NUM_SATS, VELOCITY, SAT_INDEX, isl_network),
+        target=movement[0],
+        args=movement[1],
         daemon=True
     )
     
     server_thread = threading.Thread(
         target=server,
-        args=(global_dequeue, SERVER_ADDR, BUFFER_SIZE, SAT_NODE_NUM, isl_network),
+        args=(global_dequeue, SERVER_ADDR, BUFFER_SIZE, SAT_NODE_NUM, isl_network, REGISTRY_ADDR,
+              SAT_INDEX, HOP_ADDRESS),
         daemon=True
     )
     
@@ -71,9 +86,17 @@ def launch_satellite_network():
     SERVER_IP = 'localhost'
     NUM_SATS = len(satellites)
     MAX_ISL_DISTANCE = 200000  # Adjust as needed
+    SHARED_MEMORY = 's2s_constellation'  # None: every satellite simulates the network itself
     
     processes = []
     try:
+        if SHARED_MEMORY:
+            # One process propagates the constellation and computes routes for all
+            processes.append(subprocess.Popen([
+                sys.executable, 'constellation.py', '--num-sats', str(NUM_SATS),
+                '--max-isl-distance', str(MAX_ISL_DISTANCE), '--name', SHARED_MEMORY
+            ]))
+            print(f"Launching constellation writer for {NUM_SATS} satellites...")
         for sat in satellites:
             script = create_satellite_script(
                 sat_id=sat["node_num"],
@@ -81,7 +104,8 @@ def launch_satellite_network():
                 port=sat["port"],
                 server_ip=SERVER_IP,
                 num_sats=NUM_SATS,
-                max_isl_distance=MAX_ISL_DISTANCE
+                max_isl_distance=MAX_ISL_DISTANCE,
+                shared_memory=SHARED_MEMORY
             )
             # Launch the satellite process
             process = subprocess.Popen([sys.executable, script])
@@ -103,4 +127,20 @@ def launch_satellite_network():
         print(f"An error occurred: {e}")
 
 if __name__ == "__main__":
-    launch_satellite_network()
+    import argparse
+    parser = argparse.ArgumentParser(description='Launch the satellite network')
+    parser.add_argument('--single-process', action='store_true',
+                        help='Run every satellite in this process on one event loop (see satellite_host.py)')
+    parser.add_argument('--num-sats', type=int, default=5, help='Number of satellites with --single-process')
+    args = parser.parse_args()
+    if args.single_process:
+        import asyncio
+        from satellite_host import SatelliteHost
+        try:
+            from satellite_server import registry_address
+            asyncio.run(SatelliteHost(args.num_sats, max_isl_distance=200000,
+                                      registry_addr=registry_address(os.getenv('SATELLITE_REGISTRY'))).run())
+        except KeyboardInterrupt:
+            print("\nSatellite network shut down.")
+    else:
+        launch_satellite_network()
@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from movement_simulation import init_satellites, satellites_move
+from satellite_server import (InterSatelliteLinks, ReassemblyManager, RegistryAnnouncer, handle_packet,
+                              registry_address, send_beacons)
+
+# Host mode: many satellites in one process on one asyncio loop. Every
+# satellite keeps its own UDP endpoint, position history and reassembly
+# buffers, and they share one InterSatelliteLinks. Positions and routes are
+# recomputed in a worker thread and swapped in as a whole, so the loop
+# never waits on routing.
+
+class SatelliteProtocol(asyncio.DatagramProtocol):
+    def __init__(self, host: "SatelliteHost", sat_index: int):
+        self.host = host
+        self.sat_index = sat_index
+        self.node_number = sat_index + 1
+        self.global_dequeue = deque(maxlen=10)
+        self.reassembly = ReassemblyManager()
+        self.subscribers: Dict[tuple, float] = {}  # Beacon subscriber address: lease expiry
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, client_address):
+        try:
+            replies = handle_packet(data, client_address, self.node_number, self.host,
+                                    self.global_dequeue, self.reassembly,
+                                    isl_id=self.sat_index, hop_address=self.host.hop_address,
+                                    subscribers=self.subscribers)
+        except Exception as e:
+            logging.error(f"Satellite {self.node_number} failed to handle packet from {client_address}: {e}")
+            return
+        for reply, address in replies:
+            self.transport.sendto(reply, address)
+
+class SatelliteHost:
+    """Runs num_sats satellites; satellite i is node i + 1 on base_port + i.
+
+    With registry_addr every satellite is also registered there as
+    sat<node number>, for earth stations to discover.
+    """
+
+    def __init__(self, num_sats: int, host: str = 'localhost', base_port: int = 8081,
+                 max_isl_distance: float = 1000, orbit_z_axis: Tuple[float, float] = (0, 0),
+                 velocity: float = 27000/111.3/(60*60), registry_addr: Optional[Tuple[str, int]] = None):
+        self.num_sats = num_sats
+        self.host = host
+        self.base_port = base_port
+        self.registry_addr = registry_addr
+        self.announcer: Optional[RegistryAnnouncer] = None
+        self.orbit_z_axis = orbit_z_axis
+        self.velocity = velocity
+        self.isl_network = InterSatelliteLinks(num_sats, max_isl_distance)
+        self.positions = dict(enumerate(init_satellites(orbit_z_axis, num_sats)))
+        self.isl_network.move_all(self.positions)
+        self.routes = self._routes()
+        self.satellites: List[SatelliteProtocol] = []
+
+    def _routes(self) -> Dict[int, Dict[int, int]]:
+        # A full update_routing_tables assigns fresh dicts, so these stay unchanged
+        return {sat_id: sat.routing_table for sat_id, sat in self.isl_network.satellites.items()}
+
+    def get_next_hop(self, source_id: int, dest_id: int) -> Optional[int]:
+        return self.routes.get(source_id, {}).get(dest_id)
+
+    def hop_address(self, next_hop: int) -> Tuple[str, int]:
+        return self.host, self.base_port + next_hop
+
+    def _propagate(self, time_delta: float) -> Tuple[Dict[int, Tuple[float, float]], Dict[int, Dict[int, int]]]:
+        positions = {
+            sat_id: satellites_move(position, self.orbit_z_axis, self.velocity, time_delta)
+            for sat_id, position in self.positions.items()
+        }
+        self.isl_network.move_all(positions)
+        return positions, self._routes()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        started = time.time()
+        for sat_index in range(self.num_sats):
+            _, protocol = await loop.create_datagram_endpoint(
+                lambda sat_index=sat_index: SatelliteProtocol(self, sat_index),
+                local_addr=(self.host, self.base_port + sat_index)
+            )
+            self.satellites.append(protocol)
+        for protocol in self.satellites:
+            protocol.global_dequeue.append(self.positions[protocol.sat_index])
+        logging.warning(f"{self.num_sats} satellites listening on {self.host}:{self.base_port}-"
+                        f"{self.base_port + self.num_sats - 1} after {time.time() - started:.2f}s.")
+        if self.registry_addr:
+            node_ports = {f"sat{protocol.node_number}": self.base_port + protocol.sat_index
+                          for protocol in self.satellites}
+            self.announcer = RegistryAnnouncer(self.registry_addr, node_ports,
+                                               host=socket.gethostbyname(self.host)).start()
+
+    async def run(self, interval: float = 1.0):
+        await self.start()
+        loop = asyncio.get_running_loop()
+        last = time.time()
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                now = time.time()
+                self.positions, self.routes = await loop.run_in_executor(None, self._propagate, now - last)
+                last = now
+                for protocol in self.satellites:
+                    protocol.global_dequeue.append(self.positions[protocol.sat_index])
+                    protocol.reassembly.expire()
+                    if protocol.subscribers:
+                        send_beacons(protocol.transport.sendto, protocol.node_number,
+                                     self.positions[protocol.sat_index], protocol.subscribers)
+        finally:
+            if self.announcer:
+                self.announcer.stop()
+            for protocol in self.satellites:
+                protocol.transport.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Run many satellites in one process')
+    parser.add_argument('--num-sats', type=int, default=5, help='Number of satellites')
+    parser.add_argument('--host', default='localhost', help='Address to bind the satellites to')
+    parser.add_argument('--base-port', type=int, default=8081, help='Port of satellite 1; the rest follow')
+    parser.add_argument('--max-isl-distance', type=float, default=1000, help='Longest inter-satellite link, in km')
+    parser.add_argument('--registry', default=os.getenv('SATELLITE_REGISTRY'),
+                        help='s2s registry ("host:port") to register the satellites with as sat<n> '
+                             '(default: $SATELLITE_REGISTRY)')
+    parser.add_argument('--log-level', default='WARNING',
+                        help='Per-satellite link and route logging is INFO (default: WARNING)')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    host = SatelliteHost(args.num_sats, args.host, args.base_port, args.max_isl_distance,
+                         registry_addr=registry_address(args.registry))
+    try:
+        asyncio.run(host.run())
+    except KeyboardInterrupt:
+        print("Satellite host exiting...")
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,13 @@
+import heapq
+import json
 import logging
-from collections import deque
+import os
+from collections import OrderedDict, deque
 import socket
 import threading
 import time
 import numpy as np
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 
 # Configure logging for clarity
 logging.basicConfig(
@@ -12,6 +15,17 @@ logging.basicConfig(
     level=logging.INFO
 )
 
+SAT_H = 550.0  # Satellite height in km
+EARTH_R = 6378.0  # Earth radius in km
+
+def latlon_to_ecef(lat, lon, radius: float = EARTH_R + SAT_H) -> np.ndarray:
+    """ECEF coordinates in km; works elementwise on arrays of lat/lon too"""
+    lat, lon = np.radians(lat), np.radians(lon)
+    cos_lat = np.cos(lat)
+    return np.stack([radius * cos_lat * np.cos(lon),
+                     radius * cos_lat * np.sin(lon),
+                     radius * np.sin(lat)], axis=-1)
+
 class ISLNode:
     def __init__(self, sat_id: int, lat: float, lon: float):
         self.sat_id = sat_id
@@ -20,12 +34,20 @@ class ISLNode:
         self.neighbors: Dict[int, Tuple[float, float]] = {}  # sat_id: (lat, lon)
         self.routing_table: Dict[int, int] = {}  # dest_id: next_hop_id
         self.last_update = time.time()
+        self.row = -1  # Row of InterSatelliteLinks.ecef
+        self.ecef: Optional[np.ndarray] = None  # View of that row
 
 class InterSatelliteLinks:
     def __init__(self, num_satellites: int, max_isl_distance: float = 1000):
         self.num_satellites = num_satellites
         self.max_isl_distance = max_isl_distance
         self.satellites: Dict[int, ISLNode] = {}
+        self.edge_weights: Dict[int, Dict[int, float]] = {}  # sat_id: {neighbor_id: link length in km}
+        # source_id: (distances, previous hop, routing table) of its shortest-path tree
+        self._trees: Dict[int, Tuple[Dict[int, float], Dict[int, int], Dict[int, int]]] = {}
+        # ECEF position of every satellite, one row each, kept current as they move
+        self.ecef = np.zeros((max(num_satellites, 1), 3))
+        self._row_ids = []  # row: sat_id
         self.connection_lock = threading.Lock()
         
         logging.info(f"Initializing ISL network with {num_satellites} satellites...")
@@ -34,100 +56,240 @@ class InterSatelliteLinks:
         for sat_id in range(self.num_satellites):
             lat = np.random.uniform(-90, 90)  # Random latitude
             lon = np.random.uniform(-180, 180)  # Random longitude
-            self.satellites[sat_id] = ISLNode(sat_id, lat, lon)
+            self._add_satellite(sat_id, lat, lon)
             logging.info(f"Satellite {sat_id} initialized at position lat={lat:.2f}, lon={lon:.2f}.")
-            self.update_neighbors(sat_id)
+        self.rebuild_links()
 
     def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        SAT_H = 550.0  # Satellite height in km
-        EARTH_R = 6378.0  # Earth radius in km
-        
-        sat_r = EARTH_R + SAT_H
-        x1 = sat_r * np.cos(np.radians(lat1)) * np.cos(np.radians(lon1))
-        y1 = sat_r * np.cos(np.radians(lat1)) * np.sin(np.radians(lon1))
-        z1 = sat_r * np.sin(np.radians(lat1))
-        
-        x2 = sat_r * np.cos(np.radians(lat2)) * np.cos(np.radians(lon2))
-        y2 = sat_r * np.cos(np.radians(lat2)) * np.sin(np.radians(lon2))
-        z2 = sat_r * np.sin(np.radians(lat2))
-        
-        return np.sqrt((x2 - x1)**2 + (y2 - y1)**2 + (z2 - z1)**2)
+        return float(np.linalg.norm(latlon_to_ecef(lat2, lon2) - latlon_to_ecef(lat1, lon1)))
+
+    def _add_satellite(self, sat_id: int, lat: float, lon: float):
+        sat = self.satellites[sat_id] = ISLNode(sat_id, lat, lon)
+        sat.row = len(self._row_ids)
+        self._row_ids.append(sat_id)
+        if sat.row == len(self.ecef):
+            self.ecef = np.concatenate([self.ecef, np.zeros_like(self.ecef)])
+            for other in self.satellites.values():
+                other.ecef = self.ecef[other.row]
+        sat.ecef = self.ecef[sat.row]
+        sat.ecef[:] = latlon_to_ecef(lat, lon)
+
+    def _move_satellite(self, sat_id: int, lat: float, lon: float):
+        sat = self.satellites[sat_id]
+        sat.lat = lat
+        sat.lon = lon
+        sat.ecef[:] = latlon_to_ecef(lat, lon)
+        sat.last_update = time.time()
+
+    def pairwise_distances(self) -> np.ndarray:
+        """Matrix of distances in km between all satellites, in row order"""
+        points = self.ecef[:len(self._row_ids)]
+        squared = np.einsum('ij,ij->i', points, points)
+        # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b, without an N x N x 3 temporary
+        distances = squared[:, None] + squared[None, :] - 2 * points @ points.T
+        return np.sqrt(np.maximum(distances, 0))
+
+    def rebuild_links(self):
+        """Recompute every link from the distance matrix in one pass"""
+        distances = self.pairwise_distances()
+        in_range = distances <= self.max_isl_distance
+        np.fill_diagonal(in_range, False)
+        for row, sat_id in enumerate(self._row_ids):
+            sat = self.satellites[sat_id]
+            columns = np.flatnonzero(in_range[row])
+            self.edge_weights[sat_id] = {self._row_ids[col]: float(distances[row, col]) for col in columns}
+            sat.neighbors = {other_id: (self.satellites[other_id].lat, self.satellites[other_id].lon)
+                             for other_id in self.edge_weights[sat_id]}
+            if sat.neighbors:
+                logging.info(f"Satellite {sat_id} neighbors: {list(sat.neighbors.keys())}.")
+            else:
+                logging.warning(f"Satellite {sat_id} has no neighbors within distance {self.max_isl_distance} km.")
 
     def update_satellite_position(self, sat_id: int, lat: float, lon: float):
         with self.connection_lock:
             if sat_id not in self.satellites:
-                self.satellites[sat_id] = ISLNode(sat_id, lat, lon)
+                self._add_satellite(sat_id, lat, lon)
                 logging.info(f"Satellite {sat_id} added to the network at lat={lat:.2f}, lon={lon:.2f}.")
             else:
-                self.satellites[sat_id].lat = lat
-                self.satellites[sat_id].lon = lon
-                self.satellites[sat_id].last_update = time.time()
+                self._move_satellite(sat_id, lat, lon)
                 logging.info(f"Satellite {sat_id} updated position to lat={lat:.2f}, lon={lon:.2f}.")
             
-            self.update_neighbors(sat_id)
+            changed = self.update_neighbors(sat_id)
+            self.update_routing_tables(sat_id, changed)
+
+    def move_all(self, positions: Dict[int, Tuple[float, float]]):
+        """Move many satellites at once, then rebuild links and routes in one pass"""
+        with self.connection_lock:
+            for sat_id, (lat, lon) in positions.items():
+                if sat_id in self.satellites:
+                    self._move_satellite(sat_id, lat, lon)
+                else:
+                    self._add_satellite(sat_id, lat, lon)
+            self.rebuild_links()
             self.update_routing_tables()
 
-    def update_neighbors(self, sat_id: int):
+    def update_neighbors(self, sat_id: int) -> Dict[int, Tuple[Optional[float], Optional[float]]]:
+        """Refresh the links of sat_id on both ends and cache their lengths.
+
+        Distances to every other satellite come from one array operation
+        on the ECEF table. Returns {other_id: (old length, new length)} for
+        every link that appeared, disappeared (new length None) or changed
+        length.
+        """
         sat = self.satellites[sat_id]
-        sat.neighbors.clear()
+        edges = self.edge_weights.setdefault(sat_id, {})
+        changed = {}
+        
+        distances = np.linalg.norm(self.ecef[:len(self._row_ids)] - sat.ecef, axis=1)
+        in_range = distances <= self.max_isl_distance
+        in_range[sat.row] = False
         
-        for other_id, other_sat in self.satellites.items():
-            if other_id != sat_id:
-                distance = self.calculate_distance(
-                    sat.lat, sat.lon,
-                    other_sat.lat, other_sat.lon
-                )
-                if distance <= self.max_isl_distance:
-                    sat.neighbors[other_id] = (other_sat.lat, other_sat.lon)
+        for col in np.flatnonzero(in_range):
+            other_id = self._row_ids[col]
+            other_sat = self.satellites[other_id]
+            distance = float(distances[col])
+            old_distance = edges.get(other_id)
+            sat.neighbors[other_id] = (other_sat.lat, other_sat.lon)
+            other_sat.neighbors[sat_id] = (sat.lat, sat.lon)
+            edges[other_id] = self.edge_weights.setdefault(other_id, {})[sat_id] = distance
+            if distance != old_distance:
+                changed[other_id] = (old_distance, distance)
+        for other_id in [other_id for other_id in edges if not in_range[self.satellites[other_id].row]]:
+            sat.neighbors.pop(other_id, None)
+            self.satellites[other_id].neighbors.pop(sat_id, None)
+            changed[other_id] = (edges.pop(other_id), None)
+            self.edge_weights[other_id].pop(sat_id, None)
         
         if sat.neighbors:
             logging.info(f"Satellite {sat_id} neighbors: {list(sat.neighbors.keys())}.")
         else:
             logging.warning(f"Satellite {sat_id} has no neighbors within distance {self.max_isl_distance} km.")
+        return changed
 
-    def update_routing_tables(self):
+    def update_routing_tables(self, changed_sat: Optional[int] = None,
+                              changed_links: Optional[Dict[int, Tuple[Optional[float], Optional[float]]]] = None):
+        """Recompute all routing tables, or repair them after changed_sat's links changed.
+
+        Given the links that changed (as returned by update_neighbors),
+        changed_sat's own table is rebuilt and every other source's
+        shortest-path tree is repaired in place; see _repair_tree.
+        """
+        full = changed_sat is None or changed_links is None
         for source_id in self.satellites:
-            self.satellites[source_id].routing_table = self._dijkstra(source_id)
+            if full or source_id == changed_sat or source_id not in self._trees:
+                self._trees[source_id] = self._dijkstra(source_id)
+            elif not self._repair_tree(source_id, changed_sat, changed_links):
+                continue  # Routes from this source are unaffected
+            self.satellites[source_id].routing_table = self._trees[source_id][2]
             if self.satellites[source_id].routing_table:
                 logging.info(f"Routing table for satellite {source_id}: {self.satellites[source_id].routing_table}.")
             else:
                 logging.warning(f"Routing table for satellite {source_id} is empty.")
-                
-    def _dijkstra(self, source_id: int) -> Dict[int, int]:
-        distances = {sat_id: float('inf') for sat_id in self.satellites}
-        distances[source_id] = 0
-        previous = {sat_id: None for sat_id in self.satellites}
-        unvisited = set(self.satellites.keys())
+
+    def _repair_tree(self, source_id: int, changed_sat: int,
+                     changed_links: Dict[int, Tuple[Optional[float], Optional[float]]]) -> bool:
+        """Bring one source's shortest paths up to date with changed_links.
+
+        Satellites reached over a link that got longer or went away lose
+        their route, as does everything routed through them. They are then
+        re-offered paths from their settled neighbours, links that got
+        shorter or appeared are offered too, and Dijkstra runs from there,
+        so only the part of the tree that can change is touched. Next hops
+        are then re-derived from the previous hops, as a satellite that
+        was reparented carries its descendants to a new first hop even
+        where their own distances did not change.
+        Returns False if no route changed.
+        """
+        distances, previous, routing_table = self._trees[source_id]
+        cut = set()
+        for other_id, (old_distance, new_distance) in changed_links.items():
+            if old_distance is not None and (new_distance is None or new_distance > old_distance):
+                if previous.get(other_id) == changed_sat:
+                    cut.add(other_id)
+                elif previous.get(changed_sat) == other_id:
+                    cut.add(changed_sat)
         
-        while unvisited:
-            current = min(unvisited, key=lambda sat_id: distances[sat_id])
-            if distances[current] == float('inf'):
-                break  # Remaining nodes are unreachable
-                
-            unvisited.remove(current)
-            
-            for neighbor_id in self.satellites[current].neighbors:
-                if neighbor_id in unvisited:
-                    distance = self.calculate_distance(
-                        self.satellites[current].lat,
-                        self.satellites[current].lon,
-                        self.satellites[neighbor_id].lat,
-                        self.satellites[neighbor_id].lon
-                    )
-                    alt_distance = distances[current] + distance
-                    if alt_distance < distances[neighbor_id]:
-                        distances[neighbor_id] = alt_distance
-                        previous[neighbor_id] = current
+        invalid = set(cut)
+        if not cut.isdisjoint(previous.values()):
+            # Something is routed through a cut satellite: cut its subtree too
+            invalid.clear()
+            children = {}
+            for node_id, parent_id in previous.items():
+                children.setdefault(parent_id, []).append(node_id)
+            stack = list(cut)
+            while stack:
+                node_id = stack.pop()
+                if node_id not in invalid:
+                    invalid.add(node_id)
+                    stack.extend(children.get(node_id, ()))
+        for node_id in invalid:
+            del distances[node_id], previous[node_id], routing_table[node_id]
         
-        routing_table = {}
-        for dest_id in self.satellites:
-            if dest_id != source_id and previous[dest_id] is not None:
-                next_hop = dest_id
-                while previous[next_hop] != source_id:
-                    next_hop = previous[next_hop]
-                routing_table[dest_id] = next_hop
+        heap = []
+        for node_id in invalid:
+            for neighbor_id, link_distance in self.edge_weights.get(node_id, {}).items():
+                if neighbor_id in distances:
+                    self._offer(source_id, neighbor_id, node_id, link_distance, self._trees[source_id], heap)
+        for other_id, (old_distance, new_distance) in changed_links.items():
+            if new_distance is not None and (old_distance is None or new_distance < old_distance):
+                for near_id, far_id in ((changed_sat, other_id), (other_id, changed_sat)):
+                    if near_id in distances:
+                        self._offer(source_id, near_id, far_id, new_distance, self._trees[source_id], heap)
         
-        return routing_table
+        if not invalid and not heap:
+            return False
+        self._relax(source_id, self._trees[source_id], heap)
+        self._first_hops(source_id, self._trees[source_id])
+        return True
+
+    def _first_hops(self, source_id: int, tree: Tuple[Dict[int, float], Dict[int, int], Dict[int, int]]):
+        """Rebuild the routing table in place by walking each previous hop back to source_id"""
+        _, previous, routing_table = tree
+        routing_table.clear()
+        for dest_id in previous:
+            path = []
+            node_id = dest_id
+            while node_id not in routing_table:
+                if previous[node_id] == source_id:
+                    routing_table[node_id] = node_id
+                    break
+                path.append(node_id)
+                node_id = previous[node_id]
+            for hop_id in path:
+                routing_table[hop_id] = routing_table[node_id]
+                
+    def _dijkstra(self, source_id: int) -> Tuple[Dict[int, float], Dict[int, int], Dict[int, int]]:
+        """Shortest paths from source_id over the cached link lengths.
+
+        Returns (distances, previous hop, routing table of dest_id -> next
+        hop) covering every reachable satellite.
+        """
+        tree = ({source_id: 0.0}, {}, {})
+        self._relax(source_id, tree, [(0.0, source_id)])
+        return tree
+
+    def _offer(self, source_id: int, from_id: int, to_id: int, link_distance: float,
+               tree: Tuple[Dict[int, float], Dict[int, int], Dict[int, int]], heap: list) -> bool:
+        """Route to_id via from_id if that is shorter than its current path"""
+        distances, previous, routing_table = tree
+        alt_distance = distances[from_id] + link_distance
+        if alt_distance >= distances.get(to_id, float('inf')):
+            return False
+        distances[to_id] = alt_distance
+        previous[to_id] = from_id
+        routing_table[to_id] = to_id if from_id == source_id else routing_table[from_id]
+        heapq.heappush(heap, (alt_distance, to_id))
+        return True
+
+    def _relax(self, source_id: int, tree: Tuple[Dict[int, float], Dict[int, int], Dict[int, int]],
+               heap: list):
+        distances = tree[0]
+        while heap:
+            distance, current = heapq.heappop(heap)
+            if distance > distances.get(current, float('inf')):
+                continue  # Stale entry, a shorter path was found since
+            for neighbor_id, link_distance in self.edge_weights.get(current, {}).items():
+                self._offer(source_id, current, neighbor_id, link_distance, tree, heap)
 
     def get_next_hop(self, source_id: int, dest_id: int) -> int:
         with self.connection_lock:
@@ -165,67 +327,340 @@ def keep_moving(global_dequeue, orbit_z_axis, num_sats, velocity, sat_index, isl
             if sat.routing_table:
                 print(f"Routing table: {sat.routing_table}")
 
-def server(global_dequeue, server_addr, buffer_size, sat_node_number, isl_network):
+BEACON_FLAG = 2  # Subscribe to position beacons; beacons go out with this flag too
+BEACON_LEASE = 30.0  # Seconds a beacon subscription lasts unless renewed
+
+def position_packet(flag: int, sat_node_number: int, lat: float, lon: float) -> bytes:
+    lat_info = int(lat).to_bytes(4, 'big', signed=True)
+    lon_info = int(lon).to_bytes(4, 'big', signed=True)
+    return flag.to_bytes(4, 'big') + sat_node_number.to_bytes(4, 'big') + lat_info + lon_info
+
+def send_beacons(send, sat_node_number: int, position: Tuple[float, float], subscribers: Dict[tuple, float]):
+    """Send a position beacon to every subscriber whose lease is still running"""
+    now = time.time()
+    for address, expires in list(subscribers.items()):
+        if expires < now:
+            del subscribers[address]
+        else:
+            send(position_packet(BEACON_FLAG, sat_node_number, *position), address)
+
+def print_payload(source: int, payload: bytearray):
+    print(f"All packets from node {source} received!")
+    print("Reconstructed String:", payload.decode(errors='replace'))
+
+class _Flow:
+    __slots__ = ('total', 'stride', 'buffer', 'bitmap', 'received', 'length', 'tail', 'size',
+                 'started', 'last_seen')
+
+    def __init__(self, total: int, now: float):
+        self.total = total
+        self.stride = 0  # Chunk size; every chunk but the last has it
+        self.buffer: Optional[bytearray] = None
+        self.bitmap = bytearray((total + 7) // 8)
+        self.received = 0
+        self.length = 0
+        self.tail: Optional[bytes] = None  # Last chunk, held until the stride is known
+        self.size = len(self.bitmap)  # Bytes counted against the manager's cap
+        self.started = now
+        self.last_seen = now
+
+class ReassemblyManager:
+    """Reassembles the data packets addressed to one satellite, per source node.
+
+    A transfer's buffer is allocated once, at chunk size x packet count, when
+    its first full-size chunk arrives; chunks are copied straight from the
+    datagram into place and a bitmap tracks which have arrived. A complete
+    payload is handed to consumer(source, payload) and forgotten. Transfers
+    idle for idle_timeout, or older than total_timeout, are dropped, and the
+    least recently active ones are evicted to keep buffers under max_bytes.
+    Bitmaps count against max_bytes too, and a transfer that could not fit
+    even at one byte per packet is refused before anything is allocated.
+    """
+
+    def __init__(self, consumer=print_payload, max_bytes: int = 16 * 1024 * 1024,
+                 idle_timeout: float = 30.0, total_timeout: float = 300.0):
+        self.consumer = consumer
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self.total_timeout = total_timeout
+        self.bytes = 0
+        self.flows: "OrderedDict[int, _Flow]" = OrderedDict()  # Least recently active first
+        self.dropped = 0
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, source: int, packet_number: int, total_packets: int, chunk) -> bool:
+        """Store one chunk; False if it was rejected and should not be acknowledged"""
+        if packet_number >= total_packets:
+            return False
+        now = time.time()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._expire(now)
+            flow = self.flows.get(source)
+            if flow is not None and flow.total != total_packets:
+                self._drop(source, "superseded")  # The source started another transfer
+                flow = None
+            if flow is None:
+                # The buffer will take at least this chunk's length per packet
+                bitmap = (total_packets + 7) // 8
+                if (total_packets * max(len(chunk), 1) + bitmap > self.max_bytes or
+                        not self._reserve(source, bitmap)):
+                    self.dropped += 1
+                    logging.info(f"Refused transfer of {total_packets} packets from node {source}: too large.")
+                    return False
+                flow = self.flows[source] = _Flow(total_packets, now)
+            flow.last_seen = now
+            self.flows.move_to_end(source)
+
+            bit = 1 << (packet_number & 7)
+            if flow.bitmap[packet_number >> 3] & bit:
+                return True  # Duplicate of a chunk we hold; ack it again
+            last = packet_number == total_packets - 1
+            if flow.buffer is None and (not last or total_packets == 1):
+                if not self._allocate(source, flow, len(chunk)):
+                    return False
+            if flow.buffer is None:
+                if not self._reserve(source, len(chunk)):
+                    return False
+                flow.tail = bytes(chunk)
+                flow.size += len(chunk)
+            elif len(chunk) > flow.stride or (not last and len(chunk) != flow.stride):
+                return False
+            else:
+                offset = packet_number * flow.stride
+                flow.buffer[offset:offset + len(chunk)] = chunk
+                if last:
+                    flow.length = offset + len(chunk)
+            flow.bitmap[packet_number >> 3] |= bit
+            flow.received += 1
+            if flow.received < flow.total:
+                return True
+            del self.flows[source]
+            self.bytes -= flow.size
+            payload = flow.buffer
+        del payload[flow.length:]
+        self.consumer(source, payload)
+        return True
+
+    def _allocate(self, source: int, flow: _Flow, stride: int) -> bool:
+        size = stride * flow.total
+        tail = flow.tail
+        if stride == 0 or (tail is not None and len(tail) > stride) or not self._reserve(source, size):
+            self._drop(source, "malformed or too large")
+            return False
+        flow.stride = stride
+        flow.buffer = bytearray(size)
+        held = len(tail) if tail is not None else 0
+        self.bytes -= held
+        flow.size += size - held
+        if tail is not None:
+            offset = (flow.total - 1) * stride
+            flow.buffer[offset:offset + len(tail)] = tail
+            flow.length = offset + len(tail)
+            flow.tail = None
+        return True
+
+    def _reserve(self, source: int, size: int) -> bool:
+        """Count size bytes against the cap, evicting other transfers as needed"""
+        if size > self.max_bytes:
+            return False
+        for other in list(self.flows):
+            if self.bytes + size <= self.max_bytes:
+                break
+            if other != source:
+                self._drop(other, "evicted")
+        if self.bytes + size > self.max_bytes:
+            return False
+        self.bytes += size
+        return True
+
+    def _drop(self, source: int, reason: str):
+        flow = self.flows.pop(source)
+        self.bytes -= flow.size
+        self.dropped += 1
+        logging.info(f"Dropped transfer from node {source} ({reason}): "
+                     f"{flow.received}/{flow.total} packets received.")
+
+    def expire(self):
+        """Drop idle and overdue transfers"""
+        with self._lock:
+            self._expire(time.time())
+
+    def _expire(self, now: float):
+        self._next_sweep = now + 1.0
+        for source, flow in list(self.flows.items()):
+            if now - flow.last_seen > self.idle_timeout:
+                self._drop(source, "idle")
+            elif now - flow.started > self.total_timeout:
+                self._drop(source, "timed out")
+
+def legacy_hop_address(next_hop: int) -> Tuple[str, int]:
+    return ('localhost', 8080 + next_hop)  # Assuming sequential port numbers
+
+def sequential_hop_address(host: str, base_port: int):
+    """hop_address for satellites whose ISL ID i listens on base_port + i"""
+    return lambda next_hop: (host, base_port + next_hop)
+
+def handle_packet(data: bytes, client_address, sat_node_number: int, isl_network, global_dequeue,
+                  reassembly: ReassemblyManager, isl_id: Optional[int] = None,
+                  hop_address=legacy_hop_address,
+                  subscribers: Optional[Dict[tuple, float]] = None) -> List[Tuple[bytes, Tuple[str, int]]]:
+    """Process one datagram for a satellite and return the (datagram, address) pairs to send.
+
+    isl_id is the satellite's ID in isl_network (default: sat_node_number);
+    hop_address maps a next hop's ID to its UDP address. Beacon
+    subscriptions are recorded in subscribers (address: lease expiry), and
+    data addressed to this satellite goes to reassembly.
+    """
+    replies = []
+    
+    # Decode packet header
+    flag = int.from_bytes(data[:4], 'big')
+    node_number = int.from_bytes(data[4:8], 'big')
+    
+    # Handle location inquiry
+    if flag == 0:
+        try:
+            lat, lon = global_dequeue.pop()
+        except IndexError:
+            lat, lon = -800, -800
+            
+        replies.append((position_packet(flag, sat_node_number, lat, lon), client_address))
+        return replies
+
+    # Handle beacon subscription (or renewal), answered with a first beacon
+    if flag == BEACON_FLAG:
+        if subscribers is not None:
+            subscribers[client_address] = time.time() + BEACON_LEASE
+            lat, lon = global_dequeue[-1] if global_dequeue else (-800, -800)
+            replies.append((position_packet(flag, sat_node_number, lat, lon), client_address))
+        return replies
+
+    # Handle data packet; anything shorter is the ack of a satellite we
+    # forwarded to, and answering it would bounce acks between us forever
+    if len(data) < 16:
+        return replies
+    packet_number = int.from_bytes(data[8:12], 'big')
+    total_packets = int.from_bytes(data[12:16], 'big')
+    
+    # Check if this packet needs to be forwarded through ISL
+    next_hop = isl_network.get_next_hop(sat_node_number if isl_id is None else isl_id, node_number)
+    
+    if next_hop is not None:
+        # Forward packet through ISL
+        next_hop_addr = hop_address(next_hop)
+        print(f"Forwarding packet to satellite {next_hop} at {next_hop_addr}")
+        replies.append((data, next_hop_addr))
+        
+        # Send acknowledgment to original sender
+        ack = flag.to_bytes(4, 'big') + sat_node_number.to_bytes(4, 'big') + packet_number.to_bytes(4, 'big')
+        replies.append((ack, client_address))
+    else:
+        # Process packet locally; a rejected chunk goes unacknowledged
+        if reassembly.add(node_number, packet_number, total_packets, memoryview(data)[16:]):
+            ack = flag.to_bytes(4, 'big') + sat_node_number.to_bytes(4, 'big') + packet_number.to_bytes(4, 'big')
+            replies.append((ack, client_address))
+    return replies
+
+REGISTRY_HEARTBEAT = 30.0  # Seconds between registry heartbeats (the registry evicts after 90s)
+
+def registry_address(spec: Optional[str]) -> Optional[Tuple[str, int]]:
+    """(host, port) for a "host:port" registry spec, or None if unset"""
+    if not spec:
+        return None
+    host, _, port = spec.rpartition(':')
+    return host or 'localhost', int(port)
+
+class RegistryAnnouncer:
+    """Keeps satellites registered as sat<node number> in an s2s registry.
+
+    Speaks the registry's UDP protocol directly: one register per node,
+    then fire-and-forget heartbeats in one datagram. The registry answers
+    those only to name nodes it does not know (e.g. after it restarted),
+    which are registered again. It records the address a register came
+    from, so the socket is bound to the satellites' host.
+    """
+
+    def __init__(self, registry_addr: Tuple[str, int], node_ports: Dict[str, int], host: str = '',
+                 interval: float = REGISTRY_HEARTBEAT):
+        self.registry_addr = registry_addr
+        self.node_ports = node_ports
+        self.interval = interval
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, 0))
+        self.sock.settimeout(1.0)
+        self.running = False
+
+    def start(self) -> "RegistryAnnouncer":
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+
+    def _send(self, request: dict):
+        try:
+            self.sock.sendto(json.dumps(request).encode(), self.registry_addr)
+        except OSError as e:
+            logging.warning(f"Registry {self.registry_addr} unreachable: {e}")
+
+    def _register(self, node_ids):
+        for node_id in node_ids:
+            if node_id in self.node_ports:
+                self._send({'command': 'register', 'node_id': node_id, 'node_port': self.node_ports[node_id]})
+
+    def _run(self):
+        # A lost register shows up as an unknown_nodes notice after the first heartbeat
+        self._register(self.node_ports)
+        while self.running:
+            next_beat = time.time() + self.interval
+            while self.running and time.time() < next_beat:
+                try:
+                    notice = json.loads(self.sock.recvfrom(65535)[0].decode())
+                except (socket.timeout, ValueError):
+                    continue
+                except OSError:
+                    time.sleep(1)
+                    continue
+                if notice.get('type') == 'unknown_nodes':
+                    logging.warning(f"Registry does not know {notice.get('node_ids')}, registering again")
+                    self._register(notice.get('node_ids', []))
+            self._send({'command': 'heartbeat', 'node_ids': list(self.node_ports), 'ack': False})
+        self.sock.close()
+
+def server(global_dequeue, server_addr, buffer_size, sat_node_number, isl_network,
+           registry_addr: Optional[Tuple[str, int]] = None, isl_id: Optional[int] = None,
+           hop_address=legacy_hop_address):
+    """Serve one satellite; isl_id and hop_address are passed on to handle_packet"""
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     server_socket.bind(server_addr)
     print(f"Satellite {sat_node_number} listening on {server_addr[0]}:{server_addr[1]}...")
+    if registry_addr:
+        # Earth stations find satellites as the sat* nodes of this registry
+        RegistryAnnouncer(registry_addr, {f"sat{sat_node_number}": server_addr[1]},
+                          host=socket.gethostbyname(server_addr[0])).start()
     
-    received_packets = {}
+    reassembly = ReassemblyManager()
+    subscribers = {}
+    
+    def beacon_loop():
+        while True:
+            time.sleep(1)
+            reassembly.expire()
+            if subscribers and global_dequeue:
+                send_beacons(server_socket.sendto, sat_node_number, global_dequeue[-1], subscribers)
+    
+    threading.Thread(target=beacon_loop, daemon=True).start()
     
     while True:
         data, client_address = server_socket.recvfrom(buffer_size)
         print(f"Received packet from {client_address}")
-        
-        # Decode packet header
-        flag = int.from_bytes(data[:4], 'big')
-        node_number = int.from_bytes(data[4:8], 'big')
-        
-        # Handle location inquiry
-        if flag == 0:
-            try:
-                lat, lon = global_dequeue.pop()
-            except IndexError:
-                lat, lon = -800, -800
-                
-            lat_info = int(lat).to_bytes(4, 'big', signed=True)
-            lon_info = int(lon).to_bytes(4, 'big', signed=True)
-            ll_info = flag.to_bytes(4, 'big') + sat_node_number.to_bytes(4, 'big') + lat_info + lon_info
-            server_socket.sendto(ll_info, client_address)
-            continue
-
-        # Handle data packet
-        packet_number = int.from_bytes(data[8:12], 'big')
-        total_packets = int.from_bytes(data[12:16], 'big')
-        chunk = data[16:]
-        
-        # Check if this packet needs to be forwarded through ISL
-        next_hop = isl_network.get_next_hop(sat_node_number, node_number)
-        
-        if next_hop is not None:
-            # Forward packet through ISL
-            next_hop_addr = ('localhost', 8080 + next_hop)  # Assuming sequential port numbers
-            print(f"Forwarding packet to satellite {next_hop} at {next_hop_addr}")
-            server_socket.sendto(data, next_hop_addr)
-            
-            # Send acknowledgment to original sender
-            ack = flag.to_bytes(4, 'big') + sat_node_number.to_bytes(4, 'big') + packet_number.to_bytes(4, 'big')
-            server_socket.sendto(ack, client_address)
-        else:
-            # Process packet locally
-            if node_number not in received_packets:
-                received_packets[node_number] = {}
-            received_packets[node_number][packet_number] = chunk
-            
-            # Send acknowledgment
-            ack = flag.to_bytes(4, 'big') + sat_node_number.to_bytes(4, 'big') + packet_number.to_bytes(4, 'big')
-            server_socket.sendto(ack, client_address)
-            
-            # Check if all packets received
-            if len(received_packets[node_number]) == total_packets:
-                print(f"All packets from node {node_number} received!")
-                binary_stream = b''.join(received_packets[node_number][i] for i in range(total_packets))
-                original_string = binary_stream.decode()
-                print("Reconstructed String:", original_string)
+        for reply, address in handle_packet(data, client_address, sat_node_number, isl_network,
+                                            global_dequeue, reassembly, isl_id=isl_id,
+                                            hop_address=hop_address, subscribers=subscribers):
+            server_socket.sendto(reply, address)
 
 if __name__ == "__main__":
     # Configuration
@@ -236,7 +671,11 @@ if __name__ == "__main__":
     ORBIT_Z_AXIS = (0, 0)
     VELOCITY = 27000/111.3/(60*60)  # degrees per second
     SERVER_ADDR = ('10.35.70.31', 8081)
+    # ISL IDs are satellite indices; satellite i listens on 8081 + i
+    HOP_ADDRESS = sequential_hop_address(SERVER_ADDR[0], SERVER_ADDR[1] - SAT_INDEX)
     BUFFER_SIZE = 1024
+    # s2s registry ("host:port") to announce this satellite to, if any
+    REGISTRY_ADDR = registry_address(os.getenv('SATELLITE_REGISTRY'))
     
     # Initialize ISL network
     isl_network = InterSatelliteLinks(NUM_SATS)
@@ -250,7 +689,8 @@ if __name__ == "__main__":
     
     server_thread = threading.Thread(
         target=server,
-        args=(global_dequeue, SERVER_ADDR, BUFFER_SIZE, SAT_NODE_NUM, isl_network),
+        args=(global_dequeue, SERVER_ADDR, BUFFER_SIZE, SAT_NODE_NUM, isl_network, REGISTRY_ADDR,
+              SAT_INDEX, HOP_ADDRESS),
         daemon=True
     )
     
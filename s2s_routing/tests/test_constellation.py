@@ -0,0 +1,89 @@
+import logging
+import os
+import threading
+import time
+import pytest
+from constellation import ConstellationWriter, SharedISLView
+
+@pytest.fixture
+def writer():
+    logging.disable(logging.CRITICAL)
+    writer = ConstellationWriter(8, max_isl_distance=8000, name=f"s2s_test_{os.getpid()}")
+    yield writer
+    writer.close()
+    logging.disable(logging.NOTSET)
+
+def _view(writer):
+    view = SharedISLView(writer.shm.name)
+    if os.name == 'posix':
+        # The view dropped the block from this process's resource tracker,
+        # which here is the writer's too
+        from multiprocessing import resource_tracker
+        resource_tracker.register(writer.shm._name, 'shared_memory')
+    return view
+
+def _assert_view_matches(view, writer):
+    for sat_id, sat in writer.isl_network.satellites.items():
+        assert view.routing_table(sat_id) == sat.routing_table
+        for dest_id in range(writer.num_sats):
+            assert view.get_next_hop(sat_id, dest_id) == sat.routing_table.get(dest_id)
+        assert view.get_position(sat_id) == pytest.approx(writer.positions[sat_id])
+
+def test_first_publish_has_routes(writer):
+    # What run() publishes before its first step
+    writer.publish()
+    view = _view(writer)
+    try:
+        assert view.num_sats == 8 and view.tick() == 1
+        assert any(sat.routing_table for sat in writer.isl_network.satellites.values())
+        _assert_view_matches(view, writer)
+        assert view.get_next_hop(0, 8) is None
+    finally:
+        view.close()
+
+def test_view_follows_steps(writer):
+    writer.publish()
+    view = _view(writer)
+    try:
+        writer.step(600)
+        assert view.tick() == 2
+        _assert_view_matches(view, writer)
+    finally:
+        view.close()
+
+def test_reads_wait_out_a_publish(writer):
+    writer.publish()
+    view = _view(writer)
+    try:
+        writer.header[0] += 1  # Mid-publish, as seen by readers
+        writer.shared_positions[3] = (-1.0, -2.0)
+        result = []
+        reader = threading.Thread(target=lambda: result.append(view.get_position(3)), daemon=True)
+        reader.start()
+        time.sleep(0.1)
+        assert result == []  # Still retrying
+        writer.shared_positions[3] = (12.5, 45.0)
+        writer.header[0] += 1
+        reader.join(timeout=2)
+        assert result == [(12.5, 45.0)]
+    finally:
+        view.close()
+
+def test_satellite_forwards_by_index_over_the_view(writer):
+    from collections import deque
+    from satellite_server import ReassemblyManager, handle_packet, sequential_hop_address
+    writer.publish()
+    view = _view(writer)
+    try:
+        # A source and a destination that are not linked directly
+        sat_index, dest_id, next_hop = next(
+            (sat_id, dest_id, hop) for sat_id, sat in writer.isl_network.satellites.items()
+            for dest_id, hop in sat.routing_table.items() if hop != dest_id)
+        packet = (1).to_bytes(4, 'big') + dest_id.to_bytes(4, 'big') + (0).to_bytes(4, 'big') + \
+            (1).to_bytes(4, 'big') + b'payload'
+        replies = handle_packet(packet, ('127.0.0.1', 9999), sat_index + 1, view, deque(), ReassemblyManager(),
+                                isl_id=sat_index, hop_address=sequential_hop_address('localhost', 8081))
+        assert replies[0] == (packet, ('localhost', 8081 + next_hop))
+        assert replies[1][1] == ('127.0.0.1', 9999)
+    finally:
+        view.close()
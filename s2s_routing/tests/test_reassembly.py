@@ -0,0 +1,95 @@
+import logging
+import tracemalloc
+import pytest
+from satellite_server import ReassemblyManager
+
+@pytest.fixture(autouse=True)
+def quiet():
+    logging.disable(logging.CRITICAL)
+    yield
+    logging.disable(logging.NOTSET)
+
+def _manager(**kwargs):
+    payloads = []
+    manager = ReassemblyManager(lambda source, payload: payloads.append((source, bytes(payload))), **kwargs)
+    return manager, payloads
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def test_out_of_order_with_last_chunk_first():
+    manager, payloads = _manager()
+    chunks = _chunks(b'selective repeat reassembly', 4)
+    order = [len(chunks) - 1] + list(range(len(chunks) - 1))[::-1]
+    for packet_number in order:
+        assert manager.add(7, packet_number, len(chunks), memoryview(chunks[packet_number]))
+    assert payloads == [(7, b'selective repeat reassembly')]
+    assert manager.bytes == 0 and not manager.flows
+
+def test_duplicates_are_acked_and_ignored():
+    manager, payloads = _manager()
+    assert manager.add(1, 0, 2, b'ab')
+    assert manager.add(1, 0, 2, b'ab')
+    assert manager.add(1, 1, 2, b'c')
+    assert payloads == [(1, b'abc')]
+
+def test_malformed_chunks_are_refused():
+    manager, payloads = _manager()
+    assert not manager.add(1, 3, 3, b'x')  # Packet number out of range
+    assert manager.add(1, 0, 3, b'abcd')
+    assert not manager.add(1, 1, 3, b'ab')  # Short chunk before the last
+    assert not manager.add(1, 2, 3, b'abcdef')  # Last chunk longer than the stride
+    assert not payloads
+
+def test_huge_total_is_refused_before_allocating():
+    manager, _ = _manager(max_bytes=1024 * 1024)
+    tracemalloc.start()
+    try:
+        assert not manager.add(1, 0, 0xFFFFFFFF, b'x' * 10)
+        assert not manager.add(1, 0xFFFFFFFE, 0xFFFFFFFF, b'')
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 64 * 1024
+    assert not manager.flows and manager.bytes == 0 and manager.dropped == 2
+
+def test_bitmap_counts_against_the_cap():
+    manager, _ = _manager(max_bytes=1000)
+    assert manager.add(1, 0, 800, b'x')
+    assert manager.bytes == 800 + 100
+    assert not manager.add(2, 0, 100, b'x' * 10)  # 1000 + 13 bytes would never fit
+    assert 1 in manager.flows
+
+def test_least_recently_active_transfer_is_evicted():
+    manager, payloads = _manager(max_bytes=250)
+    assert manager.add(1, 0, 10, b'x' * 10)
+    assert manager.add(2, 0, 10, b'y' * 10)
+    assert manager.add(1, 1, 10, b'x' * 10)  # Node 1 is now the more recent
+    assert manager.add(3, 0, 10, b'z' * 10)
+    assert list(manager.flows) == [1, 3]
+    assert manager.bytes == 2 * (100 + 2)
+    for packet_number in range(2, 10):
+        assert manager.add(1, packet_number, 10, b'x' * 10)
+    assert payloads == [(1, b'x' * 100)]
+
+def test_new_total_supersedes_the_old_transfer():
+    manager, payloads = _manager()
+    assert manager.add(1, 0, 3, b'ab')
+    assert manager.add(1, 0, 2, b'cd')
+    assert manager.add(1, 1, 2, b'e')
+    assert payloads == [(1, b'cde')] and manager.dropped == 1
+
+def test_idle_and_overdue_transfers_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('satellite_server.time.time', lambda: now[0])
+    manager, _ = _manager(idle_timeout=30.0, total_timeout=60.0)
+    assert manager.add(1, 0, 100, b'x')
+    assert manager.add(2, 0, 100, b'x')
+    for packet_number, at in ((1, 1020.0), (2, 1040.0), (3, 1060.0)):
+        now[0] = at
+        assert manager.add(2, packet_number, 100, b'x')
+        if at == 1040.0:
+            assert list(manager.flows) == [2]  # Node 1 went idle and was swept
+    now[0] = 1070.0
+    manager.expire()
+    assert not manager.flows and manager.bytes == 0 and manager.dropped == 2
@@ -0,0 +1,98 @@
+import json
+import socket
+import sys
+import threading
+import time
+import types
+import pytest
+
+sys.modules.setdefault('psutil', types.ModuleType('psutil'))  # Only used by the metrics reporter
+
+from earth_client import registry_satellite_addresses
+from satellite_server import RegistryAnnouncer, registry_address
+
+class FakeRegistry:
+    """Answers register, heartbeat and paged get_nodes as the s2s registry does"""
+
+    def __init__(self, drop: int = 0):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.1)
+        self.address = self.sock.getsockname()
+        self.nodes = {}
+        self.drop = drop  # Requests to ignore before answering
+        self.registers = 0
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            if self.drop:
+                self.drop -= 1
+                continue
+            request = json.loads(data.decode())
+            if request['command'] == 'register':
+                self.registers += 1
+                self.nodes[request['node_id']] = (addr[0], request['node_port'])
+                reply = {'status': 'success'}
+            elif request['command'] == 'heartbeat':
+                unknown = [node_id for node_id in request['node_ids'] if node_id not in self.nodes]
+                if not unknown:
+                    continue
+                reply = {'status': 'error', 'type': 'unknown_nodes', 'node_ids': unknown}
+            else:  # get_nodes, one node per page
+                node_ids = sorted(node_id for node_id in self.nodes if node_id > request.get('after', ''))
+                page = node_ids[:1]
+                reply = {'status': 'success', 'nodes': {node_id: self.nodes[node_id] for node_id in page},
+                         'next': page[0] if len(node_ids) > 1 else None}
+            self.sock.sendto(json.dumps(reply).encode(), addr)
+
+    def close(self):
+        self.running = False
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_registry_address():
+    assert registry_address(None) is None
+    assert registry_address('10.0.0.7:5000') == ('10.0.0.7', 5000)
+    assert registry_address(':5000') == ('localhost', 5000)
+
+def test_announced_satellites_are_discovered():
+    registry = FakeRegistry()
+    announcer = RegistryAnnouncer(registry.address, {'sat1': 8081, 'sat2': 8082}, host='127.0.0.1',
+                                  interval=0.1).start()
+    try:
+        assert _wait_for(lambda: len(registry.nodes) == 2)
+        registry.nodes['ground1'] = ('127.0.0.1', 9000)
+        assert sorted(registry_satellite_addresses(registry.address, timeout=0.5)) == \
+            [('127.0.0.1', 8081), ('127.0.0.1', 8082)]
+        # A registry that lost a satellite gets it back on the next heartbeat
+        del registry.nodes['sat2']
+        assert _wait_for(lambda: 'sat2' in registry.nodes)
+    finally:
+        announcer.stop()
+        registry.close()
+
+def test_lost_requests_are_retried():
+    registry = FakeRegistry(drop=2)
+    registry.nodes['sat1'] = ('127.0.0.1', 8081)
+    try:
+        assert registry_satellite_addresses(registry.address, timeout=0.2, retries=3) == [('127.0.0.1', 8081)]
+    finally:
+        registry.close()
+
+def test_silent_registry_raises_after_retries():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as silent:
+        silent.bind(('127.0.0.1', 0))
+        started = time.time()
+        with pytest.raises(socket.timeout):
+            registry_satellite_addresses(silent.getsockname(), timeout=0.1, retries=2)
+        assert time.time() - started < 1.0
@@ -0,0 +1,56 @@
+import logging
+import random
+import numpy as np
+import pytest
+from satellite_server import InterSatelliteLinks
+
+@pytest.fixture(autouse=True)
+def quiet():
+    logging.disable(logging.CRITICAL)
+    yield
+    logging.disable(logging.NOTSET)
+
+def _first_hop(source_id, previous, dest_id):
+    while previous[dest_id] != source_id:
+        dest_id = previous[dest_id]
+    return dest_id
+
+def _assert_matches_full_recompute(network):
+    for source_id, sat in network.satellites.items():
+        distances, previous, routing_table = network._trees[source_id]
+        expected_distances, _, _ = network._dijkstra(source_id)
+        assert distances.keys() == expected_distances.keys()
+        for dest_id, distance in expected_distances.items():
+            assert distances[dest_id] == pytest.approx(distance)
+        assert sat.routing_table is routing_table
+        assert routing_table.keys() == previous.keys()
+        for dest_id, next_hop in routing_table.items():
+            # The hop actually used must start a shortest path to dest_id
+            assert next_hop == _first_hop(source_id, previous, dest_id)
+            assert network.edge_weights[source_id][next_hop] + \
+                network._dijkstra(next_hop)[0][dest_id] == pytest.approx(distances[dest_id])
+
+@pytest.mark.parametrize('seed', range(5))
+def test_repaired_trees_match_full_recompute(seed):
+    np.random.seed(seed)
+    rng = random.Random(seed)
+    network = InterSatelliteLinks(40, max_isl_distance=3000)
+    network.update_routing_tables()
+    for _ in range(60):
+        sat_id = rng.randrange(40)
+        sat = network.satellites[sat_id]
+        lat = max(-90.0, min(90.0, sat.lat + rng.uniform(-15, 15)))
+        network.update_satellite_position(sat_id, lat, sat.lon + rng.uniform(-15, 15))
+        _assert_matches_full_recompute(network)
+
+def test_link_loss_reroutes_descendants():
+    network = InterSatelliteLinks(0, max_isl_distance=1500)
+    # A chain 0 - 1 - 2 - 3 along the equator, with 4 as a detour from 0 to 2
+    for sat_id, (lat, lon) in enumerate([(0, 0), (0, 10), (0, 20), (0, 30), (5, 10)]):
+        network.update_satellite_position(sat_id, lat, lon)
+    assert network.get_next_hop(0, 3) == 1
+    network.update_satellite_position(1, -30, 10)  # Out of range of everything
+    assert network.get_next_hop(0, 3) == 4
+    assert network.get_next_hop(0, 2) == 4
+    assert network.get_next_hop(0, 1) is None
+    _assert_matches_full_recompute(network)
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import socket
+import pytest
+from satellite_host import SatelliteHost
+
+NUM_SATS = 8
+
+@pytest.fixture(autouse=True)
+def quiet():
+    logging.disable(logging.CRITICAL)
+    yield
+    logging.disable(logging.NOTSET)
+
+def _free_base_port(count):
+    """First of count consecutive free UDP ports"""
+    for base in range(40000, 60000, count):
+        sockets = []
+        try:
+            for port in range(base, base + count):
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sockets.append(sock)
+                sock.bind(('127.0.0.1', port))
+            return base
+        except OSError:
+            continue
+        finally:
+            for sock in sockets:
+                sock.close()
+    raise RuntimeError("No free port range")
+
+class _Client(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.received = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        self.received.put_nowait((data, addr))
+
+def _header(flag, node_number, packet_number=0, total_packets=0):
+    return b''.join(value.to_bytes(4, 'big') for value in (flag, node_number, packet_number, total_packets))
+
+async def _exercise_host():
+    base = _free_base_port(NUM_SATS)
+    host = SatelliteHost(NUM_SATS, '127.0.0.1', base, max_isl_distance=8000)
+    await host.start()
+    loop = asyncio.get_running_loop()
+    transport, client = await loop.create_datagram_endpoint(_Client, local_addr=('127.0.0.1', 0))
+    try:
+        # Location inquiry: satellite index 2 answers as node 3 from base + 2
+        transport.sendto(_header(0, 0) + (0).to_bytes(4, 'big'), ('127.0.0.1', base + 2))
+        data, addr = await asyncio.wait_for(client.received.get(), 2)
+        assert addr == ('127.0.0.1', base + 2)
+        lat, lon = host.positions[2]
+        assert data == (b''.join(value.to_bytes(4, 'big') for value in (0, 3)) +
+                        int(lat).to_bytes(4, 'big', signed=True) + int(lon).to_bytes(4, 'big', signed=True))
+
+        # A data packet for a satellite two or more hops away goes to the
+        # next hop's port, by satellite index, and is acked by the first
+        sat_index, dest_id, next_hop = next(
+            (sat_id, dest_id, hop) for sat_id, routes in host.routes.items()
+            for dest_id, hop in routes.items() if hop != dest_id)
+        forwarded = asyncio.Queue()
+        relay = host.satellites[next_hop]
+        receive = relay.datagram_received
+        def record(data, addr):
+            forwarded.put_nowait((data, addr))
+            receive(data, addr)
+        relay.datagram_received = record
+
+        packet = _header(1, dest_id, 0, 1) + b'payload'
+        transport.sendto(packet, ('127.0.0.1', base + sat_index))
+        data, addr = await asyncio.wait_for(forwarded.get(), 2)
+        assert data == packet and addr == ('127.0.0.1', base + sat_index)
+        data, addr = await asyncio.wait_for(client.received.get(), 2)
+        assert data == _header(1, sat_index + 1, 0)[:12] and addr == ('127.0.0.1', base + sat_index)
+    finally:
+        transport.close()
+        for protocol in host.satellites:
+            protocol.transport.close()
+
+def test_inquiry_and_forwarding_by_satellite_index():
+    asyncio.run(_exercise_host())
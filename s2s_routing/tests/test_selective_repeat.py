@@ -0,0 +1,104 @@
+import socket
+import sys
+import threading
+import types
+import pytest
+
+sys.modules.setdefault('psutil', types.ModuleType('psutil'))  # Only used by the metrics reporter
+
+from earth_client import SelectiveRepeatSender
+
+FLAG = 1
+SAT_NODE_NUMBER = 3
+
+def _packets(count, flag=FLAG):
+    return [flag.to_bytes(4, 'big') + (10).to_bytes(4, 'big') + number.to_bytes(4, 'big') +
+            count.to_bytes(4, 'big') + b'chunk' for number in range(count)]
+
+def _ack(packet_number, flag=FLAG, sat_node_number=SAT_NODE_NUMBER):
+    return flag.to_bytes(4, 'big') + sat_node_number.to_bytes(4, 'big') + packet_number.to_bytes(4, 'big')
+
+class FakeSatellite:
+    """Acks data packets, dropping the first copy of those in drop and never acking those in silent"""
+
+    def __init__(self, drop=(), silent=()):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.05)
+        self.address = self.sock.getsockname()
+        self.drop = set(drop)
+        self.silent = set(silent)
+        self.received = []
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            packet_number = int.from_bytes(data[8:12], 'big')
+            self.received.append(packet_number)
+            if packet_number in self.drop:
+                self.drop.discard(packet_number)
+            elif packet_number not in self.silent:
+                self.sock.sendto(_ack(packet_number), addr)
+
+    def close(self):
+        self.running = False
+
+@pytest.fixture
+def client_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    yield sock
+    sock.close()
+
+def test_lost_packets_are_resent_alone(client_socket):
+    satellite = FakeSatellite(drop={2, 5})
+    try:
+        sender = SelectiveRepeatSender(client_socket, 1024, window=4, initial_rto=0.1)
+        assert sender.send(_packets(8), satellite.address, SAT_NODE_NUMBER) == (8, 0)
+        assert sorted(satellite.received) == sorted(list(range(8)) + [2, 5])
+        assert sender.srtt is not None
+    finally:
+        satellite.close()
+
+def test_stale_and_foreign_acks_are_ignored(client_socket):
+    satellite = FakeSatellite(silent={1})
+    rogue = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rogue.bind(('127.0.0.1', 0))
+    try:
+        client_address = client_socket.getsockname()
+        # Left over from an earlier transfer to the same satellite
+        satellite.sock.sendto(_ack(1), client_address)
+        sender = SelectiveRepeatSender(client_socket, 1024, window=4, max_retries=2, initial_rto=0.1)
+        flood = threading.Event()
+
+        def spoof():
+            while not flood.wait(0.01):
+                rogue.sendto(_ack(1), client_address)  # Right ack, wrong sender
+                satellite.sock.sendto(_ack(1, flag=2), client_address)  # A beacon, not an ack
+                satellite.sock.sendto(_ack(1, sat_node_number=4), client_address)
+        spoofer = threading.Thread(target=spoof, daemon=True)
+        spoofer.start()
+        try:
+            assert sender.send(_packets(4), satellite.address, SAT_NODE_NUMBER) == (3, 1)
+        finally:
+            flood.set()
+            spoofer.join()
+        assert satellite.received.count(1) == 2
+    finally:
+        rogue.close()
+        satellite.close()
+
+def test_drain_restores_the_timeout(client_socket):
+    client_socket.settimeout(2.0)
+    client_socket.sendto(b'stale', client_socket.getsockname())
+    sender = SelectiveRepeatSender(client_socket, 1024)
+    sender._drain()
+    assert client_socket.gettimeout() == 2.0
+    client_socket.settimeout(0.05)
+    with pytest.raises(socket.timeout):
+        client_socket.recvfrom(1024)